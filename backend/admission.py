@@ -0,0 +1,215 @@
+"""
+Admission Control
+Bounds how many predictions run at once for each cancer_type and decides, when
+a request arrives, whether it can be served before its deadline.
+
+Each cancer_type has its own concurrency limit and wait queue, so a burst of
+expensive brain scans only queues behind itself. With an optional total limit
+shared by all models, free slots are handed out round-robin across the
+cancer_types that have waiting requests rather than in arrival order.
+
+A request is rejected up front (Overloaded -> 503 + Retry-After) when its
+queue is full or the estimated wait, from a moving average of each model's
+service time, would overrun its deadline. Requests still queued when their
+deadline passes or their client goes away are dropped before they run.
+
+Waiting is callback based so both request threads (Flask) and the event loop
+(asgi.py) can use one controller.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """The request cannot be served in time; retry after `retry_after` seconds"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class Ticket:
+    """One request's place in a model's queue; `state` is waiting, running, expired, cancelled or done"""
+
+    def __init__(self, cancer_type, deadline, on_grant):
+        self.cancer_type = cancer_type
+        self.deadline = deadline
+        self.on_grant = on_grant
+        self.state = 'waiting'
+        self.queued_at = time.monotonic()
+        self.started_at = None
+
+    def remaining(self):
+        """Seconds until the deadline, or None without one"""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+
+class AdmissionController:
+    """
+    limits: {cancer_type: concurrent predictions}; types not listed use
+    `default_limit`. total: cap across all models (0 = sum of the limits).
+    queue_size: waiting requests per cancer_type beyond which new ones are refused.
+    """
+
+    def __init__(self, limits=None, default_limit=4, total=0, queue_size=64):
+        self.limits = dict(limits or {})
+        self.default_limit = max(1, int(default_limit))
+        self.total = max(0, int(total))
+        self.queue_size = max(0, int(queue_size))
+
+        self._lock = threading.Lock()
+        self._waiting = {}
+        self._running = {}
+        self._service_time = {}
+        self._order = list(self.limits)
+        self._next = 0
+        self._counters = {'admitted': 0, 'rejected': 0, 'expired': 0, 'cancelled': 0}
+
+    def limit(self, cancer_type):
+        return max(1, int(self.limits.get(cancer_type, self.default_limit)))
+
+    def capacity(self, cancer_types):
+        """Most predictions that can run at once across `cancer_types`"""
+        combined = sum(self.limit(cancer_type) for cancer_type in cancer_types)
+        return min(combined, self.total) if self.total else combined
+
+    def estimated_wait(self, cancer_type):
+        """Seconds a request arriving now would wait for a slot"""
+        with self._lock:
+            return self._estimated_wait(cancer_type)
+
+    def _estimated_wait(self, cancer_type):
+        waiting = len(self._waiting.get(cancer_type, ()))
+        if not waiting and self._has_slot(cancer_type):
+            return 0.0
+        # Each free slot serves one queued request per service time
+        return self._service_time.get(cancer_type, 0.0) * math.ceil((waiting + 1) / self.limit(cancer_type))
+
+    def _has_slot(self, cancer_type):
+        if self._running.get(cancer_type, 0) >= self.limit(cancer_type):
+            return False
+        return not self.total or sum(self._running.values()) < self.total
+
+    def admit(self, cancer_type, deadline=None, on_grant=None):
+        """
+        Queue a request -> Ticket. on_grant(ticket) is called, possibly from
+        another thread, once the ticket is running or has expired in the queue.
+        Raises Overloaded if it cannot be served before `deadline` (monotonic).
+        """
+        with self._lock:
+            queue = self._waiting.setdefault(cancer_type, deque())
+            if cancer_type not in self._order:
+                self._order.append(cancer_type)
+            if len(queue) >= self.queue_size and not self._has_slot(cancer_type):
+                self._counters['rejected'] += 1
+                raise Overloaded(f'Server busy: too many pending {cancer_type} predictions',
+                                 self._estimated_wait(cancer_type))
+            wait = self._estimated_wait(cancer_type)
+            if deadline is not None and time.monotonic() + wait + self._service_time.get(cancer_type, 0.0) > deadline:
+                self._counters['rejected'] += 1
+                raise Overloaded(f'Server busy: estimated {cancer_type} queue wait is {wait * 1000:.0f} ms, '
+                                 f'beyond the request deadline', wait)
+
+            ticket = Ticket(cancer_type, deadline, on_grant)
+            queue.append(ticket)
+            self._counters['admitted'] += 1
+            granted = self._dispatch()
+        self._notify(granted)
+        return ticket
+
+    def cancel(self, ticket, reason='cancelled'):
+        """Withdraw a waiting ticket ('expired' or 'cancelled') -> True if it had not started"""
+        with self._lock:
+            if ticket.state != 'waiting':
+                return False
+            self._waiting[ticket.cancer_type].remove(ticket)
+            ticket.state = reason
+            self._counters[reason] += 1
+            granted = self._dispatch()
+        self._notify(granted)
+        return True
+
+    def release(self, ticket):
+        """A running request has finished; its slot goes to the next waiting request"""
+        with self._lock:
+            if ticket.state != 'running':
+                return
+            ticket.state = 'done'
+            self._running[ticket.cancer_type] -= 1
+            elapsed = time.monotonic() - ticket.started_at
+            previous = self._service_time.get(ticket.cancer_type)
+            self._service_time[ticket.cancer_type] = elapsed if previous is None else (
+                previous + SERVICE_TIME_SMOOTHING * (elapsed - previous)
+            )
+            granted = self._dispatch()
+        self._notify(granted)
+
+    def _dispatch(self):
+        """Start waiting tickets while slots are free, one cancer_type at a time in turn"""
+        granted = []
+        now = time.monotonic()
+        progress = True
+        while progress:
+            progress = False
+            for offset in range(len(self._order)):
+                cancer_type = self._order[(self._next + offset) % len(self._order)]
+                queue = self._waiting.get(cancer_type)
+                while queue and queue[0].deadline is not None and queue[0].deadline <= now:
+                    expired = queue.popleft()
+                    expired.state = 'expired'
+                    self._counters['expired'] += 1
+                    granted.append(expired)
+                if not queue or not self._has_slot(cancer_type):
+                    continue
+                ticket = queue.popleft()
+                ticket.state, ticket.started_at = 'running', now
+                self._running[cancer_type] = self._running.get(cancer_type, 0) + 1
+                granted.append(ticket)
+                self._next = (self._next + offset + 1) % len(self._order)
+                progress = True
+                break
+        return granted
+
+    @staticmethod
+    def _notify(tickets):
+        for ticket in tickets:
+            if ticket.on_grant is not None:
+                ticket.on_grant(ticket)
+
+    @contextmanager
+    def slot(self, cancer_type, deadline=None):
+        """Block the calling thread until a slot is free; raises Overloaded if the deadline passes first"""
+        event = threading.Event()
+        ticket = self.admit(cancer_type, deadline, lambda _: event.set())
+        remaining = ticket.remaining()
+        if not event.wait(None if remaining is None else max(0.0, remaining)):
+            self.cancel(ticket, 'expired')
+        if ticket.state != 'running':
+            raise Overloaded(f'Request deadline passed while queued for the {cancer_type} model',
+                             self.estimated_wait(cancer_type))
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        with self._lock:
+            models = {
+                cancer_type: {
+                    'limit': self.limit(cancer_type),
+                    'running': self._running.get(cancer_type, 0),
+                    'waiting': len(self._waiting.get(cancer_type, ())),
+                    'service_ms': round(self._service_time[cancer_type] * 1000, 1)
+                    if cancer_type in self._service_time else None,
+                    'estimated_wait_ms': round(self._estimated_wait(cancer_type) * 1000, 1)
+                }
+                for cancer_type in self._order
+            }
+            return dict(self._counters, total_limit=self.total or None, queue_size=self.queue_size, models=models)
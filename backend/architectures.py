@@ -0,0 +1,270 @@
+"""
+Model Architectures
+CNN definitions for the brain, lung and skin classifiers.
+"""
+
+import pickle
+import types
+
+import torch.nn as nn
+
+
+class ImprovedBrainTumorCNN(nn.Module):
+    """Improved Brain Tumor CNN with better regularization"""
+    def __init__(self, num_classes=4):
+        super(ImprovedBrainTumorCNN, self).__init__()
+        
+        # Feature extraction layers
+        self.features = nn.Sequential(
+            # Conv Block 1
+            nn.Conv2d(3, 32, 3, padding=1),
+            nn.BatchNorm2d(32),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            
+            # Conv Block 2
+            nn.Conv2d(32, 64, 3, padding=1),
+            nn.BatchNorm2d(64),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            
+            # Conv Block 3
+            nn.Conv2d(64, 128, 3, padding=1),
+            nn.BatchNorm2d(128),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            
+            # Conv Block 4
+            nn.Conv2d(128, 256, 3, padding=1),
+            nn.BatchNorm2d(256),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+        )
+        
+        self.adaptive_pool = nn.AdaptiveAvgPool2d((4, 4))
+        
+        # IMPROVED classifier with more regularization
+        self.classifier = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(256 * 4 * 4, 512),
+            nn.BatchNorm1d(512),  # Added BatchNorm
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.6),  # Increased from 0.5
+            nn.Linear(512, 256),  # Added intermediate layer
+            nn.BatchNorm1d(256),  # Added BatchNorm
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.5),  # Additional dropout
+            nn.Linear(256, num_classes)
+        )
+    
+    def forward(self, x):
+        x = self.features(x)
+        x = self.adaptive_pool(x)
+        x = self.classifier(x)
+        return x
+
+
+# Keep old architecture for backward compatibility
+class BrainTumorCNN(nn.Module):
+    """Legacy Brain Tumor CNN - kept for backward compatibility"""
+    def __init__(self, num_classes=4):
+        super(BrainTumorCNN, self).__init__()
+        
+        self.features = nn.Sequential(
+            nn.Conv2d(3, 32, 3, padding=1),
+            nn.BatchNorm2d(32),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            
+            nn.Conv2d(32, 64, 3, padding=1),
+            nn.BatchNorm2d(64),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            
+            nn.Conv2d(64, 128, 3, padding=1),
+            nn.BatchNorm2d(128),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            
+            nn.Conv2d(128, 256, 3, padding=1),
+            nn.BatchNorm2d(256),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+        )
+        
+        self.adaptive_pool = nn.AdaptiveAvgPool2d((4, 4))
+        
+        self.classifier = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(256 * 4 * 4, 512),
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.5),
+            nn.Linear(512, num_classes)
+        )
+    
+    def forward(self, x):
+        x = self.features(x)
+        x = self.adaptive_pool(x)
+        x = self.classifier(x)
+        return x
+
+
+class LungCNN(nn.Module):
+    def __init__(self, num_classes=3):
+        super(LungCNN, self).__init__()
+        
+        self.conv1 = nn.Sequential(
+            nn.Conv2d(3, 64, kernel_size=3, padding=1),
+            nn.BatchNorm2d(64),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(64, 64, kernel_size=3, padding=1),
+            nn.BatchNorm2d(64),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            nn.Dropout(0.2)
+        )
+        
+        self.conv2 = nn.Sequential(
+            nn.Conv2d(64, 128, kernel_size=3, padding=1),
+            nn.BatchNorm2d(128),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(128, 128, kernel_size=3, padding=1),
+            nn.BatchNorm2d(128),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            nn.Dropout(0.3)
+        )
+        
+        self.conv3 = nn.Sequential(
+            nn.Conv2d(128, 256, kernel_size=3, padding=1),
+            nn.BatchNorm2d(256),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(256, 256, kernel_size=3, padding=1),
+            nn.BatchNorm2d(256),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(256, 256, kernel_size=3, padding=1),
+            nn.BatchNorm2d(256),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            nn.Dropout(0.4)
+        )
+        
+        self.conv4 = nn.Sequential(
+            nn.Conv2d(256, 512, kernel_size=3, padding=1),
+            nn.BatchNorm2d(512),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(512, 512, kernel_size=3, padding=1),
+            nn.BatchNorm2d(512),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(512, 512, kernel_size=3, padding=1),
+            nn.BatchNorm2d(512),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+            nn.Dropout(0.5)
+        )
+        
+        self.adaptive_pool = nn.AdaptiveAvgPool2d((4, 4))
+        
+        self.classifier = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(512 * 4 * 4, 1024),
+            nn.BatchNorm1d(1024),
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.5),
+            nn.Linear(1024, 512),
+            nn.BatchNorm1d(512),
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.4),
+            nn.Linear(512, num_classes)
+        )
+    
+    def forward(self, x):
+        x = self.conv1(x)
+        x = self.conv2(x)
+        x = self.conv3(x)
+        x = self.conv4(x)
+        x = self.adaptive_pool(x)
+        x = self.classifier(x)
+        return x
+
+
+class SkinCNN(nn.Module):
+    def __init__(self, num_classes=7):
+        super(SkinCNN, self).__init__()
+        
+        self.conv1 = nn.Sequential(
+            nn.Conv2d(3, 64, kernel_size=3, padding=1),
+            nn.BatchNorm2d(64),
+            nn.ReLU(),
+            nn.Conv2d(64, 64, kernel_size=3, padding=1),
+            nn.BatchNorm2d(64),
+            nn.ReLU(),
+            nn.MaxPool2d(2, 2),
+            nn.Dropout(0.25)
+        )
+        
+        self.conv2 = nn.Sequential(
+            nn.Conv2d(64, 128, kernel_size=3, padding=1),
+            nn.BatchNorm2d(128),
+            nn.ReLU(),
+            nn.Conv2d(128, 128, kernel_size=3, padding=1),
+            nn.BatchNorm2d(128),
+            nn.ReLU(),
+            nn.MaxPool2d(2, 2),
+            nn.Dropout(0.3)
+        )
+        
+        self.conv3 = nn.Sequential(
+            nn.Conv2d(128, 256, kernel_size=3, padding=1),
+            nn.BatchNorm2d(256),
+            nn.ReLU(),
+            nn.Conv2d(256, 256, kernel_size=3, padding=1),
+            nn.BatchNorm2d(256),
+            nn.ReLU(),
+            nn.MaxPool2d(2, 2),
+            nn.Dropout(0.4)
+        )
+        
+        self.adaptive_pool = nn.AdaptiveAvgPool2d((4, 4))
+        
+        self.classifier = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(256 * 4 * 4, 512),
+            nn.BatchNorm1d(512),
+            nn.ReLU(),
+            nn.Dropout(0.5),
+            nn.Linear(512, num_classes)
+        )
+        
+    def forward(self, x):
+        x = self.conv1(x)
+        x = self.conv2(x)
+        x = self.conv3(x)
+        x = self.adaptive_pool(x)
+        x = self.classifier(x)
+        return x
+
+
+ARCHITECTURES = {cls.__name__: cls for cls in (ImprovedBrainTumorCNN, BrainTumorCNN, LungCNN, SkinCNN)}
+
+
+class ArchitectureUnpickler(pickle.Unpickler):
+    """
+    Resolves architectures pickled from a training script (module '__main__') or
+    from the pre-split app module to the classes above.
+    """
+
+    def find_class(self, module, name):
+        if module in ('__main__', 'app') and name in ARCHITECTURES:
+            return ARCHITECTURES[name]
+        return super().find_class(module, name)
+
+
+def _load(file, **kwargs):
+    return ArchitectureUnpickler(file, **kwargs).load()
+
+
+# For torch.load(..., pickle_module=architecture_pickle) of whole pickled models
+architecture_pickle = types.ModuleType('architecture_pickle')
+architecture_pickle.Unpickler = ArchitectureUnpickler
+architecture_pickle.load = _load
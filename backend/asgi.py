@@ -0,0 +1,354 @@
+"""
+Async ASGI Server
+Serves the JSON routes of the Flask app, and /metrics, from an event loop:
+
+  GET  /api/health
+  POST /api/predict
+  GET  /api/models
+  GET  /api/models/brain/info
+  GET  /api/traces
+  GET  /api/traces/<trace_id>
+  GET  /metrics
+
+Request bodies are received asynchronously, so slow uploads hold no thread.
+A prediction asks for an admission slot (admission.py) only once its upload is
+complete, waiting on the event loop, and then runs decoding, preprocessing and
+inference on a thread pool exactly as the Flask routes do (routes.py). Requests
+that cannot be served before their deadline get 503 + Retry-After, and a
+request whose client disconnects is withdrawn if it has not started yet.
+
+Run it with any ASGI server, e.g.:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+create_asgi_app() imports the inference runtime, like create_app() does.
+"""
+
+import asyncio
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from app import MAX_FILE_SIZE, UPLOAD_SPOOL_THRESHOLD
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+FORM_FIELD_LIMIT = 64 * 1024
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+]
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+async def read_multipart(receive, boundary):
+    """
+    Parse a multipart/form-data body as it arrives -> (fields, files) where
+    files maps the field name to (filename, spooled file positioned at 0).
+    """
+    decoder = MultipartDecoder(boundary, max_form_memory_size=FORM_FIELD_LIMIT)
+    fields, files = {}, {}
+    part = container = None
+    received = 0
+    more_body = True
+    try:
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ClientDisconnected()
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            received += len(body)
+            if received > MAX_FILE_SIZE:
+                raise RequestTooLarge()
+
+            decoder.receive_data(body)
+            if not more_body:
+                decoder.receive_data(None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    part, container = event, bytearray()
+                elif isinstance(event, File):
+                    part = event
+                    container = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, mode='wb+')
+                elif isinstance(event, Data):
+                    if isinstance(part, File):
+                        container.write(event.data)
+                    else:
+                        container += event.data
+                    if not event.more_data:
+                        if isinstance(part, File):
+                            container.seek(0)
+                            previous = files.pop(part.name, None)
+                            if previous is not None:
+                                previous[1].close()
+                            files[part.name] = (part.filename, container)
+                        else:
+                            fields.setdefault(part.name, container.decode('utf-8', 'replace'))
+                        part = container = None
+                event = decoder.next_event()
+    except BaseException:
+        for _, stream in files.values():
+            stream.close()
+        if hasattr(container, 'close'):
+            container.close()
+        raise
+    return fields, files
+
+
+def header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def send_json(send, payload, status=200, extra_headers=(), content_type='application/json'):
+    """Send a response; payload is JSON-encoded unless it is already bytes"""
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode()),
+            (b'content-length', str(len(body)).encode()),
+            *CORS_HEADERS, *extra_headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def wait_for_disconnect(receive):
+    """Returns once the client has gone; the request body must already be consumed"""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def drain(receive):
+    """Consume an unused request body so the connection can be reused"""
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        more_body = message.get('more_body', False)
+
+
+class AsyncServer:
+    """The ASGI application; the prediction thread pool is started with the event loop"""
+
+    def __init__(self):
+        import routes
+        from admission import Overloaded
+        from inference import ADMISSION, METRICS, MODELS, record_request
+
+        self.routes = routes
+        self.models = MODELS
+        self.admission = ADMISSION
+        self.overloaded = Overloaded
+        self.metrics_registry = METRICS
+        self.record_request = record_request
+        self.executor = None
+        self.handlers = {
+            '/api/health': ('GET', self.health),
+            '/api/predict': ('POST', self.predict),
+            '/api/models': ('GET', self.get_models),
+            '/api/models/brain/info': ('GET', self.get_brain_model_info),
+            '/api/traces': ('GET', self.list_traces),
+            '/api/traces/<trace_id>': ('GET', self.get_trace),
+            '/metrics': ('GET', self.metrics)
+        }
+
+    def start(self):
+        if self.executor is None:
+            # One thread per admission slot, so an admitted prediction never waits for a thread
+            workers = self.admission.capacity(self.models.registered())
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix='asgi-predict')
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        # Servers without lifespan support start the thread pool on the first request
+        self.start()
+        path = scope['path'].rstrip('/') or '/'
+        if path.startswith('/api/traces/'):
+            path = '/api/traces/<trace_id>'
+        method = scope['method']
+        if path not in self.handlers:
+            await drain(receive)
+            await send_json(send, {'error': 'Not found'}, 404)
+            return
+        allowed, handler = self.handlers[path]
+        if method == 'OPTIONS':
+            await drain(receive)
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                *CORS_HEADERS,
+                (b'access-control-allow-methods', f'{allowed}, OPTIONS'.encode()),
+                (b'access-control-allow-headers', (header(scope, b'access-control-request-headers') or '*').encode())
+            ]})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        if method != allowed:
+            await drain(receive)
+            await send_json(send, {'error': 'Method not allowed'}, 405, [(b'allow', f'{allowed}, OPTIONS'.encode())])
+            return
+
+        extra_headers = []
+        content_type = 'application/json'
+        try:
+            payload, status, *content_type_override = await handler(scope, receive)
+            content_type = content_type_override[0] if content_type_override else content_type
+        except ClientDisconnected:
+            return
+        except RequestTooLarge:
+            payload, status = {'error': f'Request body exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB'}, 413
+        except self.routes.ApiError as e:
+            payload, status = {'error': e.message}, e.status
+        except self.overloaded as e:
+            payload, status, retry_after = self.routes.overloaded_payload(e)
+            extra_headers.append((b'retry-after', retry_after.encode()))
+        except Exception as e:
+            payload, status = {'error': str(e)}, 500
+        await send_json(send, payload, status, extra_headers, content_type)
+
+    async def health(self, scope, receive):
+        return await asyncio.to_thread(self.routes.health_payload), 200
+
+    async def get_models(self, scope, receive):
+        return await asyncio.to_thread(self.routes.models_payload), 200
+
+    async def get_brain_model_info(self, scope, receive):
+        # May load the brain model, so it runs off the event loop
+        return await asyncio.to_thread(self.routes.brain_info_payload), 200
+
+    async def metrics(self, scope, receive):
+        return self.metrics_registry.render().encode(), 200, METRICS_CONTENT_TYPE
+
+    async def list_traces(self, scope, receive):
+        limit = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('limit', [None])[0]
+        token = header(scope, self.routes.PROFILE_HEADER.lower().encode())
+        return await asyncio.to_thread(self.routes.traces_payload, token, limit), 200
+
+    async def get_trace(self, scope, receive):
+        trace_id = scope['path'].rstrip('/').rsplit('/', 1)[-1]
+        path = self.routes.trace_path(header(scope, self.routes.PROFILE_HEADER.lower().encode()), trace_id)
+        return await asyncio.to_thread(path.read_bytes), 200
+
+    def predict_upload(self, ticket, cancer_type, stream, tier, profile_token):
+        """Executor job; the slot is released when the work is done, even if the client has gone"""
+        try:
+            return self.routes.prediction_payload(cancer_type, stream, tier, profile_token)
+        finally:
+            stream.close()
+            self.admission.release(ticket)
+
+    async def predict(self, scope, receive):
+        started = time.monotonic()
+        content_type, options = parse_options_header(header(scope, b'content-type') or '')
+        content_length = header(scope, b'content-length')
+        if content_length and content_length.isdigit() and int(content_length) > MAX_FILE_SIZE:
+            raise RequestTooLarge()
+        if content_type != 'multipart/form-data' or 'boundary' not in options:
+            await drain(receive)
+            return {'error': 'No file provided'}, 400
+
+        fields, files = await read_multipart(receive, options['boundary'].encode('latin-1'))
+        uploaded = time.monotonic()
+        streams = [stream for _, stream in files.values()]
+        try:
+            if 'file' not in files:
+                return {'error': 'No file provided'}, 400
+            filename, stream = files['file']
+            cancer_type, tier = self.routes.validate_prediction(
+                filename, fields.get('cancer_type'), fields.get('preprocessing_tier')
+            )
+            deadline = self.routes.request_deadline(
+                header(scope, self.routes.DEADLINE_HEADER.lower().encode()) or fields.get('deadline_ms'), started
+            )
+
+            loop = asyncio.get_running_loop()
+            granted = loop.create_future()
+            ticket = self.admission.admit(
+                cancer_type, deadline,
+                lambda _: loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+            )
+            disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+            try:
+                remaining = ticket.remaining()
+                await asyncio.wait({granted, disconnected}, timeout=None if remaining is None else max(0.0, remaining),
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if ticket.state == 'waiting':
+                    self.admission.cancel(ticket, 'cancelled' if disconnected.done() else 'expired')
+                if ticket.state == 'running' and disconnected.done():
+                    self.admission.release(ticket)
+                if disconnected.done():
+                    raise ClientDisconnected()
+                if ticket.state != 'running':
+                    raise self.overloaded(f'Request deadline passed while queued for the {cancer_type} model',
+                                          self.admission.estimated_wait(cancer_type))
+
+                # The job owns the upload and the slot from here on
+                streams.remove(stream)
+                job = loop.run_in_executor(
+                    self.executor, self.predict_upload, ticket, cancer_type, stream, tier,
+                    header(scope, self.routes.PROFILE_HEADER.lower().encode())
+                )
+                await asyncio.wait({job, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not job.done():
+                    raise ClientDisconnected()
+                response, status = job.result()
+                serialize_start = time.monotonic()
+                body = json.dumps(response).encode()
+                finished = time.monotonic()
+                self.record_request(cancer_type, status, finished - started, {
+                    'upload': uploaded - started, 'serialize': finished - serialize_start
+                })
+                return body, status
+            finally:
+                disconnected.cancel()
+        finally:
+            for other in streams:
+                other.close()
+
+
+def create_asgi_app():
+    """Build the ASGI app; the first call imports the inference runtime"""
+    return AsyncServer()
+
+
+def __getattr__(name):
+    if name == 'application':
+        globals()['application'] = create_asgi_app()
+        return globals()['application']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
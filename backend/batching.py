@@ -0,0 +1,110 @@
+"""
+Dynamic Micro-Batching for Model Inference
+Collects concurrent requests for the same model into a single forward pass
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import collect_stages
+
+
+class BatchScheduler:
+    """
+    Runs one model's forward function on a background thread and batches
+    queued inputs.
+
+    `forward` maps a list of preprocessed images to (N, num_classes)
+    probabilities. Callers submit a single preprocessed image and get back a
+    Future resolving to that image's row of probabilities.
+    The worker waits at most `max_wait_ms` after the first queued request for
+    more requests to arrive, up to `max_batch_size` images per forward pass.
+    After each forward pass, `observer(queue_waits, stage_timings)` receives
+    the seconds each image waited in the queue and the metrics.stage() timings
+    recorded by `forward`.
+    """
+
+    def __init__(self, forward, max_batch_size=8, max_wait_ms=5.0, name='model', observer=None):
+        self.forward = forward
+        self.observer = observer
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f'batcher-{name}', daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        """Queue a single preprocessed image and return a Future for its probabilities"""
+        if self._closed:
+            raise RuntimeError(f'Batch scheduler for {self.name} is closed')
+        future = Future()
+        self._queue.put((image, future, time.perf_counter()))
+        return future
+
+    def predict(self, image, timeout=None):
+        """Blocking helper around submit()"""
+        return self.submit(image).result(timeout=timeout)
+
+    def depth(self):
+        """Images waiting for a forward pass"""
+        return self._queue.qsize()
+
+    def close(self):
+        """Stop the worker thread once the queued requests have been served"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires"""
+        item = self._queue.get()
+        if item is None:
+            return None
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Serve what we have, then let _run see the shutdown marker
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            self._forward(batch)
+
+    def _forward(self, batch):
+        # Skip requests whose caller already gave up
+        batch = [(image, future, queued) for image, future, queued in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        try:
+            with collect_stages() as timings:
+                probabilities = self.forward([image for image, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for i, (_, future, _) in enumerate(batch):
+            future.set_result(probabilities[i])
+        if self.observer is not None:
+            self.observer([started - queued for _, _, queued in batch], timings)
@@ -0,0 +1,216 @@
+"""
+Async Serving Benchmark
+In-process load test of POST /api/predict through the Flask app (WSGI) and the
+async server (asgi.py), on the same runtime and the same thread budget:
+
+  flask   each request occupies one of --threads worker threads from the
+          moment its upload starts arriving until its response is built
+          (a threaded WSGI server such as gunicorn --threads)
+  asgi    uploads are received on the event loop; only complete requests
+          take one of --threads admission slots and executor threads
+
+Clients upload at a limited rate (--upload-ms per request, in 64 KB chunks),
+as over a real network. Each concurrency level runs --requests predictions
+from that many concurrent clients, with no request deadline. The prediction
+cache and near-duplicate index are disabled so every request runs the model;
+models whose checkpoints cannot be loaded are replaced by randomly initialised
+ones.
+
+USAGE:
+    python bench_async_serving.py [--threads 8] [--concurrency 8 32 64] [--requests 128] [--upload-ms 1000]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Every request must reach the model
+os.environ['PREDICTION_CACHE_SIZE'] = '0'
+os.environ['NEAR_DUPLICATE_THRESHOLDS'] = 'brain=-1,lung=-1,skin=-1'
+os.environ.setdefault('PREPROCESS_WORKERS', '0')
+
+from werkzeug.test import EnvironBuilder
+
+from bench_common import synthetic_png
+from bench_preprocess_pool import load_runtime
+
+CHUNK_SIZE = 64 * 1024
+
+
+def multipart_request(image, cancer_type):
+    """-> (body, content type) of a predict form upload"""
+    builder = EnvironBuilder(method='POST', path='/api/predict', data={
+        'file': (io.BytesIO(image), 'scan.png'), 'cancer_type': cancer_type
+    })
+    try:
+        environ = builder.get_environ()
+        return environ['wsgi.input'].read(), environ['CONTENT_TYPE']
+    finally:
+        builder.close()
+
+
+class SlowInput:
+    """wsgi.input that yields at most CHUNK_SIZE bytes per read, sleeping before each"""
+
+    def __init__(self, body, delay):
+        self.body, self.delay, self.position = body, delay, 0
+
+    def read(self, size=-1):
+        size = CHUNK_SIZE if size is None or size < 0 else min(size, CHUNK_SIZE)
+        if self.position >= len(self.body):
+            return b''
+        time.sleep(self.delay)
+        chunk = self.body[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'throughput': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000 if latencies else float('nan'),
+        'p95': latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else float('nan'),
+        'errors': errors
+    }
+
+
+def run_flask(app, body, content_type, concurrency, requests, threads, delay):
+    pool = ThreadPoolExecutor(threads)
+    environ_base = dict(EnvironBuilder(method='POST', path='/api/predict').get_environ(),
+                        CONTENT_TYPE=content_type, CONTENT_LENGTH=str(len(body)))
+    counter = iter(range(requests))
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def call():
+        environ = dict(environ_base, **{'wsgi.input': SlowInput(body, delay)})
+        status = []
+        response = app.wsgi_app(environ, lambda s, headers, exc_info=None: status.append(s))
+        b''.join(response)
+        return int(status[0].split()[0])
+
+    def client():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            start = time.perf_counter()
+            status = pool.submit(call).result()
+            (latencies if status == 200 else errors).append(time.perf_counter() - start)
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return summarize(latencies, len(errors), elapsed)
+
+
+def run_asgi(server, body, content_type, concurrency, requests, delay):
+    scope = {
+        'type': 'http', 'method': 'POST', 'path': '/api/predict', 'query_string': b'',
+        'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]
+    }
+    chunks = [body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)]
+
+    async def call():
+        remaining = iter(enumerate(chunks))
+        status = []
+
+        async def receive():
+            sent = next(remaining, None)
+            if sent is None:
+                # The client stays connected until the response arrives
+                await asyncio.Event().wait()
+            index, chunk = sent
+            await asyncio.sleep(delay)
+            return {'type': 'http.request', 'body': chunk, 'more_body': index < len(chunks) - 1}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await server(scope, receive, send)
+        return status[0]
+
+    async def main():
+        server.start()
+        latencies, errors = [], []
+        counter = iter(range(requests))
+
+        async def client():
+            while next(counter, None) is not None:
+                start = time.perf_counter()
+                status = await call()
+                (latencies if status == 200 else errors).append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        server.stop()
+        return summarize(latencies, len(errors), elapsed)
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help='request threads (flask) / executor threads (asgi)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 64], help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=128, help='predictions per concurrency level')
+    parser.add_argument('--upload-ms', type=float, default=1000, help='time each client takes to upload its image')
+    parser.add_argument('--model', default='skin', choices=['brain', 'lung', 'skin'])
+    parser.add_argument('--size', type=int, default=256, help='image size (px)')
+    args = parser.parse_args()
+
+    os.environ['ADMISSION_LIMITS'] = f'{args.model}={args.threads}'
+    os.environ['ADMISSION_QUEUE_SIZE'] = str(max(args.concurrency))
+    os.environ['REQUEST_DEADLINE_MS'] = '0'
+    with contextlib.redirect_stdout(io.StringIO()):
+        inference = load_runtime()
+    from app import create_app
+    from asgi import create_asgi_app
+    app, server = create_app(), create_asgi_app()
+
+    image = synthetic_png(args.size, 0, rgb=True)
+    body, content_type = multipart_request(image, args.model)
+    delay = args.upload_ms / 1000 / -(-len(body) // CHUNK_SIZE)
+    inference.predict_image(args.model, io.BytesIO(image))
+
+    print("=" * 80)
+    print("ASYNC SERVING BENCHMARK")
+    print("=" * 80)
+    print(f"CPUs: {os.cpu_count()}   Threads: {args.threads}   Model: {args.model}   "
+          f"Upload: {len(body) // 1024} KB in {args.upload_ms:.0f} ms   Requests/level: {args.requests}")
+    print(f"\n{'Clients':<10}{'Server':<9}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    print("-" * 80)
+
+    for concurrency in args.concurrency:
+        results = {
+            'flask': run_flask(app, body, content_type, concurrency, args.requests, args.threads, delay),
+            'asgi': run_asgi(server, body, content_type, concurrency, args.requests, delay)
+        }
+        for name, result in results.items():
+            print(f"{concurrency if name == 'flask' else '':<10}{name:<9}{result['throughput']:>9.1f}"
+                  f"{result['p50']:>10.0f}{result['p95']:>10.0f}{result['errors']:>8}")
+        if results['flask']['throughput']:
+            print(f"{'':<10}{'':<9}{results['asgi']['throughput'] / results['flask']['throughput']:>8.2f}x")
+
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
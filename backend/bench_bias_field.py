@@ -0,0 +1,73 @@
+"""
+Bias Field Benchmark
+Compares the full-resolution 99x99 Gaussian bias field with the pyramid
+estimate (brain_preprocessing.estimate_bias_field_pyramid) for accuracy and
+speed across scan sizes.
+
+USAGE:
+    python bench_bias_field.py [--sizes 256 512 1024 2048 4096] [--repeats 3]
+
+Accuracy is checked on the uint8 output of correct_bias_field; the script
+exits with status 1 if any size exceeds the tolerances.
+"""
+
+import argparse
+import sys
+
+import cv2
+import numpy as np
+
+from bench_common import synthetic_scan, time_per_call
+from brain_preprocessing import BIAS_FIELD_KSIZE, correct_bias_field, estimate_bias_field_pyramid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024, 2048, 4096])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--max-mean-diff', type=float, default=1.0, help='tolerance in grey levels')
+    parser.add_argument('--max-abs-diff', type=int, default=8, help='tolerance in grey levels')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("BIAS FIELD BENCHMARK")
+    print("=" * 80)
+    print(f"\n{'Size':<11}{'blur ms':>9}{'pyramid ms':>12}{'speedup':>9}{'overall':>9}"
+          f"{'field err':>11}{'mean |d|':>10}{'max |d|':>9}")
+    print("-" * 80)
+
+    passed = True
+    for size in args.sizes:
+        image = np.ascontiguousarray(synthetic_scan(size, rng=size))
+        img_float = image.astype(np.float32) / 255.0
+
+        reference_field = cv2.GaussianBlur(img_float, (BIAS_FIELD_KSIZE, BIAS_FIELD_KSIZE), 0)
+        pyramid_field = estimate_bias_field_pyramid(img_float)
+        field_error = (np.abs(reference_field - pyramid_field) / np.maximum(reference_field, 0.01)).max()
+
+        diff = np.abs(correct_bias_field(image).astype(np.int16) - correct_bias_field(image, pyramid=True))
+        ok = diff.mean() <= args.max_mean_diff and diff.max() <= args.max_abs_diff
+        passed &= ok
+
+        blur_time = time_per_call(
+            lambda: cv2.GaussianBlur(img_float, (BIAS_FIELD_KSIZE, BIAS_FIELD_KSIZE), 0), args.repeats)
+        pyramid_time = time_per_call(lambda: estimate_bias_field_pyramid(img_float), args.repeats)
+        overall = (time_per_call(lambda: correct_bias_field(image), args.repeats)
+                   / time_per_call(lambda: correct_bias_field(image, pyramid=True), args.repeats))
+        print(f"{f'{size}x{size}':<11}{blur_time * 1000:>9.1f}{pyramid_time * 1000:>12.1f}"
+              f"{blur_time / pyramid_time:>8.1f}x{overall:>8.1f}x"
+              f"{field_error:>10.2%}{diff.mean():>10.3f}{diff.max():>8} "
+              f"{'✓' if ok else '✗'}")
+
+    print("-" * 80)
+    print("blur/pyramid ms time the bias field estimate alone; overall = whole correct_bias_field call")
+    print("field err = max relative error of the estimated bias field")
+    print(f"mean/max |d| = uint8 output difference (tolerance {args.max_mean_diff} / {args.max_abs_diff})")
+    print(f"\n{'✓ Pyramid estimate within tolerance' if passed else '✗ Pyramid estimate exceeds tolerance'}")
+    print("=" * 80)
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
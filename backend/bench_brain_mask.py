@@ -0,0 +1,141 @@
+"""
+Brain Mask Equivalence & Benchmark
+Checks that the OpenCV mask pipeline (create_brain_mask + apply_mask)
+produces exactly the same pixels as the previous skimage implementation and
+reports the per-image speedup.
+
+USAGE:
+    python bench_brain_mask.py [--images path/to/mri_folder] [--sizes 256 512 1024 2048] [--count 8]
+
+Without --images, synthetic phantoms plus edge cases (blank, constant,
+border-touching and tiny images) are used. Exits with status 1 on any
+pixel mismatch.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+from skimage import exposure
+from skimage.morphology import binary_closing, binary_opening, disk
+
+from bench_common import synthetic_scan, time_per_call
+from brain_preprocessing import apply_mask, create_brain_mask
+from decoding import allowed_file
+
+
+def legacy_create_brain_mask(image):
+    """create_brain_mask as it was before the OpenCV rewrite"""
+    image = exposure.rescale_intensity(image, out_range=(0, 255)).astype(np.uint8)
+    _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    selem_main = disk(5)
+    mask = binary_closing(binary_opening(binary > 0, selem_main), selem_main)
+    mask = (mask * 255).astype(np.uint8)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        largest_contour = max(contours, key=cv2.contourArea)
+        mask = np.zeros_like(mask)
+        cv2.drawContours(mask, [largest_contour], -1, 255, -1)
+
+    kernel_erode = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    kernel_smooth = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    mask = cv2.erode(mask, kernel_erode, iterations=1)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel_smooth)
+    return mask
+
+
+def legacy_apply_mask(image, mask):
+    """apply_mask as it was before structuring elements were cached"""
+    if image.shape != mask.shape:
+        mask = cv2.resize(mask, (image.shape[1], image.shape[0]))
+
+    kernel_edge = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    edge_mask = cv2.dilate(mask, kernel_edge, iterations=1)
+    inner_mask = cv2.erode(mask, kernel_edge, iterations=1)
+    edge_zone = cv2.subtract(edge_mask, inner_mask)
+
+    masked_image = cv2.bitwise_and(image, image, mask=mask)
+    edge_pixels = cv2.bitwise_and(image, image, mask=edge_zone)
+    edge_pixels = cv2.GaussianBlur(edge_pixels, (3, 3), 0)
+
+    return cv2.add(
+        cv2.bitwise_and(masked_image, masked_image, mask=cv2.bitwise_not(edge_zone)),
+        edge_pixels
+    )
+
+
+def load_images(args):
+    if args.images:
+        paths = sorted(p for p in Path(args.images).iterdir() if allowed_file(p.name))
+        return [(p.name, cv2.imread(str(p), cv2.IMREAD_GRAYSCALE)) for p in paths[:args.count]]
+
+    rng = np.random.default_rng(0)
+    images = [(f'phantom_{size}_{i}', synthetic_scan(size, rng, varied=True))
+              for size in args.sizes for i in range(args.count)]
+    images += [
+        ('blank', np.zeros((64, 64), np.uint8)),
+        ('constant', np.full((64, 64), 117, np.uint8)),
+        ('full_frame', np.full((96, 80), 200, np.uint8) + rng.integers(0, 2, (96, 80), dtype=np.uint8)),
+        ('tiny', rng.integers(0, 256, (7, 9), dtype=np.uint8)),
+        ('noise', rng.integers(0, 256, (300, 200), dtype=np.uint8)),
+    ]
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', help='folder of brain MRI images')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024, 2048])
+    parser.add_argument('--count', type=int, default=8, help='images per size (or from --images)')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    images = load_images(args)
+
+    print("=" * 70)
+    print("BRAIN MASK EQUIVALENCE & BENCHMARK")
+    print("=" * 70)
+
+    mismatches = []
+    for name, image in images:
+        expected_mask = legacy_create_brain_mask(image)
+        mask = create_brain_mask(image)
+        if not np.array_equal(mask, expected_mask):
+            mismatches.append((name, 'create_brain_mask', int((mask != expected_mask).sum())))
+            continue
+        masked = apply_mask(image, mask)
+        expected = legacy_apply_mask(image, expected_mask)
+        if not np.array_equal(masked, expected):
+            mismatches.append((name, 'apply_mask', int((masked != expected).sum())))
+
+    for name, stage, count in mismatches:
+        print(f"✗ {name}: {stage} differs in {count} pixels")
+    print(f"{'✓' if not mismatches else '✗'} {len(images) - len(mismatches)}/{len(images)} images pixel-identical")
+
+    def legacy(image):
+        return legacy_apply_mask(image, legacy_create_brain_mask(image))
+
+    def current(image):
+        return apply_mask(image, create_brain_mask(image))
+
+    groups = {}
+    for name, image in images:
+        if name.startswith('phantom_') or args.images:
+            groups.setdefault(f'{image.shape[1]}x{image.shape[0]}', []).append(image)
+
+    print(f"\n{'Size':<14}{'skimage ms':>12}{'OpenCV ms':>12}{'speedup':>10}")
+    print("-" * 70)
+    for size, group in groups.items():
+        legacy_time = time_per_call(lambda: [legacy(image) for image in group], args.repeats) / len(group)
+        current_time = time_per_call(lambda: [current(image) for image in group], args.repeats) / len(group)
+        print(f"{size:<14}{legacy_time * 1000:>12.2f}{current_time * 1000:>12.2f}{legacy_time / current_time:>9.1f}x")
+    print("=" * 70)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark Helpers
+Synthetic scans and timing shared by the bench_*.py and check_*.py scripts,
+so every benchmark measures the same kind of input.
+"""
+
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def synthetic_scan(size, rng=0, varied=False):
+    """
+    MRI-like phantom as a uint8 array: an elliptical 'brain' with internal
+    structure, a lesion, a smooth multiplicative bias and noise.
+
+    rng is a seed or a numpy Generator (to draw a series of different scans
+    from one). varied also moves the brain off-centre, so it can touch the
+    border, randomises background and noise level, and squeezes the scan into
+    a random, sometimes low, contrast range.
+    """
+    rng = np.random.default_rng(rng)
+    yy, xx = np.mgrid[:size, :size].astype(np.float32) / size - 0.5
+    if varied:
+        a, b = rng.uniform(0.25, 0.5, 2)
+        cx, cy = rng.uniform(-0.2, 0.2, 2)
+    else:
+        a, b = rng.uniform(0.32, 0.42, 2)
+        cx = cy = 0.0
+    brain = ((xx - cx) / a) ** 2 + ((yy - cy) / b) ** 2 <= 1
+    tissue = 110 + 40 * np.sin(xx * rng.uniform(20, 40)) * np.cos(yy * rng.uniform(20, 40))
+    lx, ly, r = rng.uniform(-0.15, 0.15) + cx, rng.uniform(-0.15, 0.15) + cy, rng.uniform(0.04, 0.1)
+    tissue[(xx - lx) ** 2 + (yy - ly) ** 2 <= r ** 2] += rng.uniform(40, 80)
+    background, noise = (rng.uniform(0, 30), rng.uniform(2, 20)) if varied else (5, 6)
+    image = np.where(brain, tissue * (1 + 0.4 * xx - 0.25 * yy ** 2), background) + rng.normal(0, noise, (size, size))
+    if varied:
+        low, high = sorted(rng.uniform(0, 255, 2))
+        image = low + (image.clip(0, 255) / 255) * max(high - low, 2)
+    return image.clip(0, 255).astype(np.uint8)
+
+
+def synthetic_png(size, rng=0, rgb=False, varied=False):
+    """synthetic_scan() encoded as PNG bytes, as an upload would arrive"""
+    image = synthetic_scan(size, rng, varied)
+    buffer = io.BytesIO()
+    Image.fromarray(np.stack([image] * 3, axis=-1) if rgb else image).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def time_per_call(fn, repeats, warmup=1):
+    """Mean seconds per fn() call over repeats calls, after warmup untimed ones"""
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
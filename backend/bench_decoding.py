@@ -0,0 +1,115 @@
+"""
+Decoding Benchmark
+Compares full-resolution decoding with reduced-size / grayscale decoding
+(decoding.open_image) on large synthetic photos.
+
+Each variant runs in a fresh subprocess so peak RSS is measured in isolation.
+
+USAGE:
+    python bench_decoding.py [--width 6000] [--height 4000] [--input-size 128]
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+VARIANTS = {
+    'rgb_full': 'Full RGB decode + resize (previous lung/skin path)',
+    'rgb_reduced': 'DCT-scaled RGB decode + resize',
+    'gray_via_rgb': 'Full RGB decode + cv2 RGB2GRAY (previous brain path)',
+    'gray_direct': 'Direct grayscale decode'
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    try:
+        # VmHWM starts fresh at exec, unlike ru_maxrss which inherits the parent's peak
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def run_variant(variant, path, input_size, repeats):
+    """Executed in the child process"""
+    import cv2
+    from decoding import open_image
+
+    def decode():
+        if variant == 'rgb_full':
+            return Image.open(path).convert('RGB').resize((input_size, input_size), Image.BILINEAR)
+        if variant == 'rgb_reduced':
+            return open_image(path, 'RGB', target_size=input_size).resize((input_size, input_size), Image.BILINEAR)
+        if variant == 'gray_via_rgb':
+            return cv2.cvtColor(np.array(Image.open(path).convert('RGB')), cv2.COLOR_RGB2GRAY)
+        return np.array(open_image(path, 'L'))
+
+    baseline_rss = peak_rss_mb()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        decode()
+    elapsed = (time.perf_counter() - start) / repeats
+    print(json.dumps({'ms': elapsed * 1000, 'peak_mb': peak_rss_mb() - baseline_rss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=6000)
+    parser.add_argument('--height', type=int, default=4000)
+    parser.add_argument('--input-size', type=int, default=128)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--variant', choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.path, args.input_size, args.repeats)
+        return
+
+    rng = np.random.default_rng(0)
+    # Smooth gradients + noise compress like a real photo rather than pure noise
+    yy, xx = np.mgrid[:args.height, :args.width].astype(np.float32)
+    base = (np.sin(xx / 97.0) + np.cos(yy / 131.0)) * 60 + 128
+    pixels = np.stack([base, base * 0.8 + 20, base * 0.6 + 40], axis=-1)
+    pixels += rng.normal(0, 8, pixels.shape)
+    image = Image.fromarray(pixels.clip(0, 255).astype(np.uint8))
+
+    print("=" * 70)
+    print("DECODING BENCHMARK")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ('JPEG', 'PNG'):
+            path = os.path.join(tmp, f'sample.{fmt.lower()}')
+            image.save(path, fmt, quality=92)  # quality is ignored for PNG
+            size_mb = os.path.getsize(path) / 1024 ** 2
+            print(f"\n{fmt} {args.width}x{args.height} ({size_mb:.1f} MB) -> {args.input_size}px")
+            print(f"{'Variant':<54}{'ms':>8}{'peak MB':>9}")
+            print("-" * 70)
+            for variant, description in VARIANTS.items():
+                output = subprocess.run(
+                    [sys.executable, __file__, '--variant', variant, '--path', path,
+                     '--input-size', str(args.input_size), '--repeats', str(args.repeats)],
+                    capture_output=True, text=True, check=True,
+                    cwd=os.path.dirname(os.path.abspath(__file__))
+                ).stdout
+                stats = json.loads(output.strip().splitlines()[-1])
+                print(f"{description:<54}{stats['ms']:>8.1f}{stats['peak_mb']:>9.1f}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
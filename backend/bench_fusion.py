@@ -0,0 +1,102 @@
+"""
+Conv-BN Fusion Benchmark
+Compares each architecture before and after the load-time optimization pass
+(BatchNorm folded into Conv/Linear, Dropout removed): CPU latency per batch
+and the largest logit difference.
+
+Models are randomly initialised, with randomised BatchNorm statistics so the
+folding is not a no-op. SkinCNN is additionally round-tripped through
+torch.save/torch.load as a whole pickled module, the way the skin checkpoint is
+stored. Exits with status 1 if any fused model falls outside the tolerance.
+
+USAGE:
+    python bench_fusion.py [--batch-sizes 1 8] [--runs 20] [--threads N]
+"""
+
+import argparse
+import io
+import statistics
+import sys
+import time
+
+import torch
+import torch.nn as nn
+
+from architectures import ARCHITECTURES, architecture_pickle
+from model_optimization import FUSION_TOLERANCE, optimize_for_inference
+
+INPUT_SIZES = {'ImprovedBrainTumorCNN': 224, 'BrainTumorCNN': 224, 'LungCNN': 224, 'SkinCNN': 128}
+
+
+def random_model(architecture):
+    torch.manual_seed(0)
+    model = ARCHITECTURES[architecture]()
+    for module in model.modules():
+        if isinstance(module, (nn.BatchNorm1d, nn.BatchNorm2d)):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2.0)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.2, 0.2)
+    return model.eval()
+
+
+def pickled_round_trip(model):
+    buffer = io.BytesIO()
+    torch.save(model, buffer)
+    buffer.seek(0)
+    return torch.load(buffer, pickle_module=architecture_pickle).eval()
+
+
+def latency(model, batch, runs):
+    with torch.inference_mode():
+        for _ in range(3):
+            model(batch)
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(batch)
+            times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--runs', type=int, default=20, help='timed forward passes per measurement')
+    parser.add_argument('--threads', type=int, default=0, help='torch threads (default: torch default)')
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    device = torch.device('cpu')
+    print("=" * 80)
+    print("CONV-BN FUSION BENCHMARK")
+    print("=" * 80)
+    print(f"Torch threads: {torch.get_num_threads()}   Runs: {args.runs}   Tolerance: {FUSION_TOLERANCE:g} x logit scale\n")
+    print(f"{'Model':<26}{'batch':>6}{'unfused ms':>12}{'fused ms':>10}{'speedup':>9}{'folded':>8}{'max |dlogit|':>15}")
+    print("-" * 80)
+
+    cases = [(name, random_model(name)) for name in ARCHITECTURES]
+    cases.append(('SkinCNN (pickled)', pickled_round_trip(random_model('SkinCNN'))))
+
+    failed = False
+    for name, model in cases:
+        size = INPUT_SIZES[type(model).__name__]
+        fused, report = optimize_for_inference(model, size, device)
+        failed |= not report['applied']
+        for batch_size in args.batch_sizes:
+            batch = torch.randn(batch_size, 3, size, size)
+            before, after = latency(model, batch, args.runs), latency(fused, batch, args.runs)
+            folded = f"{report['batch_norm']}+{report['dropout']}"
+            print(f"{name:<26}{batch_size:>6}{before:>12.1f}{after:>10.1f}{before / after:>8.2f}x{folded:>8}"
+                  f"{report['max_logit_diff']:>13.2e} {'✓' if report['applied'] else '✗'}")
+
+    print("-" * 80)
+    print("folded = BatchNorm layers folded + Dropout layers removed")
+    print("=" * 80)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
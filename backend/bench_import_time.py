@@ -0,0 +1,134 @@
+"""
+Import Time Benchmark
+Guards the application factory against import-time regressions: `import app`
+must stay cheap and must not pull in the inference stack, which only
+create_app() should import.
+
+Each measurement runs `python -X importtime -c "import <module>"` in a fresh
+interpreter, repeated --runs times, and reports the median total together with
+the slowest top-level imports from the median run. Exits with status 1 if a
+forbidden module is imported or the median exceeds --max-ms.
+
+USAGE:
+    python bench_import_time.py [--module app] [--runs 5] [--max-ms 400] [--top 15] [--factory]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Libraries that belong to the inference runtime, not to `import app`
+HEAVY_MODULES = ('torch', 'torchvision', 'cv2', 'numpy', 'skimage', 'scipy', 'PIL')
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_profile(code):
+    """Run code under -X importtime -> [(cumulative us, depth, module)] in report order"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, cwd=BACKEND_DIR,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{code!r} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative, indent, module = int(match.group(2)), match.group(3), match.group(4)
+            entries.append((cumulative, (len(indent) - 1) // 2, module))
+    return entries
+
+
+def measured_entries(entries, module):
+    """
+    Entries belonging to `import module`: everything after interpreter startup
+    (which ends with `site`) up to and including the module itself.
+    """
+    start = next((i + 1 for i, (_, depth, name) in enumerate(entries) if depth == 0 and name == 'site'), 0)
+    for index in range(start, len(entries)):
+        if entries[index][1] == 0 and entries[index][2] == module:
+            return entries[start:index + 1]
+    raise RuntimeError(f"{module} does not appear in the import profile")
+
+
+def imported_via(entries, package):
+    """The direct import of the measured module that first pulled in `package`"""
+    for index, (_, _, module) in enumerate(entries):
+        if module.split('.')[0] == package:
+            return next(name for _, depth, name in entries[index:] if depth <= 1)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='app', help='module to import')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per measurement')
+    parser.add_argument('--max-ms', type=float, default=400, help='budget for the median import time')
+    parser.add_argument('--top', type=int, default=15, help='slowest top-level imports to list')
+    parser.add_argument('--factory', action='store_true',
+                        help='also time create_app(), which imports the inference runtime (informational)')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("IMPORT TIME BENCHMARK")
+    print("=" * 70)
+    print(f"Python: {sys.version.split()[0]}   Runs: {args.runs}\n")
+
+    runs = [import_profile(f'import {args.module}') for _ in range(args.runs)]
+    runs = [measured_entries(entries, args.module) for entries in runs]
+    totals = [entries[-1][0] / 1000 for entries in runs]
+    median = statistics.median(totals)
+    entries = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    children = [(us / 1000, name) for us, depth, name in entries if depth == 1]
+
+    print(f"{'Imported by ' + args.module:<40}{'cumulative ms':>16}")
+    print("-" * 70)
+    for cumulative, module in sorted(children, reverse=True)[:args.top]:
+        print(f"{module:<40}{cumulative:>16.1f}")
+    print("-" * 70)
+    print(f"import {args.module}: median {median:.1f} ms "
+          f"(min {min(totals):.1f}, max {max(totals):.1f}), budget {args.max_ms:.0f} ms")
+
+    imported = {module.split('.')[0] for _, _, module in entries}
+    heavy = sorted(imported.intersection(HEAVY_MODULES))
+    failed = False
+    if heavy:
+        print(f"✗ import {args.module} pulls in heavy modules:")
+        for module in heavy:
+            print(f"    {module} (via {imported_via(entries, module)})")
+        failed = True
+    else:
+        print(f"✓ No heavy modules imported ({', '.join(HEAVY_MODULES)})")
+    if median > args.max_ms:
+        print(f"✗ Import time over budget by {median - args.max_ms:.1f} ms")
+        failed = True
+    else:
+        print("✓ Import time within budget")
+
+    if args.factory:
+        code = (
+            "import contextlib, io, time\n"
+            "start = time.perf_counter()\n"
+            "with contextlib.redirect_stdout(io.StringIO()):\n"
+            f"    import {args.module}\n"
+            f"    {args.module}.create_app()\n"
+            "print(f'{(time.perf_counter() - start) * 1000:.1f}')\n"
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=BACKEND_DIR, check=True)
+        print(f"\ncreate_app() including the inference runtime: {result.stdout.split()[-1]} ms")
+
+    print("=" * 70)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
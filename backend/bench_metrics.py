@@ -0,0 +1,112 @@
+"""
+Metrics Overhead Benchmark
+Measures what the /metrics instrumentation (metrics.py) adds to a prediction:
+
+  stage (collecting)     one `with stage(...)` block on a request thread
+  stage (idle)           the same block where nothing collects (tools, workers)
+  histogram observe      one labelled predict_stage_seconds observation
+  per request            collect_stages() + every stage of a brain prediction + recording
+  render                 one /metrics scrape with those series populated
+
+Exits non-zero if a stage, timed and recorded, costs more than --max-us
+microseconds.
+
+USAGE:
+    python bench_metrics.py [--iterations 200000] [--max-us 5]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from metrics import Histogram, Registry, collect_stages, stage
+
+# The stages a brain prediction records (see inference.py METRICS)
+REQUEST_STAGES = ('upload', 'cache_lookup', 'decode', 'brain_preprocess', 'brain_mask', 'resize', 'pool_wait',
+                  'queue_wait', 'collate', 'forward', 'postprocess', 'serialize')
+
+
+def per_call_us(fn, iterations, repeats=5):
+    """Median over `repeats` runs of the mean microseconds per fn() call"""
+    results = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(iterations)
+        results.append((time.perf_counter() - start) / iterations * 1e6)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--max-us', type=float, default=5.0, help='budget per instrumented stage (microseconds)')
+    args = parser.parse_args()
+
+    registry = Registry()
+    histogram = registry.register(Histogram(
+        'predict_stage_seconds', 'Time spent in each stage of a prediction', ('stage', 'cancer_type', 'model_version')
+    ))
+
+    def empty_loop(n):
+        for _ in range(n):
+            pass
+
+    def stage_collecting(n):
+        with collect_stages():
+            for _ in range(n):
+                with stage('decode'):
+                    pass
+
+    def stage_idle(n):
+        for _ in range(n):
+            with stage('decode'):
+                pass
+
+    def observe(n):
+        for _ in range(n):
+            histogram.observe(0.0123, 'decode', 'brain', 'v2_improved')
+
+    def request(n):
+        for _ in range(n):
+            with collect_stages() as timings:
+                for name in REQUEST_STAGES:
+                    with stage(name):
+                        pass
+            for name, seconds in timings.items():
+                histogram.observe(seconds, name, 'brain', 'v2_improved')
+
+    loop_us = per_call_us(empty_loop, args.iterations)
+    results = [
+        ('stage (collecting)', per_call_us(stage_collecting, args.iterations) - loop_us),
+        ('stage (idle)', per_call_us(stage_idle, args.iterations) - loop_us),
+        ('histogram observe', per_call_us(observe, args.iterations) - loop_us),
+        (f'per request ({len(REQUEST_STAGES)} stages)',
+         per_call_us(request, max(1, args.iterations // len(REQUEST_STAGES))) - loop_us),
+    ]
+    for cancer_type in ('brain', 'lung', 'skin'):
+        for name in REQUEST_STAGES:
+            histogram.observe(0.01, name, cancer_type, 'v2_improved')
+    render_us = per_call_us(lambda n: [registry.render() for _ in range(n)], 200)
+
+    print("=" * 70)
+    print("METRICS OVERHEAD")
+    print("=" * 70)
+    print(f"{'Operation':<32}{'us/call':>12}")
+    print("-" * 70)
+    for name, us in results:
+        print(f"{name:<32}{us:>12.2f}")
+    print(f"{'render /metrics (36 series)':<32}{render_us:>12.1f}")
+    print("-" * 70)
+
+    per_stage = results[0][1] + results[2][1]
+    if per_stage > args.max_us:
+        print(f"✗ {per_stage:.2f} us per stage exceeds the {args.max_us:.1f} us budget")
+        print("=" * 70)
+        sys.exit(1)
+    print(f"✓ {per_stage:.2f} us per stage (budget {args.max_us:.1f} us)")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Preprocessing Pool Benchmark
+Measures lung/skin latency while full-resolution brain scans are being
+processed, with preprocessing inline on the request threads
+(PREPROCESS_WORKERS=0) versus in the worker-process pool.
+
+Each mode runs in a fresh subprocess, because the pool is forked when the app
+is imported. Models whose checkpoints cannot be loaded are replaced by
+randomly initialised ones; only timing is measured.
+
+USAGE:
+    python bench_preprocess_pool.py [--workers 4] [--brain-threads 4] [--light 40] [--size 1024]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from architectures import ARCHITECTURES
+from bench_common import synthetic_png
+
+RANDOM_MODELS = {'brain': ('BrainTumorCNN', 4), 'lung': ('LungCNN', 3), 'skin': ('SkinCNN', 7)}
+
+
+def load_runtime():
+    with contextlib.redirect_stdout(io.StringIO()):
+        import inference
+    for cancer_type, (architecture, num_classes) in RANDOM_MODELS.items():
+        if inference.MODELS.acquire(cancer_type) is not None:
+            continue
+        model = ARCHITECTURES[architecture](num_classes=num_classes).eval()
+        model_info = {
+            'model': model, 'classes': [f'class_{i}' for i in range(num_classes)],
+            'input_size': 128 if cancer_type != 'lung' else 224,
+            'mean': [0.485, 0.456, 0.406], 'std': [0.229, 0.224, 0.225]
+        }
+        inference.MODELS.specs[cancer_type]['loader'] = lambda model_info=model_info: dict(model_info)
+        inference.MODELS.load(cancer_type)
+    return inference
+
+
+def run_mode(args):
+    """Executed in the child process"""
+    inference = load_runtime()
+    brain_scans = [synthetic_png(args.size, seed, rgb=True) for seed in range(args.brain_threads)]
+    light_scan = synthetic_png(512, 99, rgb=True)
+
+    # Warm up every model and the pool
+    for cancer_type in RANDOM_MODELS:
+        inference.predict_image(cancer_type, io.BytesIO(light_scan))
+
+    stop = threading.Event()
+    brain_latencies = []
+
+    def brain_load(data):
+        while not stop.is_set():
+            start = time.perf_counter()
+            inference.predict_image('brain', io.BytesIO(data), 'reference')
+            brain_latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=brain_load, args=(data,)) for data in brain_scans]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+
+    light_latencies = []
+    start_all = time.perf_counter()
+    for i in range(args.light):
+        start = time.perf_counter()
+        inference.predict_image(('lung', 'skin')[i % 2], io.BytesIO(light_scan))
+        light_latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - start_all
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(json.dumps({
+        'light_p50': float(np.percentile(light_latencies, 50)) * 1000,
+        'light_p95': float(np.percentile(light_latencies, 95)) * 1000,
+        'brain_mean': float(np.mean(brain_latencies)) * 1000,
+        'brain_per_s': len(brain_latencies) / elapsed
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 4) // 4),
+                        help='worker processes per cancer type')
+    parser.add_argument('--brain-threads', type=int, default=4, help='concurrent brain requests')
+    parser.add_argument('--light', type=int, default=40, help='lung/skin requests to time')
+    parser.add_argument('--size', type=int, default=1024, help='brain scan size (px)')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(args)
+        return
+
+    print("=" * 70)
+    print("PREPROCESSING POOL BENCHMARK")
+    print("=" * 70)
+    print(f"CPUs: {os.cpu_count()}   Brain load: {args.brain_threads} x {args.size}px scans (reference tier)")
+    print(f"\n{'Mode':<22}{'lung/skin p50':>15}{'p95':>9}{'brain ms':>11}{'brain/s':>10}")
+    print("-" * 70)
+    for workers in (0, args.workers):
+        env = dict(os.environ, PREPROCESS_WORKERS=str(workers))
+        output = subprocess.run(
+            [sys.executable, __file__, '--run', '--brain-threads', str(args.brain_threads),
+             '--light', str(args.light), '--size', str(args.size)],
+            capture_output=True, text=True, check=True, env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout
+        stats = json.loads(output.strip().splitlines()[-1])
+        mode = 'inline' if workers == 0 else f'pool ({workers} per type)'
+        print(f"{mode:<22}{stats['light_p50']:>12.1f} ms{stats['light_p95']:>9.1f}"
+              f"{stats['brain_mean']:>11.1f}{stats['brain_per_s']:>10.2f}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Offline Benchmark Suite
+Latency and throughput of the full prediction path for every architecture,
+without trained weights or a running server:
+
+  ImprovedBrainTumorCNN, BrainTumorCNN   brain masking pipeline (--brain-tier)
+  LungCNN, SkinCNN                       plain RGB decode + resize
+
+Models are randomly initialised and folded for inference as the server does
+(--no-fuse to skip); images are synthetic PNG scans of each --image-sizes.
+For every batch size (1, 2, 4 ... --max-batch) and torch thread count, one
+run decodes and preprocesses a batch of images, runs the forward pass and
+formats the results, reporting per-stage medians (decode, resize,
+brain_preprocess, brain_mask, collate, forward, postprocess) next to the
+end-to-end latency and images/s.
+
+Results are written as JSON (--output). With --baseline, each configuration is
+compared against a saved run and the suite exits with status 1 when its median
+end-to-end latency is more than --threshold slower (and by over --min-delta-ms).
+--save-baseline stores the current run as the baseline instead.
+
+USAGE:
+    python bench_suite.py [--models LungCNN SkinCNN] [--image-sizes 256 1024] [--max-batch 8]
+                          [--threads 1 4] [--runs 5] [--output bench_results.json]
+                          [--baseline bench_baseline.json [--threshold 0.15] | --save-baseline]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+
+from architectures import ARCHITECTURES
+from bench_common import synthetic_png
+from brain_preprocessing import BRAIN_TIERS, prepare_brain_image
+from metrics import collect_stages, stage
+from model_optimization import optimize_for_inference
+from model_registry import InferencePlan, open_rgb
+
+# Architecture -> (cancer_type, classes, input size, prepare) as registered in inference.py
+SUITE_MODELS = {
+    'ImprovedBrainTumorCNN': ('brain', 4, 224, prepare_brain_image),
+    'BrainTumorCNN': ('brain', 4, 224, prepare_brain_image),
+    'LungCNN': ('lung', 3, 224, open_rgb),
+    'SkinCNN': ('skin', 7, 128, open_rgb),
+}
+STAGE_ORDER = ('decode', 'brain_preprocess', 'brain_mask', 'resize', 'collate', 'forward', 'postprocess')
+
+
+def build_plan(architecture, fuse):
+    cancer_type, num_classes, input_size, prepare = SUITE_MODELS[architecture]
+    torch.manual_seed(0)
+    model = ARCHITECTURES[architecture](num_classes=num_classes).eval()
+    if fuse:
+        model, _ = optimize_for_inference(model, input_size, torch.device('cpu'))
+    model_info = {
+        'model': model, 'classes': [f'class_{i}' for i in range(num_classes)], 'input_size': input_size,
+        'mean': [0.485, 0.456, 0.406], 'std': [0.229, 0.224, 0.225]
+    }
+    tiers = BRAIN_TIERS if cancer_type == 'brain' else None
+    return InferencePlan(model_info, architecture, prepare, torch.device('cpu'), default_size=input_size,
+                         tiers=tiers, default_tier='reference' if tiers else None)
+
+
+def predict_batch(plan, images, tier):
+    """One end-to-end batch, as predict_image() runs it minus the HTTP layer -> {stage: seconds}"""
+    with collect_stages() as timings:
+        arrays = [plan.preprocess(io.BytesIO(data), tier) for data in images]
+        probabilities = plan.forward(arrays)
+        with stage('postprocess'):
+            plan.postprocess(probabilities)
+    return timings
+
+
+def measure(plan, images, tier, runs, warmup):
+    for _ in range(warmup):
+        predict_batch(plan, images, tier)
+    totals, stages = [], {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        timings = predict_batch(plan, images, tier)
+        totals.append(time.perf_counter() - start)
+        for name, seconds in timings.items():
+            stages.setdefault(name, []).append(seconds)
+    median = statistics.median(totals)
+    return {
+        'latency_ms': {
+            'median': round(median * 1000, 3),
+            'p95': round(float(np.percentile(totals, 95)) * 1000, 3),
+            'min': round(min(totals) * 1000, 3)
+        },
+        'throughput_ips': round(len(images) / median, 2),
+        'stages_ms': {name: round(statistics.median(values) * 1000, 3)
+                      for name, values in sorted(stages.items(), key=lambda item: stage_rank(item[0]))}
+    }
+
+
+def stage_rank(name):
+    return STAGE_ORDER.index(name) if name in STAGE_ORDER else len(STAGE_ORDER)
+
+
+def batch_sizes(max_batch):
+    sizes = [1]
+    while sizes[-1] * 2 <= max_batch:
+        sizes.append(sizes[-1] * 2)
+    return sizes if sizes[-1] == max_batch else sizes + [max_batch]
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Print each configuration against the baseline -> list of regressed keys"""
+    print(f"\n{'Configuration':<44}{'baseline ms':>12}{'current ms':>12}{'change':>9}")
+    print("-" * 90)
+    regressions = []
+    for key, current in results.items():
+        previous = baseline['results'].get(key)
+        if previous is None:
+            print(f"{key:<44}{'-':>12}{current['latency_ms']['median']:>12.1f}{'new':>9}")
+            continue
+        before, after = previous['latency_ms']['median'], current['latency_ms']['median']
+        change = after / before - 1 if before else 0.0
+        regressed = change > threshold and after - before > min_delta_ms
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<44}{before:>12.1f}{after:>12.1f}{change:>+8.1%} {'✗' if regressed else '✓'}")
+    missing = sorted(set(baseline['results']) - set(results))
+    if missing:
+        print(f"⚠️  {len(missing)} baseline configuration(s) not run: {', '.join(missing[:5])}"
+              f"{' ...' if len(missing) > 5 else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', choices=list(SUITE_MODELS), default=list(SUITE_MODELS))
+    parser.add_argument('--image-sizes', type=int, nargs='+', default=[256, 1024], help='synthetic image sizes (px)')
+    parser.add_argument('--max-batch', type=int, default=8, help='largest batch size; powers of two up to it are run')
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}),
+                        help='torch thread counts')
+    parser.add_argument('--runs', type=int, default=5, help='timed batches per configuration')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed batches per configuration')
+    parser.add_argument('--brain-tier', choices=list(BRAIN_TIERS), default='fast')
+    parser.add_argument('--no-fuse', action='store_true', help='skip BatchNorm folding (FUSE_MODELS=0)')
+    parser.add_argument('--output', default='bench_results.json', help='where to write this run')
+    parser.add_argument('--baseline', help='results file to compare against (default path for --save-baseline)')
+    parser.add_argument('--save-baseline', action='store_true', help='write this run to --baseline and skip the comparison')
+    parser.add_argument('--threshold', type=float, default=0.15, help='allowed slowdown of the median, as a fraction')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore slowdowns smaller than this')
+    args = parser.parse_args()
+    if args.save_baseline and not args.baseline:
+        parser.error('--save-baseline needs --baseline PATH')
+
+    baseline = None
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    sizes = batch_sizes(max(1, args.max_batch))
+    images = {size: [synthetic_png(size, seed, rgb=True) for seed in range(sizes[-1])] for size in args.image_sizes}
+    print("=" * 90)
+    print("OFFLINE BENCHMARK SUITE")
+    print("=" * 90)
+    print(f"CPUs: {os.cpu_count()}   Torch: {torch.__version__}   Runs: {args.runs}   "
+          f"Fused: {not args.no_fuse}   Brain tier: {args.brain_tier}\n")
+    print(f"{'Configuration':<44}{'median ms':>11}{'p95 ms':>10}{'img/s':>9}  slowest stages")
+    print("-" * 90)
+
+    results = {}
+    default_threads = torch.get_num_threads()
+    try:
+        for architecture in args.models:
+            plan = build_plan(architecture, fuse=not args.no_fuse)
+            tier = args.brain_tier if plan.tiers else None
+            for threads in args.threads:
+                torch.set_num_threads(threads)
+                for image_size in args.image_sizes:
+                    for batch_size in sizes:
+                        key = f'{architecture}/{image_size}px/batch{batch_size}/threads{threads}'
+                        entry = measure(plan, images[image_size][:batch_size], tier, args.runs, args.warmup)
+                        results[key] = dict(architecture=architecture, image_size=image_size,
+                                            batch_size=batch_size, threads=threads, **entry)
+                        slowest = sorted(entry['stages_ms'].items(), key=lambda item: -item[1])[:3]
+                        print(f"{key:<44}{entry['latency_ms']['median']:>11.1f}{entry['latency_ms']['p95']:>10.1f}"
+                              f"{entry['throughput_ips']:>9.1f}  "
+                              + ', '.join(f'{name} {ms:.1f}' for name, ms in slowest))
+    finally:
+        torch.set_num_threads(default_threads)
+
+    run = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'settings': {
+            'runs': args.runs, 'warmup': args.warmup, 'brain_tier': args.brain_tier, 'fused': not args.no_fuse
+        },
+        'results': results
+    }
+    output = args.baseline if args.save_baseline else args.output
+    with open(output, 'w') as f:
+        json.dump(run, f, indent=2)
+    print("-" * 90)
+    print(f"✓ Results written to {output}{' (baseline)' if args.save_baseline else ''}")
+
+    if baseline is None:
+        print("=" * 90)
+        return
+    if baseline.get('environment') != run['environment'] or baseline.get('settings') != run['settings']:
+        print("⚠️  Baseline was recorded with a different environment or settings; "
+              "timings may not be comparable")
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    print("-" * 90)
+    if regressions:
+        print(f"✗ {len(regressions)} configuration(s) more than {args.threshold:.0%} slower than the baseline")
+        print("=" * 90)
+        sys.exit(1)
+    print(f"✓ No configuration more than {args.threshold:.0%} slower than the baseline")
+    print("=" * 90)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Brain MRI Preprocessing
+Bias correction, contrast enhancement, denoising and skull masking applied
+before the brain tumor CNN.
+"""
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from decoding import open_image
+from metrics import stage
+
+# Quality tiers trade denoising fidelity for speed. 'reference' is the
+# pipeline the models were trained with; the others are validated against it
+# with check_brain_tiers.py.
+BRAIN_TIERS = {
+    'reference': 'Non-local means denoising at full resolution',
+    'fast': 'Pyramid bias field, non-local means denoising at the model input size',
+    'fastest': 'Pyramid bias field, bilateral filtering at the model input size',
+    'roi': 'Reference pipeline on a crop around the brain found on a low-resolution mask'
+}
+
+# 'roi' tier: the coarse mask is found at this size, and the square crop keeps
+# this fraction of the brain's extent as margin on each side
+ROI_COARSE_SIZE = 128
+ROI_MARGIN = 0.08
+
+# Structuring elements are built once; MASK_DISK matches skimage.morphology.disk(5)
+_yy, _xx = np.mgrid[-5:6, -5:6]
+MASK_DISK = (_xx ** 2 + _yy ** 2 <= 25).astype(np.uint8)
+MASK_ERODE_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+MASK_SMOOTH_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+EDGE_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+BIAS_FIELD_KSIZE = 99
+# Sigma OpenCV derives for a 99x99 kernel when sigma=0 (about 15.2 px)
+BIAS_FIELD_SIGMA = 0.3 * ((BIAS_FIELD_KSIZE - 1) * 0.5 - 1) + 0.8
+
+
+def adjust_gamma(image, gamma=1.0):
+    """Adjust gamma of the image."""
+    inv_gamma = 1.0 / gamma
+    table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype(np.uint8)
+    return cv2.LUT(image, table)
+
+def estimate_bias_field_pyramid(img_float, min_sigma=2.0, min_side=128):
+    """
+    Multi-scale estimate of the 99x99 Gaussian bias field.
+
+    The field is very low-frequency, so the blur runs on a level downsampled
+    by 2, 4, ... with a proportionally smaller kernel and is upsampled back.
+    Downsampling stops while the level's sigma stays >= min_sigma px and its
+    short side >= min_side px; below that borders start to dominate.
+    Validated against the full-resolution blur with bench_bias_field.py.
+    """
+    height, width = img_float.shape
+    factor = 1
+    while BIAS_FIELD_SIGMA / (factor * 2) >= min_sigma and min(height, width) >= factor * 2 * min_side:
+        factor *= 2
+    if factor == 1:
+        return cv2.GaussianBlur(img_float, (BIAS_FIELD_KSIZE, BIAS_FIELD_KSIZE), 0)
+    
+    small = cv2.resize(img_float, (round(width / factor), round(height / factor)), interpolation=cv2.INTER_AREA)
+    # INTER_AREA and the bilinear upsample each add about 1/12 px^2 of blur
+    sigma = np.sqrt((BIAS_FIELD_SIGMA / factor) ** 2 - 1 / 6)
+    ksize = int(np.ceil(BIAS_FIELD_KSIZE / factor)) | 1
+    small = cv2.GaussianBlur(small, (ksize, ksize), sigma)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+
+def correct_bias_field(image, pyramid=False):
+    """Approximate bias field correction using local contrast enhancement."""
+    img_float = image.astype(np.float32) / 255.0
+    if pyramid:
+        bias_field = estimate_bias_field_pyramid(img_float)
+    else:
+        bias_field = cv2.GaussianBlur(img_float, (BIAS_FIELD_KSIZE, BIAS_FIELD_KSIZE), 0)
+    bias_field = np.maximum(bias_field, 0.01)
+    corrected = img_float / bias_field
+    from skimage import exposure  # only brain scans need scikit-image; keep it off the import path
+    corrected = exposure.rescale_intensity(corrected, out_range=(0, 1))
+    corrected = (corrected * 255).astype(np.uint8)
+    return corrected
+
+def _span(center, length, limit):
+    """[start, end) of a window of `length` around `center`, shifted to fit in [0, limit)"""
+    length = min(int(round(length)), limit)
+    start = min(max(int(round(center - length / 2)), 0), limit - length)
+    return start, start + length
+
+def brain_bounding_box(image, coarse_size=ROI_COARSE_SIZE, margin=ROI_MARGIN):
+    """
+    Square (x0, y0, x1, y1) box around the brain, or None if nothing is found.
+
+    The mask is only a coarse Otsu threshold on a copy downsampled to
+    coarse_size, so it is cheap even for very large scans.
+    """
+    height, width = image.shape
+    scale = min(1.0, coarse_size / max(height, width))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(stretch_intensity(image), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, EDGE_KERNEL)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    side = max(w, h) * (1 + 2 * margin) / scale
+    x0, x1 = _span((x + w / 2) / scale, side, width)
+    y0, y1 = _span((y + h / 2) / scale, side, height)
+    return x0, y0, x1, y1
+
+def crop_to_brain(image):
+    """Crop a grayscale scan to brain_bounding_box, or return it unchanged"""
+    box = brain_bounding_box(image)
+    if box is None:
+        return image
+    x0, y0, x1, y1 = box
+    if (x1 - x0) * (y1 - y0) >= 0.9 * image.size:
+        return image
+    return image[y0:y1, x0:x1]
+
+def preprocess_brain_image(image, tier='reference', target_size=None):
+    """Preprocess the image with improved bias correction and contrast enhancement."""
+    if tier == 'roi':
+        # Everything below, including NL-means, only sees the brain and its margin
+        image = crop_to_brain(image)
+    image_float = image.astype(float)
+    image_norm = (image_float - image_float.min()) / (image_float.max() - image_float.min())
+    image_norm = (image_norm * 255).astype(np.uint8)
+    # 'reference' keeps the exact full-resolution blur the models were trained with
+    full_resolution = tier in ('reference', 'roi')
+    image_bias_corrected = correct_bias_field(image_norm, pyramid=not full_resolution)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    image_clahe = clahe.apply(image_bias_corrected)
+    image_gamma = adjust_gamma(image_clahe, gamma=1.2)
+    
+    if full_resolution:
+        return cv2.fastNlMeansDenoising(image_gamma)
+    
+    # Faster tiers denoise (and mask) at the size the model will see anyway
+    if target_size and min(image_gamma.shape) > target_size:
+        image_gamma = cv2.resize(image_gamma, (target_size, target_size), interpolation=cv2.INTER_AREA)
+    if tier == 'fast':
+        return cv2.fastNlMeansDenoising(image_gamma)
+    return cv2.bilateralFilter(image_gamma, 5, 50, 50)
+
+def stretch_intensity(image):
+    """Stretch a uint8 image to the full 0-255 range (same values as skimage rescale_intensity + uint8 cast)."""
+    low, high = int(image.min()), int(image.max())
+    if low == high:
+        return image
+    levels = np.clip(np.arange(256, dtype=np.float64), low, high)
+    table = ((levels - low) / (high - low) * 255).astype(np.uint8)
+    return cv2.LUT(image, table)
+
+def create_brain_mask(image):
+    """Create a binary mask for brain region."""
+    image = stretch_intensity(image)
+    _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # OpenCV's default borders match skimage's binary opening/closing
+    mask = cv2.morphologyEx(binary, cv2.MORPH_OPEN, MASK_DISK)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, MASK_DISK)
+    
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        largest_contour = max(contours, key=cv2.contourArea)
+        mask = np.zeros_like(mask)
+        cv2.drawContours(mask, [largest_contour], -1, 255, -1)
+    
+    mask = cv2.erode(mask, MASK_ERODE_KERNEL, iterations=1)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, MASK_SMOOTH_KERNEL)
+    return mask
+
+def apply_mask(image, mask):
+    """Apply the mask to the original image."""
+    if image.shape != mask.shape:
+        mask = cv2.resize(mask, (image.shape[1], image.shape[0]))
+    
+    edge_mask = cv2.dilate(mask, EDGE_KERNEL, iterations=1)
+    inner_mask = cv2.erode(mask, EDGE_KERNEL, iterations=1)
+    edge_zone = cv2.subtract(edge_mask, inner_mask)
+    
+    masked_image = cv2.bitwise_and(image, image, mask=mask)
+    edge_pixels = cv2.bitwise_and(image, image, mask=edge_zone)
+    edge_pixels = cv2.GaussianBlur(edge_pixels, (3,3), 0)
+    
+    final_image = cv2.add(
+        cv2.bitwise_and(masked_image, masked_image, mask=cv2.bitwise_not(edge_zone)),
+        edge_pixels
+    )
+    return final_image
+
+
+def prepare_brain_image(image_file, plan, tier='reference'):
+    """Read a brain MRI and run the full masking pipeline, returning an RGB PIL image"""
+    # Decode straight to grayscale at full resolution; the preprocessing
+    # parameters below are tuned for the original scan size
+    with stage('decode'):
+        img_gray = np.array(open_image(
+            image_file, 'L',
+            max_pixels=plan.max_pixels,
+            downsample=plan.downsample
+        ))
+    
+    # Apply brain mask preprocessing
+    with stage('brain_preprocess'):
+        preprocessed = preprocess_brain_image(img_gray, tier, plan.input_size)
+    with stage('brain_mask'):
+        mask = create_brain_mask(preprocessed)
+        masked = apply_mask(preprocessed, mask)
+        img_processed = cv2.cvtColor(masked, cv2.COLOR_GRAY2RGB)
+    
+    # Convert to PIL
+    return Image.fromarray(img_processed)
@@ -0,0 +1,117 @@
+"""
+INT8 Calibration
+Builds the INT8 version of a model from a folder of sample images: the images
+go through the model's normal preprocessing, the first --calibration of them
+set the static activation ranges, and the rest measure top-1 agreement with the
+FP32 model. The result is written to the checkpoint directory (see
+quantization.py) only if the agreement meets --min-agreement.
+
+Serve it with QUANTIZED_MODELS=<model>; the server checks the agreement again
+against QUANTIZATION_MIN_AGREEMENT.
+
+USAGE:
+    python calibrate_quantization.py --model lung --images path/to/samples [--calibration 64]
+                                     [--min-agreement 0.99] [--out checkpoints]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+# Calibration only needs the loaders; no preprocessing workers or eager loads
+os.environ.setdefault('PREPROCESS_WORKERS', '0')
+os.environ.setdefault('LAZY_MODEL_LOADING', '1')
+
+import torch
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import inference
+from model_registry import InferencePlan
+from quantization import quantize_model, save_quantized, top1_agreement
+
+
+def load_batches(plan, paths, batch_size):
+    images = [plan.preprocess(io.BytesIO(path.read_bytes())) for path in paths]
+    return [plan.collate(images[i:i + batch_size]) for i in range(0, len(images), batch_size)]
+
+
+def batch_ms(model, batch, runs=5):
+    with torch.inference_mode():
+        model(batch)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(batch)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, choices=inference.MODELS.registered())
+    parser.add_argument('--images', required=True, help='folder of representative sample images')
+    parser.add_argument('--calibration', type=int, default=64, help='images used to calibrate; the rest evaluate')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--min-agreement', type=float, default=inference.QUANTIZATION_MIN_AGREEMENT,
+                        help='minimum top-1 agreement with FP32 required to write the INT8 model')
+    parser.add_argument('--out', default=str(inference.CHECKPOINT_DIR), help='output directory (CHECKPOINT_DIR)')
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir() if inference.allowed_file(p.name))
+    if len(paths) < 2:
+        sys.exit(f"✗ Need at least 2 images in {args.images}, found {len(paths)}")
+    random.Random(0).shuffle(paths)
+    calibration, evaluation = paths[:args.calibration], paths[args.calibration:]
+
+    print("=" * 70)
+    print("INT8 CALIBRATION")
+    print("=" * 70)
+    spec = inference.MODELS.specs[args.model]
+    with contextlib.redirect_stdout(io.StringIO()):
+        model_info = spec['loader']()
+    plan = InferencePlan(
+        model_info, spec['label'], spec['prepare'], torch.device('cpu'), spec['default_size'],
+        max_pixels=inference.MAX_IMAGE_PIXELS, tiers=spec['tiers'], default_tier=spec['default_tier']
+    )
+    model = model_info['model'].cpu().eval()
+    print(f"Model: {args.model} ({type(model).__name__}, input {plan.input_size}px)")
+    if not evaluation:
+        print("⚠️  Every image is used for calibration; agreement is measured on the calibration set")
+        evaluation = calibration
+    print(f"Images: {len(calibration)} calibration, {len(evaluation)} evaluation")
+
+    calibration_batches = load_batches(plan, calibration, args.batch_size)
+    evaluation_batches = load_batches(plan, evaluation, args.batch_size)
+    quantized = quantize_model(model, calibration_batches)
+    agreement = top1_agreement(model, quantized, evaluation_batches)
+    fp32_ms, int8_ms = batch_ms(model, evaluation_batches[0]), batch_ms(quantized, evaluation_batches[0])
+
+    print("-" * 70)
+    print(f"Engine:           {torch.backends.quantized.engine}")
+    print(f"Top-1 agreement:  {agreement:.2%} (required {args.min_agreement:.2%})")
+    print(f"Latency/batch:    FP32 {fp32_ms:.1f} ms -> INT8 {int8_ms:.1f} ms ({fp32_ms / int8_ms:.2f}x)")
+    print("-" * 70)
+    if agreement < args.min_agreement:
+        print("✗ Agreement below the gate; INT8 model not written")
+        print("=" * 70)
+        sys.exit(1)
+
+    path = save_quantized(args.out, args.model, quantized, {
+        'source_fingerprint': model_info.get('fingerprint'),
+        'engine': torch.backends.quantized.engine,
+        'agreement': agreement,
+        'calibration_images': len(calibration),
+        'evaluation_images': len(evaluation),
+        'fp32_batch_ms': round(fp32_ms, 2),
+        'int8_batch_ms': round(int8_ms, 2)
+    })
+    print(f"✓ Wrote {path}")
+    print(f"Serve it with QUANTIZED_MODELS={args.model}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
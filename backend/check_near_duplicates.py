@@ -0,0 +1,132 @@
+"""
+Near-Duplicate Safety Check
+Verifies that the near-duplicate index (perceptual_index.py) does not hand one
+scan's stored prediction to a different, merely similar scan.
+
+For each synthetic phantom it hashes:
+
+  duplicates    the same scan re-encoded as JPEG, rescaled, brightened
+                (what the index is meant to match)
+  near misses   the adjacent slice, a follow-up with a grown lesion
+                (different scans that must never be matched)
+
+and reports Hamming distances and which pairs the index would match with the
+thresholds the server is configured with (NEAR_DUPLICATE_THRESHOLDS, off for
+every cancer_type by default), or with --thresholds to evaluate an opt-in
+setting. Exits with status 1 if any near miss would be matched.
+
+USAGE:
+    python check_near_duplicates.py [--count 20] [--size 512] [--thresholds brain=8,skin=12]
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+
+os.environ.setdefault('PREPROCESS_WORKERS', '0')
+os.environ.setdefault('LAZY_MODEL_LOADING', '1')
+
+import numpy as np
+from PIL import Image
+
+import inference
+from perceptual_index import NearDuplicateIndex, dhash_stream, hamming
+
+
+def phantom(size, seed, slice_offset=0.0, lesion_growth=0.0):
+    """
+    MRI-like phantom; slice_offset moves to a neighbouring slice (head outline
+    and structures shift slightly), lesion_growth enlarges the lesion
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:size, :size].astype(np.float32) / size - 0.5
+    a, b = rng.uniform(0.32, 0.42, 2) * (1 - slice_offset)
+    fx, fy = rng.uniform(20, 40, 2)
+    head = (xx / a) ** 2 + (yy / b) ** 2 <= 1
+    tissue = 110 + 40 * np.sin(xx * fx + slice_offset * 20) * np.cos(yy * fy - slice_offset * 15)
+    cx, cy, r = rng.uniform(-0.15, 0.15), rng.uniform(-0.15, 0.15), rng.uniform(0.04, 0.1) * (1 + lesion_growth)
+    tissue[(xx - cx) ** 2 + (yy - cy) ** 2 <= r ** 2] += 60
+    image = np.where(head, tissue * (1 + 0.4 * xx), 5) + np.random.default_rng(seed + 1).normal(0, 6, (size, size))
+    return Image.fromarray(image.clip(0, 255).astype(np.uint8)).convert('RGB')
+
+
+def encode(image, format='PNG', **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format, **options)
+    buffer.seek(0)
+    return buffer
+
+
+VARIANTS = {
+    'duplicate': {
+        'jpeg q85': lambda image: encode(image, 'JPEG', quality=85),
+        'rescaled 80%': lambda image: encode(image.resize((image.width * 4 // 5, image.height * 4 // 5))),
+        'brightened': lambda image: encode(Image.fromarray(np.clip(np.asarray(image, np.int16) + 12, 0, 255)
+                                                           .astype(np.uint8)))
+    },
+    'near miss': {
+        'adjacent slice': lambda size, seed: encode(phantom(size, seed, slice_offset=0.03)),
+        'follow-up': lambda size, seed: encode(phantom(size, seed, lesion_growth=0.3))
+    }
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=20, help='phantoms')
+    parser.add_argument('--size', type=int, default=512, help='phantom size (px)')
+    parser.add_argument('--thresholds', help="evaluate these instead of the server's, e.g. 'brain=8,skin=12'")
+    args = parser.parse_args()
+
+    thresholds = (inference.parse_thresholds(args.thresholds, {}) if args.thresholds
+                  else inference.NEAR_DUPLICATE_INDEX.thresholds)
+    index = NearDuplicateIndex(thresholds)
+    cancer_types = inference.MODELS.registered()
+
+    distances = {}
+    for seed in range(args.count):
+        original = phantom(args.size, seed)
+        original_hash = dhash_stream(encode(original))
+        for name, variant in VARIANTS['duplicate'].items():
+            distances.setdefault(('duplicate', name), []).append(hamming(original_hash, dhash_stream(variant(original))))
+        for name, variant in VARIANTS['near miss'].items():
+            distances.setdefault(('near miss', name), []).append(
+                hamming(original_hash, dhash_stream(variant(args.size, seed)))
+            )
+
+    print("=" * 80)
+    print("NEAR-DUPLICATE SAFETY CHECK")
+    print("=" * 80)
+    enabled = {name: thresholds[name] for name in cancer_types if index.enabled(name)}
+    print(f"Phantoms: {args.count}   Thresholds: "
+          f"{', '.join(f'{k}={v}' for k, v in enabled.items()) or 'off for every cancer_type'}"
+          f"{'' if args.thresholds else ' (server configuration)'}\n")
+    print(f"{'Pair':<28}{'min':>6}{'median':>8}" + ''.join(f'{name + " match":>14}' for name in cancer_types))
+    print("-" * 80)
+
+    unsafe = []
+    for (kind, name), values in distances.items():
+        matched = []
+        for cancer_type in cancer_types:
+            share = (sum(d <= thresholds[cancer_type] for d in values) / len(values)
+                     if index.enabled(cancer_type) else None)
+            matched.append('off' if share is None else f'{share:.0%}')
+            if kind == 'near miss' and share:
+                unsafe.append(f'{name} ({cancer_type})')
+        print(f"{kind + ': ' + name:<28}{min(values):>6}{statistics.median(values):>8.0f}"
+              + ''.join(f'{m:>14}' for m in matched))
+    print("-" * 80)
+    print("Distances are Hamming distances between 256-bit dHashes.")
+
+    if unsafe:
+        print(f"✗ Different scans would get another scan's prediction: {', '.join(unsafe)}")
+        print("=" * 80)
+        sys.exit(1)
+    print("✓ No near miss is matched")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Converted Checkpoints
+Weights-only model files that load without unpickling and without copying.
+
+A converted model is two files in CHECKPOINT_DIR:
+  <cancer_type>.json          manifest: architecture, classes, input_size,
+                              mean/std, version, accuracy, weights file
+  <cancer_type>.safetensors   raw tensor data behind a JSON header, in the
+                              safetensors layout (readable by that package too)
+
+Weights are memory-mapped copy-on-write and assigned to the model directly, so
+loading costs page-table setup rather than a copy, and every worker process
+shares one copy of the weights through the page cache. Models are stored with
+BatchNorm already folded (manifest 'optimization'): folding at load time would
+write new weights and copy every fused layer out of the shared mapping.
+"""
+
+import hashlib
+import json
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from model_optimization import fold_batch_norm
+
+MANIFEST_FORMAT = 1
+
+DTYPES = {
+    'F64': torch.float64, 'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16,
+    'I64': torch.int64, 'I32': torch.int32, 'I16': torch.int16, 'I8': torch.int8, 'U8': torch.uint8,
+    'BOOL': torch.bool
+}
+DTYPE_NAMES = {dtype: name for name, dtype in DTYPES.items()}
+
+
+def checkpoint_fingerprint(*paths):
+    """Identify the exact checkpoint files a model was loaded from"""
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()[:12]
+
+
+def save_weights(path, state_dict, metadata=None):
+    """Write a state dict as a header + contiguous tensor data file"""
+    # Largest items first keeps every tensor aligned to its element size
+    items = sorted(state_dict.items(), key=lambda item: (-item[1].element_size(), item[0]))
+    header, offset = {}, 0
+    for name, tensor in items:
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            'dtype': DTYPE_NAMES[tensor.dtype],
+            'shape': list(tensor.shape),
+            'data_offsets': [offset, offset + nbytes]
+        }
+        offset += nbytes
+    if metadata:
+        header['__metadata__'] = {key: str(value) for key, value in metadata.items()}
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    header_bytes += b' ' * (-len(header_bytes) % 8)  # tensor data starts 8-byte aligned
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for _, tensor in items:
+            data = tensor.detach().cpu().contiguous()
+            if data.dtype == torch.bfloat16:
+                data = data.view(torch.int16)  # no numpy bfloat16; the bytes are what matter
+            f.write(data.numpy().tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_weights(path):
+    """Memory-map a weights file -> {name: CPU tensor viewing the file}"""
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop('__metadata__', None)
+
+    # Copy-on-write: pages stay shared with the page cache unless a tensor is modified
+    data = np.memmap(path, dtype=np.uint8, mode='c', offset=8 + header_size)
+    state_dict = {}
+    for name, entry in header.items():
+        start, end = entry['data_offsets']
+        dtype = DTYPES[entry['dtype']]
+        raw = torch.from_numpy(data[start:end])
+        state_dict[name] = raw.view(dtype).reshape(entry['shape'])
+    return state_dict
+
+
+def manifest_path(checkpoint_dir, cancer_type):
+    return Path(checkpoint_dir) / f'{cancer_type}.json'
+
+
+def write_manifest(checkpoint_dir, cancer_type, model_info):
+    """
+    Convert a loaded model info dict into <cancer_type>.json + .safetensors;
+    a model folded by optimize_for_inference() is stored folded
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    model = model_info['model']
+    weights_name = f'{cancer_type}.safetensors'
+    save_weights(checkpoint_dir / weights_name, model.state_dict(), {'cancer_type': cancer_type})
+
+    manifest = {
+        'format': MANIFEST_FORMAT,
+        'architecture': type(model).__name__,
+        'weights': weights_name,
+        'classes': [str(name) for name in model_info['classes']],
+        'input_size': model_info['input_size'],
+        'mean': [float(v) for v in model_info['mean']],
+        'std': [float(v) for v in model_info['std']],
+        'version': model_info.get('version', 'unknown'),
+        'test_accuracy': model_info.get('test_accuracy')
+    }
+    if model_info.get('optimization', {}).get('applied'):
+        manifest['optimization'] = model_info['optimization']
+    path = manifest_path(checkpoint_dir, cancer_type)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def converted_fingerprint(checkpoint_dir, cancer_type):
+    """Fingerprint load_converted() would give, without loading; None if not converted"""
+    path = manifest_path(checkpoint_dir, cancer_type)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        weights_path = path.parent / json.load(f)['weights']
+    return checkpoint_fingerprint(weights_path, path) if weights_path.exists() else None
+
+
+def load_converted(checkpoint_dir, cancer_type, architectures, device):
+    """
+    Model info dict for a converted checkpoint, or None if there is none.
+    `architectures` maps manifest architecture names to nn.Module classes.
+    """
+    path = manifest_path(checkpoint_dir, cancer_type)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != MANIFEST_FORMAT:
+        raise ValueError(f"{path}: unsupported manifest format {manifest.get('format')!r}")
+
+    weights_path = path.parent / manifest['weights']
+    state_dict = load_weights(weights_path)
+    # Built on the meta device so no throwaway weights are allocated or initialised
+    with torch.device('meta'):
+        model = architectures[manifest['architecture']](num_classes=len(manifest['classes'])).eval()
+        if 'optimization' in manifest:
+            # Stored folded: build the same folded layer structure for the weights to land in
+            model, _ = fold_batch_norm(model)
+    model.load_state_dict(state_dict, assign=True)
+    model = model.to(device).eval()
+
+    model_info = {key: value for key, value in manifest.items() if key not in ('format', 'weights')}
+    model_info['model'] = model
+    if model_info.get('test_accuracy') is None:
+        model_info.pop('test_accuracy')
+    model_info['fingerprint'] = checkpoint_fingerprint(weights_path, path)
+    model_info['memory_mapped'] = True
+    return model_info
@@ -0,0 +1,101 @@
+"""
+Checkpoint Converter
+Converts the original .pth/.pkl checkpoints into weights-only, memory-mappable
+files plus a JSON manifest per model (see checkpoints.py). The app loads these
+instead of unpickling when they are present in CHECKPOINT_DIR.
+
+Models are stored with BatchNorm folded and Dropout removed, as the server
+would fold them at load time, so the memory-mapped weights are served as they
+are instead of being copied by the fold (--no-fuse stores them unfolded).
+
+Each converted model is loaded back and checked against the original (identical
+outputs, or within the fusion tolerance when folded), and both load paths are
+timed.
+
+USAGE:
+    python convert_checkpoints.py [--out checkpoints] [--models brain lung skin] [--no-fuse]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+# The converter only needs the loaders; no preprocessing workers or eager loads
+os.environ.setdefault('PREPROCESS_WORKERS', '0')
+os.environ.setdefault('LAZY_MODEL_LOADING', '1')
+
+import torch
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import inference
+from architectures import ARCHITECTURES
+from checkpoints import load_converted, write_manifest
+from model_optimization import FUSION_TOLERANCE, optimize_for_inference
+from model_registry import resolve_input_size
+
+
+def timed(fn):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=str(inference.CHECKPOINT_DIR), help='output directory (CHECKPOINT_DIR)')
+    parser.add_argument('--models', nargs='+', default=inference.MODELS.registered(), choices=inference.MODELS.registered())
+    parser.add_argument('--no-fuse', action='store_true', help='store weights unfolded (BatchNorm and Dropout kept)')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("CHECKPOINT CONVERTER")
+    print("=" * 70)
+    print(f"Output: {args.out}\n")
+    print(f"{'Model':<8}{'size MB':>9}{'pickle ms':>11}{'mmap ms':>10}{'speedup':>9}{'max |dlogit|':>15}")
+    print("-" * 70)
+
+    failed = False
+    for cancer_type in args.models:
+        loader = inference.MODELS.specs[cancer_type]['loader']
+        try:
+            original, pickle_time = timed(lambda: loader(prefer_converted=False))
+        except Exception as e:
+            print(f"✗ {cancer_type}: cannot load original checkpoint: {e}")
+            failed = True
+            continue
+
+        size = resolve_input_size(original['input_size'], inference.MODELS.specs[cancer_type]['default_size'])
+        stored = dict(original)
+        if not args.no_fuse:
+            stored['model'], stored['optimization'] = optimize_for_inference(
+                original['model'].eval(), size, inference.device
+            )
+        manifest = write_manifest(args.out, cancer_type, stored)
+        converted, mmap_time = timed(lambda: load_converted(args.out, cancer_type, ARCHITECTURES, inference.device))
+
+        sample = torch.randn(2, 3, size, size, generator=torch.Generator().manual_seed(0)).to(inference.device)
+        with torch.no_grad():
+            reference = original['model'].eval()(sample)
+            max_diff = (reference - converted['model'](sample)).abs().max().item()
+        tolerance = FUSION_TOLERANCE * max(1.0, reference.abs().max().item()) if 'optimization' in converted else 0
+        nbytes = sum(t.numel() * t.element_size() for t in converted['model'].state_dict().values())
+
+        print(f"{cancer_type:<8}{nbytes / 2**20:>9.1f}{pickle_time * 1000:>11.1f}{mmap_time * 1000:>10.1f}"
+              f"{pickle_time / mmap_time:>8.1f}x{max_diff:>15.2e} {'✓' if max_diff <= tolerance else '✗'}"
+              f"{'  folded' if 'optimization' in converted else ''}")
+        failed |= max_diff > tolerance
+        print(f"        -> {manifest}")
+
+    print("-" * 70)
+    print("Set CHECKPOINT_DIR if the output is not the app's default directory.")
+    print("=" * 70)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
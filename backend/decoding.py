@@ -0,0 +1,57 @@
+"""
+Image Decoding
+Decodes uploads no larger than the model needs and refuses decompression bombs
+before any pixel buffer is allocated.
+"""
+
+from PIL import Image
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'tiff'}
+
+
+class ImageTooLarge(ValueError):
+    """Upload exceeds the pixel budget and cannot be decoded at reduced size"""
+
+
+def open_image(image_file, mode='RGB', target_size=None, max_pixels=None, downsample=True):
+    """
+    Open an image and decode it to `mode`.
+
+    Only the header is read before the checks below, so oversized images are
+    rejected without allocating their pixels:
+      - target_size: JPEGs are decoded with DCT scaling (1/2, 1/4 or 1/8) to the
+        smallest size that still covers target_size x target_size.
+      - mode 'L': JPEGs decode only the luma channel instead of RGB + conversion.
+      - max_pixels: images above the budget are downsampled at decode time when
+        the format allows it (JPEG, downsample=True), otherwise ImageTooLarge.
+    """
+    try:
+        image = Image.open(image_file)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    width, height = image.size
+    over_budget = bool(max_pixels) and width * height > max_pixels
+
+    if image.format == 'JPEG' and mode in ('L', 'RGB'):
+        # draft() can only be applied once, so fold both limits into one request
+        request_width, request_height = (target_size, target_size) if target_size else (width, height)
+        if over_budget and downsample:
+            for scale in (1 / 2, 1 / 4, 1 / 8):
+                if width * height * scale * scale <= max_pixels:
+                    break
+            request_width = min(request_width, int(width * scale))
+            request_height = min(request_height, int(height * scale))
+        image.draft(mode, (max(1, request_width), max(1, request_height)))
+        width, height = image.size
+
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLarge(
+            f'Image is {width}x{height} ({width * height:,} pixels); '
+            f'the limit is {max_pixels:,} pixels'
+        )
+
+    return image.convert(mode)
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
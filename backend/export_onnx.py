@@ -0,0 +1,156 @@
+"""
+ONNX Exporter
+Exports each model to ONNX with a dynamic batch dimension for the ONNX Runtime
+backend (INFERENCE_BACKEND=onnxruntime, see onnx_backend.py), then checks ONNX
+Runtime against PyTorch and benchmarks them side by side:
+
+  parity      max |logit difference| at batch 1 and --batch-size
+  latency     median batch-1 forward time
+  throughput  images/s at --batch-size
+
+The PyTorch side is timed as the server runs it, with BatchNorm folded.
+Each model is exported to a staging directory and only moved into --out when
+it passes the parity check, so a failing export is never served.
+With --random, every architecture (brain v1 and v2, lung, skin) is exported
+with random weights to a temporary directory, to benchmark without
+checkpoints; nothing is written to the checkpoint directory.
+
+USAGE:
+    python export_onnx.py [--out checkpoints] [--models brain lung skin] [--batch-size 8] [--random]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# The exporter needs the PyTorch loaders, not the backend the server is configured with
+os.environ['INFERENCE_BACKEND'] = 'torch'
+os.environ.setdefault('PREPROCESS_WORKERS', '0')
+os.environ.setdefault('LAZY_MODEL_LOADING', '1')
+
+import torch
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import inference
+from architectures import ARCHITECTURES
+from model_optimization import FUSION_TOLERANCE, optimize_for_inference
+from model_registry import resolve_input_size
+from onnx_backend import OnnxModel, onnx_available, onnx_paths, onnxruntime_available, write_onnx_manifest
+
+RANDOM_INPUT_SIZES = {'ImprovedBrainTumorCNN': 224, 'BrainTumorCNN': 224, 'LungCNN': 224, 'SkinCNN': 128}
+
+
+def random_model_info(architecture):
+    torch.manual_seed(0)
+    model = ARCHITECTURES[architecture]().eval()
+    num_classes = model.classifier[-1].out_features
+    return {
+        'model': model, 'classes': [f'class_{i}' for i in range(num_classes)],
+        'input_size': RANDOM_INPUT_SIZES[architecture],
+        'mean': [0.485, 0.456, 0.406], 'std': [0.229, 0.224, 0.225]
+    }
+
+
+def median_ms(fn, batch, runs):
+    with torch.inference_mode():
+        fn(batch)
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn(batch)
+            times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def check_export(name, model_info, size, staging, args):
+    """Export into staging and compare it with PyTorch -> (parity ok, table row)"""
+    path = write_onnx_manifest(staging, name, model_info, size)
+    session = OnnxModel(path, threads=torch.get_num_threads())
+    served, _ = optimize_for_inference(model_info['model'], size, torch.device('cpu'))
+    generator = torch.Generator().manual_seed(0)
+    single = torch.randn(1, 3, size, size, generator=generator)
+    batch = torch.randn(args.batch_size, 3, size, size, generator=generator)
+
+    with torch.inference_mode():
+        reference = [model_info['model'](single), model_info['model'](batch)]
+        max_diff = max((session(x) - ref).abs().max().item() for x, ref in zip((single, batch), reference))
+    scale = max(1.0, max(ref.abs().max().item() for ref in reference))
+    ok = max_diff <= FUSION_TOLERANCE * scale
+
+    torch_b1, ort_b1 = median_ms(served, single, args.runs), median_ms(session, single, args.runs)
+    runs = max(3, args.runs // args.batch_size)
+    torch_tput = args.batch_size / median_ms(served, batch, runs) * 1000
+    ort_tput = args.batch_size / median_ms(session, batch, runs) * 1000
+    return ok, (f"{name:<24}{max_diff:>12.2e} {'✓' if ok else '✗'}{torch_b1:>13.1f}{ort_b1:>11.1f}"
+                f"{torch_tput:>13.1f}{ort_tput:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=str(inference.CHECKPOINT_DIR), help='output directory (CHECKPOINT_DIR)')
+    parser.add_argument('--models', nargs='+', default=inference.MODELS.registered(),
+                        choices=inference.MODELS.registered())
+    parser.add_argument('--batch-size', type=int, default=8, help='batch size for parity and throughput')
+    parser.add_argument('--runs', type=int, default=20, help='timed forward passes per measurement')
+    parser.add_argument('--random', action='store_true', help='export every architecture with random weights')
+    args = parser.parse_args()
+
+    missing = [name for name, available in (('onnx', onnx_available()), ('onnxruntime', onnxruntime_available()))
+               if not available]
+    if missing:
+        sys.exit(f"✗ {' and '.join(missing)} {'is' if len(missing) == 1 else 'are'} not installed "
+                 f"(pip install -r requirements-onnx.txt)")
+
+    if args.random:
+        out = tempfile.mkdtemp(prefix='onnx-export-')
+        cases = [(name, lambda name=name: random_model_info(name), None) for name in ARCHITECTURES]
+    else:
+        out = args.out
+        cases = [(name, inference.MODELS.specs[name]['loader'], inference.MODELS.specs[name]['default_size'])
+                 for name in args.models]
+
+    print("=" * 90)
+    print("ONNX EXPORT")
+    print("=" * 90)
+    print(f"Output: {out}   Threads: {torch.get_num_threads()}   Batch: {args.batch_size}\n")
+    print(f"{'Model':<24}{'max |dlogit|':>14}{'torch b1 ms':>13}{'ORT b1 ms':>11}"
+          f"{'torch img/s':>13}{'ORT img/s':>11}")
+    print("-" * 90)
+
+    failed = False
+    for name, loader, default_size in cases:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                model_info = loader()
+        except Exception as e:
+            print(f"✗ {name}: cannot load model: {e}")
+            failed = True
+            continue
+        size = resolve_input_size(model_info['input_size'], default_size or 224)
+        model_info['model'] = model_info['model'].cpu().eval()
+        os.makedirs(out, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=out, prefix='.onnx-staging-') as staging:
+            ok, line = check_export(name, model_info, size, staging, args)
+            failed |= not ok
+            if ok:
+                # Same filesystem, so each move is atomic; the manifest goes last
+                for staged, final in zip(onnx_paths(staging, name), onnx_paths(out, name)):
+                    os.replace(staged, final)
+        print(line)
+        if not args.random:
+            print(f"{'':<24}-> {onnx_paths(out, name)[0] if ok else 'not written (parity check failed)'}")
+
+    print("-" * 90)
+    print("Serve the exports with INFERENCE_BACKEND=onnxruntime (CHECKPOINT_DIR if not the default).")
+    print("=" * 90)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
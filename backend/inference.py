@@ -0,0 +1,767 @@
+"""
+Inference Runtime
+Device setup, model loading, prediction caches, batching, the preprocessing
+pool and the streaming batch pipeline behind the API routes.
+
+Importing this module is what starts the heavy subsystems (torch, OpenCV,
+worker processes, pinned model loads); create_app() imports it on demand.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+import torch
+
+from admission import AdmissionController, Overloaded
+from architectures import ARCHITECTURES, BrainTumorCNN, LungCNN, architecture_pickle
+from batching import BatchScheduler
+from brain_preprocessing import BRAIN_TIERS, prepare_brain_image
+from checkpoints import checkpoint_fingerprint, converted_fingerprint, load_converted
+from decoding import ALLOWED_EXTENSIONS, allowed_file
+from metrics import (
+    BATCH_SIZE_BUCKETS, Counter, Gauge, Histogram, Registry, collect_stages, resident_memory_bytes, stage
+)
+from model_registry import ModelRegistry
+from onnx_backend import StaleExport, load_onnx, onnxruntime_available
+from perceptual_index import NearDuplicateIndex, dhash_stream
+from prediction_cache import PredictionCache
+from preprocess_pool import PreprocessPool
+from profiling import RequestTracer, tracing
+
+# Configuration
+BASE_DIR = Path(__file__).resolve().parent  # Directory holding the app and its checkpoints
+
+# Pixel budget per decoded image. Larger JPEGs are decoded at 1/2, 1/4 or 1/8
+# scale to fit (unless DOWNSAMPLE_OVERSIZE_IMAGES=0); other formats are rejected.
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 40_000_000))
+DOWNSAMPLE_OVERSIZE_IMAGES = os.environ.get('DOWNSAMPLE_OVERSIZE_IMAGES', '1') != '0'
+
+# Configure device - prioritize CUDA GPU
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+print(f"\n{'='*60}")
+print(f"Device Configuration:")
+print(f"{'='*60}")
+print(f"Using device: {device}")
+if torch.cuda.is_available():
+    print(f"GPU Name: {torch.cuda.get_device_name(0)}")
+    print(f"CUDA Version: {torch.version.cuda}")
+    print(f"GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB")
+    print(f"GPU Available: ✓ ENABLED")
+else:
+    print(f"GPU Available: ✗ Running on CPU (slower)")
+
+# Torch intra-op threads are sized independently of the preprocessing pool
+# (PREPROCESS_WORKERS) so the two can be balanced against the core count
+TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', 0))
+if TORCH_NUM_THREADS > 0:
+    torch.set_num_threads(TORCH_NUM_THREADS)
+print(f"Torch threads: {torch.get_num_threads()}")
+print(f"{'='*60}\n")
+
+# ============================================
+# LOAD MODELS
+# ============================================
+
+# Pickle-free, memory-mapped checkpoints written by convert_checkpoints.py take
+# precedence over the original .pth/.pkl files when present
+CHECKPOINT_DIR = Path(os.environ.get('CHECKPOINT_DIR', BASE_DIR / 'checkpoints'))
+
+# INFERENCE_BACKEND=onnxruntime serves the ONNX exports in CHECKPOINT_DIR (written by
+# export_onnx.py) through ONNX Runtime; models without an export stay on PyTorch
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch').lower()
+if INFERENCE_BACKEND not in ('torch', 'onnxruntime'):
+    raise ValueError(f"INFERENCE_BACKEND must be torch or onnxruntime, not {INFERENCE_BACKEND!r}")
+if INFERENCE_BACKEND == 'onnxruntime' and not onnxruntime_available():
+    print("⚠️  INFERENCE_BACKEND=onnxruntime but onnxruntime is not installed; using PyTorch")
+    INFERENCE_BACKEND = 'torch'
+
+
+# Original checkpoint files behind each model, as read by the loaders below
+SOURCE_CHECKPOINTS = {
+    'brain': (BASE_DIR / 'src' / 'brain' / 'brain_tumor_classifier_v1.pth',),
+    'lung': (BASE_DIR / 'src' / 'lungs' / 'lung_cnn_checkpoint.pth', BASE_DIR / 'src' / 'lungs' / 'lung_class_names.pkl'),
+    'skin': (BASE_DIR / 'src' / 'skin' / 'skin_cnn_full_model.pth', BASE_DIR / 'src' / 'skin' / 'class_names.pkl')
+}
+
+
+def source_fingerprint(cancer_type):
+    """Fingerprint of the checkpoint PyTorch would serve (converted, else .pth), without loading it"""
+    fingerprint = converted_fingerprint(CHECKPOINT_DIR, cancer_type)
+    paths = SOURCE_CHECKPOINTS.get(cancer_type, ())
+    if fingerprint is None and paths and all(path.exists() for path in paths):
+        fingerprint = checkpoint_fingerprint(*paths)
+    return fingerprint
+
+
+def load_converted_model(cancer_type):
+    """Model info from CHECKPOINT_DIR, or None if the model has not been converted"""
+    if INFERENCE_BACKEND == 'onnxruntime':
+        try:
+            model_info = load_onnx(CHECKPOINT_DIR, cancer_type, threads=torch.get_num_threads(),
+                                   source_fingerprint=source_fingerprint(cancer_type))
+        except StaleExport as e:
+            print(f"⚠️  {e}; serving it with PyTorch")
+        else:
+            if model_info is not None:
+                print(f"✓ {MODELS.label(cancer_type)} model loaded from ONNX export (ONNX Runtime)")
+                return model_info
+            print(f"⚠️  No ONNX export of the {cancer_type} model in {CHECKPOINT_DIR}; serving it with PyTorch")
+    model_info = load_converted(CHECKPOINT_DIR, cancer_type, ARCHITECTURES, device)
+    if model_info is not None:
+        print(f"✓ {MODELS.label(cancer_type)} model loaded from converted checkpoint")
+    return model_info
+
+
+def load_brain_model(prefer_converted=True):
+    """Load Brain Tumor Model (Try improved v2 first, fallback to v1)"""
+    model_info = load_converted_model('brain') if prefer_converted else None
+    if model_info is not None:
+        return model_info
+    
+    # Try to load the improved v2 model first
+    brain_model_path = BASE_DIR / 'src' / 'brain' / 'brain_tumor_classifier_v2_improved.pth'
+    
+    # if brain_model_path.exists():
+    #     print("Loading IMPROVED Brain Tumor Model v2...")
+    #     brain_checkpoint = torch.load(str(brain_model_path), map_location=device)
+    #     brain_model = ImprovedBrainTumorCNN(num_classes=4)
+    #     brain_model.load_state_dict(brain_checkpoint['model_state_dict'])
+    #     brain_model = brain_model.to(device)
+    #     brain_model.eval()
+    #     models['brain'] = {
+    #         'model': brain_model,
+    #         'classes': brain_checkpoint['model_config']['class_names'],
+    #         'input_size': brain_checkpoint['preprocessing']['input_size'],
+    #         'mean': brain_checkpoint['preprocessing']['mean'],
+    #         'std': brain_checkpoint['preprocessing']['std'],
+    #         'version': 'v2_improved',
+    #         'test_accuracy': brain_checkpoint['performance']['best_test_accuracy']
+    #     }
+    #     print(f"✓ Brain tumor model v2 loaded (Test Acc: {brain_checkpoint['performance']['best_test_accuracy']:.2%})")
+    # else:
+        # Fallback to old v1 model
+    
+    print("v2 model not found, loading legacy v1 model...")
+    brain_model_path, = SOURCE_CHECKPOINTS['brain']
+    brain_checkpoint = torch.load(str(brain_model_path), map_location=device)
+    brain_model = BrainTumorCNN(num_classes=4)
+    brain_model.load_state_dict(brain_checkpoint['model_state_dict'])
+    brain_model = brain_model.to(device)
+    brain_model.eval()
+    model_info = {
+        'model': brain_model,
+        'classes': brain_checkpoint['model_config']['class_names'],
+        'input_size': brain_checkpoint['preprocessing']['input_size'],
+        'mean': brain_checkpoint['preprocessing']['mean'],
+        'std': brain_checkpoint['preprocessing']['std'],
+        'version': 'v1_legacy',
+        'test_accuracy': brain_checkpoint['performance'].get('best_val_accuracy', 0),
+        'fingerprint': checkpoint_fingerprint(brain_model_path)
+    }
+    print(f"✓ Brain tumor model v1 loaded (Val Acc: {brain_checkpoint['performance']['best_val_accuracy']:.2%})")
+    print("⚠️  Note: Using legacy model. Train improved model for better accuracy!")
+    return model_info
+
+
+def load_lung_model(prefer_converted=True):
+    """Load Lung Cancer Model"""
+    model_info = load_converted_model('lung') if prefer_converted else None
+    if model_info is not None:
+        return model_info
+    
+    lung_model_path, lung_classes_path = SOURCE_CHECKPOINTS['lung']
+    
+    lung_checkpoint = torch.load(str(lung_model_path), map_location=device)
+    lung_model = LungCNN(num_classes=lung_checkpoint['num_classes'])
+    lung_model.load_state_dict(lung_checkpoint['model_state_dict'])
+    lung_model = lung_model.to(device)
+    lung_model.eval()
+    
+    with open(str(lung_classes_path), 'rb') as f:
+        lung_classes = pickle.load(f)
+    
+    model_info = {
+        'model': lung_model,
+        'classes': lung_classes,
+        'input_size': lung_checkpoint['input_size'],
+        'mean': lung_checkpoint['normalize_mean'],
+        'std': lung_checkpoint['normalize_std'],
+        'fingerprint': checkpoint_fingerprint(lung_model_path, lung_classes_path)
+    }
+    print("✓ Lung cancer model loaded")
+    return model_info
+
+
+def load_skin_model(prefer_converted=True):
+    """Load Skin Cancer Model"""
+    model_info = load_converted_model('skin') if prefer_converted else None
+    if model_info is not None:
+        return model_info
+    
+    skin_model_path, skin_classes_path = SOURCE_CHECKPOINTS['skin']
+    
+    # Whole pickled module; its class is resolved to architectures.SkinCNN
+    skin_model = torch.load(str(skin_model_path), map_location=device, pickle_module=architecture_pickle)
+    skin_model.eval()
+    
+    with open(str(skin_classes_path), 'rb') as f:
+        skin_classes = pickle.load(f)
+    
+    model_info = {
+        'model': skin_model,
+        'classes': skin_classes,
+        'input_size': 128,
+        'mean': [0.485, 0.456, 0.406],
+        'std': [0.229, 0.224, 0.225],
+        'fingerprint': checkpoint_fingerprint(skin_model_path, skin_classes_path)
+    }
+    print("✓ Skin cancer model loaded")
+    return model_info
+
+
+# Brain preprocessing quality tier for this deployment; requests can override it
+# with the preprocessing_tier form field
+BRAIN_PREPROCESSING_TIER = os.environ.get('BRAIN_PREPROCESSING_TIER', 'reference')
+
+# Models load on first use (LAZY_MODEL_LOADING=0 loads all of them at startup).
+# With MODEL_MEMORY_BUDGET_MB set, the least-recently-used models are evicted to
+# stay within it; PINNED_MODELS load at startup and are never evicted.
+LAZY_MODEL_LOADING = os.environ.get('LAZY_MODEL_LOADING', '1') != '0'
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 0))
+PINNED_MODELS = [name.strip() for name in os.environ.get('PINNED_MODELS', '').split(',') if name.strip()]
+
+# BatchNorm is folded into the preceding Conv/Linear layer and Dropout removed as
+# each model loads, after checking the outputs still match (FUSE_MODELS=0 disables).
+# Folding writes new weights, so convert_checkpoints.py stores converted models
+# already folded and they stay memory-mapped and shared; such checkpoints are
+# served folded even with FUSE_MODELS=0 (convert with --no-fuse to avoid that).
+FUSE_MODELS = os.environ.get('FUSE_MODELS', '1') != '0'
+
+# Opt-in INT8 serving per model (QUANTIZED_MODELS=lung,skin) from versions made by
+# calibrate_quantization.py. A quantized model is only used when its top-1
+# agreement with FP32 on the calibration set is at least QUANTIZATION_MIN_AGREEMENT.
+QUANTIZED_MODELS = [name.strip() for name in os.environ.get('QUANTIZED_MODELS', '').split(',') if name.strip()]
+QUANTIZATION_MIN_AGREEMENT = float(os.environ.get('QUANTIZATION_MIN_AGREEMENT', 0.99))
+
+# Opt-in bfloat16 autocast per model (BF16_MODELS=lung,skin). Checked at load against
+# FP32 on the images in CALIBRATION_IMAGES_DIR (a fixed random batch if unset);
+# models stay at FP32 without native bfloat16 support or below BF16_MIN_AGREEMENT.
+BF16_MODELS = [name.strip() for name in os.environ.get('BF16_MODELS', '').split(',') if name.strip()]
+BF16_MIN_AGREEMENT = float(os.environ.get('BF16_MIN_AGREEMENT', 0.99))
+CALIBRATION_IMAGES_DIR = os.environ.get('CALIBRATION_IMAGES_DIR')
+
+# A new cancer type only needs a loader and, if it is not plain RGB, a prepare step
+MODELS = ModelRegistry(
+    device, max_pixels=MAX_IMAGE_PIXELS, downsample=DOWNSAMPLE_OVERSIZE_IMAGES,
+    memory_budget=int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024), optimize=FUSE_MODELS,
+    quantized_dir=CHECKPOINT_DIR, min_agreement=QUANTIZATION_MIN_AGREEMENT,
+    calibration_dir=CALIBRATION_IMAGES_DIR, bf16_min_agreement=BF16_MIN_AGREEMENT
+)
+MODELS.register(
+    'brain', load_brain_model, label='Brain Tumor', prepare=prepare_brain_image, default_size=224,
+    tiers=BRAIN_TIERS, default_tier=BRAIN_PREPROCESSING_TIER
+)
+MODELS.register('lung', load_lung_model, label='Lung Cancer', default_size=224)
+MODELS.register('skin', load_skin_model, label='Skin Cancer', default_size=128)
+MODELS.pin(*PINNED_MODELS)
+MODELS.quantize(*QUANTIZED_MODELS)
+MODELS.use_bf16(*BF16_MODELS)
+
+
+# ============================================
+# PREPROCESSING POOL
+# ============================================
+
+# Decoding and preparation run in worker processes and hand their output back
+# through shared memory, so a CPU-heavy brain scan only occupies a brain worker
+# while other requests keep preprocessing and running inference.
+# PREPROCESS_WORKERS is per cancer type; 0 preprocesses inline on the request thread,
+# as does any platform without the fork start method (Windows).
+PREPROCESS_WORKERS = int(os.environ.get('PREPROCESS_WORKERS', max(1, (os.cpu_count() or 4) // 4)))
+
+# Forked here, before load_models(): the first forward pass (pinned loads, the
+# fusion and bf16 checks) starts torch's OpenMP threads, which a forked child
+# inherits in a broken state, and the batching and pipeline threads come later.
+# Nothing that runs torch may move above this point.
+PREPROCESS_POOL = PreprocessPool(PREPROCESS_WORKERS).start(MODELS.registered())
+atexit.register(PREPROCESS_POOL.close)
+if PREPROCESS_POOL.enabled:
+    print(f"✓ Preprocessing pool: {PREPROCESS_WORKERS} worker process(es) per cancer type")
+elif PREPROCESS_WORKERS == 0:
+    print("✓ Preprocessing inline (PREPROCESS_WORKERS=0)")
+
+
+def load_models():
+    """Load all registered models, or only the pinned ones when loading lazily"""
+    if LAZY_MODEL_LOADING:
+        return MODELS.preload(sorted(MODELS.pinned))
+    return MODELS.load_all()
+
+# Initialize models
+load_models()
+
+
+# ============================================
+# PREDICTION CACHE
+# ============================================
+
+# Results are keyed on the image bytes, cancer_type and the loaded model
+# (version + checkpoint fingerprint). There is no manual reload: weights changed
+# on disk are picked up when the model next loads (restart, or after eviction),
+# and their new fingerprint in model_tag() means entries for the old weights are
+# never hit again and age out. Set PREDICTION_CACHE_DIR to keep a disk tier that
+# survives restarts.
+PREDICTION_CACHE = PredictionCache(
+    max_entries=int(os.environ.get('PREDICTION_CACHE_SIZE', 1024)),
+    ttl_seconds=float(os.environ.get('PREDICTION_CACHE_TTL', 3600)),
+    disk_dir=os.environ.get('PREDICTION_CACHE_DIR') or None
+)
+
+
+def parse_thresholds(spec, defaults):
+    """Parse 'brain=6,skin=12' overrides; a negative value disables a cancer_type"""
+    thresholds = dict(defaults)
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, value = part.partition('=')
+        thresholds[name.strip().lower()] = int(value)
+    return thresholds
+
+
+# Re-encoded or slightly rescaled copies of a scan are matched through a 256-bit
+# dHash of the decoded grayscale image. Thresholds are maximum Hamming distances.
+# Off unless enabled per cancer_type (NEAR_DUPLICATE_THRESHOLDS='skin=<bits>'): a
+# different but similar scan (adjacent slice, follow-up image) would be given
+# the stored diagnosis without running the model. Check a setting with
+# check_near_duplicates.py before enabling it.
+NEAR_DUPLICATE_INDEX = NearDuplicateIndex(
+    thresholds=parse_thresholds(os.environ.get('NEAR_DUPLICATE_THRESHOLDS', ''), {}),
+    max_entries=int(os.environ.get('NEAR_DUPLICATE_INDEX_SIZE', 4096))
+)
+
+
+def model_tag(model_info):
+    """Identify the loaded weights (and precision) so cached results never outlive them"""
+    tag = f"{model_info.get('version', 'unknown')}-{model_info.get('fingerprint', '')}"
+    precision = model_info.get('precision', 'fp32')
+    return tag if precision == 'fp32' else f'{tag}-{precision}'
+
+
+def hash_stream(stream, chunk_size=1024 * 1024):
+    """SHA-256 of an upload without copying it, leaving the stream rewound"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+# ============================================
+# BATCHED INFERENCE
+# ============================================
+
+# Concurrent requests for the same cancer_type are merged into one forward pass.
+# BATCH_MAX_SIZE=1 disables batching.
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+
+SCHEDULERS = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(cancer_type, plan):
+    """Return the batch scheduler for a loaded model's plan, creating it on first use"""
+    with _schedulers_lock:
+        scheduler = SCHEDULERS.get(cancer_type)
+        if scheduler is None or scheduler.forward != plan.forward:
+            if scheduler is not None:
+                scheduler.close()
+            scheduler = BatchScheduler(
+                plan.forward,
+                max_batch_size=BATCH_MAX_SIZE,
+                max_wait_ms=BATCH_MAX_WAIT_MS,
+                name=cancer_type,
+                observer=batch_observer(cancer_type)
+            )
+            SCHEDULERS[cancer_type] = scheduler
+    return scheduler
+
+
+@MODELS.on_evict
+def close_scheduler(cancer_type):
+    """Stop an evicted model's batcher so the model can be freed"""
+    with _schedulers_lock:
+        scheduler = SCHEDULERS.pop(cancer_type, None)
+    if scheduler is not None:
+        scheduler.close()
+
+
+@atexit.register
+def close_schedulers():
+    """Join batcher threads before the interpreter tears torch down"""
+    with _schedulers_lock:
+        for scheduler in SCHEDULERS.values():
+            scheduler.close()
+        SCHEDULERS.clear()
+
+
+# ============================================
+# ADMISSION CONTROL
+# ============================================
+
+# Concurrent predictions per cancer_type (ADMISSION_LIMITS='brain=2,lung=8'): by
+# default the preprocessing workers for brain, a full batch for the others.
+# ADMISSION_TOTAL caps all models together; free slots then go round-robin
+# across cancer_types. Requests beyond ADMISSION_QUEUE_SIZE waiting per model, or
+# whose estimated wait overruns their deadline, get 503 + Retry-After.
+# REQUEST_DEADLINE_MS applies when a request gives none (0 = no deadline).
+ADMISSION = AdmissionController(
+    limits=parse_thresholds(
+        os.environ.get('ADMISSION_LIMITS', ''),
+        {'brain': max(2, PREPROCESS_WORKERS), 'lung': BATCH_MAX_SIZE, 'skin': BATCH_MAX_SIZE}
+    ),
+    default_limit=BATCH_MAX_SIZE,
+    total=int(os.environ.get('ADMISSION_TOTAL', 0)),
+    queue_size=int(os.environ.get('ADMISSION_QUEUE_SIZE', 64))
+)
+REQUEST_DEADLINE_MS = float(os.environ.get('REQUEST_DEADLINE_MS', 30000))
+
+
+# ============================================
+# METRICS
+# ============================================
+
+# Exposed on /metrics. Stage histograms are labelled by cancer_type and model
+# version: upload, cache_lookup, near_duplicate_lookup, decode, brain_preprocess,
+# brain_mask, resize, pool_wait, queue_wait, collate, forward, postprocess, serialize.
+METRICS = Registry()
+STAGE_SECONDS = METRICS.register(Histogram(
+    'predict_stage_seconds', 'Time spent in each stage of a prediction',
+    ('stage', 'cancer_type', 'model_version')
+))
+REQUEST_SECONDS = METRICS.register(Histogram(
+    'predict_request_seconds', 'End-to-end /api/predict latency (per image for batch uploads)',
+    ('cancer_type', 'model_version', 'status')
+))
+BATCH_SIZE = METRICS.register(Histogram(
+    'inference_batch_size', 'Images per forward pass', ('cancer_type', 'model_version'), buckets=BATCH_SIZE_BUCKETS
+))
+CACHE_RESULTS = METRICS.register(Counter(
+    'prediction_cache_results_total', 'Predictions by cache outcome (hit, near_duplicate, miss, uncached)',
+    ('cancer_type', 'result')
+))
+METRICS.register(Gauge(
+    'prediction_cache_hit_ratio', 'Exact-byte cache hits / lookups',
+    function=lambda: {(): PREDICTION_CACHE.stats()['hit_ratio']}
+))
+METRICS.register(Gauge(
+    'batch_queue_depth', 'Images waiting for a forward pass', ('cancer_type',),
+    function=lambda: {(name,): scheduler.depth() for name, scheduler in list(SCHEDULERS.items())}
+))
+METRICS.register(Gauge(
+    'admission_running', 'Predictions holding an admission slot', ('cancer_type',),
+    function=lambda: {(name,): entry['running'] for name, entry in ADMISSION.stats()['models'].items()}
+))
+METRICS.register(Gauge(
+    'admission_waiting', 'Predictions queued for an admission slot', ('cancer_type',),
+    function=lambda: {(name,): entry['waiting'] for name, entry in ADMISSION.stats()['models'].items()}
+))
+METRICS.register(Gauge(
+    'models_resident_bytes', 'Memory held by resident models', function=lambda: {(): MODELS.resident_bytes()}
+))
+METRICS.register(Gauge(
+    'process_resident_memory_bytes', 'Resident set size of the server process',
+    function=lambda: {(): resident_memory_bytes()}
+))
+
+
+# ============================================
+# PROFILING
+# ============================================
+
+# Per-request Chrome traces (torch operators + Python calls), viewable in
+# Perfetto. A prediction is traced when its X-Profile-Token header matches
+# PROFILE_ADMIN_TOKEN (unset = header ignored), or with probability
+# PROFILE_SAMPLE_RATE (0 = never); one request is traced at a time, others run
+# untraced meanwhile. The newest PROFILE_KEEP_TRACES traces are kept in
+# PROFILE_TRACE_DIR and listed on /api/traces.
+TRACER = RequestTracer(
+    trace_dir=os.environ.get('PROFILE_TRACE_DIR', BASE_DIR / 'traces'),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    admin_token=os.environ.get('PROFILE_ADMIN_TOKEN'),
+    keep=int(os.environ.get('PROFILE_KEEP_TRACES', 100))
+)
+if TRACER.enabled:
+    print(f"✓ Request profiling: sample rate {TRACER.sample_rate:g}, "
+          f"admin header {'on' if TRACER.admin_token else 'off'}, traces in {TRACER.trace_dir}")
+
+
+def model_version(cancer_type):
+    """Version label of the resident (or last loaded) model, without loading it"""
+    model_info = MODELS.get(cancer_type) or MODELS.metadata.get(cancer_type) or {}
+    return str(model_info.get('version', 'unknown'))
+
+
+def record_stages(cancer_type, timings):
+    version = model_version(cancer_type)
+    for name, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, name, cancer_type, version)
+
+
+def record_request(cancer_type, status, seconds, timings):
+    """Stages measured by the server around run_prediction (upload, serialize) and the total"""
+    record_stages(cancer_type, timings)
+    REQUEST_SECONDS.observe(seconds, cancer_type, model_version(cancer_type), str(status))
+
+
+def batch_observer(cancer_type):
+    """BatchScheduler observer: every image in a batch waited for, and shared, its forward pass"""
+    def observe(queue_waits, timings):
+        version = model_version(cancer_type)
+        BATCH_SIZE.observe(len(queue_waits), cancer_type, version)
+        for waited in queue_waits:
+            STAGE_SECONDS.observe(waited, 'queue_wait', cancer_type, version)
+            for name, seconds in timings.items():
+                STAGE_SECONDS.observe(seconds, name, cancer_type, version)
+    return observe
+
+
+# ============================================
+# PREDICTION FUNCTIONS
+# ============================================
+
+def predict_image(cancer_type, image_file, tier=None):
+    """Run a registered model on one image through its inference plan"""
+    model_info = MODELS.acquire(cancer_type)
+    if model_info is None:
+        return {'error': f'{MODELS.label(cancer_type).capitalize()} model not loaded'}
+    
+    plan = model_info['plan']
+    if tracing():
+        return predict_traced(plan, image_file, tier)
+    with PREPROCESS_POOL.preprocess(cancer_type, plan, image_file, tier) as image:
+        probabilities = get_scheduler(cancer_type, plan).predict(image)
+    with stage('postprocess'):
+        return plan.postprocess(probabilities)
+
+
+def predict_traced(plan, image_file, tier=None):
+    """
+    predict_image() for a profiled request: preprocessing and the forward pass
+    run on the request thread, where the profiler is recording, instead of in
+    the worker pool and the batcher
+    """
+    with torch.profiler.record_function('preprocess'):
+        image = plan.preprocess(image_file, tier)
+    with torch.profiler.record_function('forward'):
+        probabilities = plan.forward([image])[0]
+    with torch.profiler.record_function('postprocess'), stage('postprocess'):
+        return plan.postprocess(probabilities)
+
+
+def predict_brain_tumor(image_file):
+    """Predict brain tumor type"""
+    return predict_image('brain', image_file)
+
+
+def predict_lung_cancer(image_file):
+    """Predict lung cancer type"""
+    return predict_image('lung', image_file)
+
+
+def predict_skin_cancer(image_file):
+    """Predict skin cancer type"""
+    return predict_image('skin', image_file)
+
+
+def run_prediction(cancer_type, stream, tier=None):
+    """
+    Predict through the exact-byte cache and the near-duplicate index
+    Returns: (result, cache status) where status is 'hit', 'near_duplicate',
+    'miss' or None (not cacheable)
+    """
+    with collect_stages() as timings:
+        try:
+            result, cache_status = _run_prediction(cancer_type, stream, tier)
+        finally:
+            record_stages(cancer_type, timings)
+    CACHE_RESULTS.inc(cancer_type, cache_status or 'uncached')
+    return result, cache_status
+
+
+def _run_prediction(cancer_type, stream, tier):
+    # Evicted models keep their tag, so cache hits do not reload them
+    model_info = MODELS.info(cancer_type)
+    if model_info is None or tracing():
+        # Profiled requests skip the caches so their trace covers the model
+        return predict_image(cancer_type, stream, tier), None
+    
+    # Each preprocessing tier produces different inputs, so results are cached apart
+    tier = MODELS.resolve_tier(cancer_type, tier)
+    tag = model_tag(model_info) + (f'-{tier}' if tier else '')
+    with stage('cache_lookup'):
+        key = PredictionCache.make_key(hash_stream(stream), cancer_type, tag)
+        result = PREDICTION_CACHE.get(key)
+    if result is not None:
+        return result, 'hit'
+    
+    image_hash = None
+    if NEAR_DUPLICATE_INDEX.enabled(cancer_type):
+        with stage('near_duplicate_lookup'):
+            try:
+                image_hash = dhash_stream(stream, max_pixels=MAX_IMAGE_PIXELS)
+            except Exception:
+                pass  # Undecodable; let the predictor report the error
+            match = None if image_hash is None else NEAR_DUPLICATE_INDEX.lookup(cancer_type, tag, image_hash)
+        if match is not None:
+            result, _ = match
+            PREDICTION_CACHE.put(key, result)
+            return result, 'near_duplicate'
+    
+    result = predict_image(cancer_type, stream, tier)
+    if 'error' not in result:
+        PREDICTION_CACHE.put(key, result)
+        if image_hash is not None:
+            NEAR_DUPLICATE_INDEX.add(cancer_type, tag, image_hash, result)
+    return result, 'miss'
+
+
+# ============================================
+# STREAMING BATCH PIPELINE
+# ============================================
+
+# Workers decode/preprocess uploads while earlier images are in the model.
+# At most PIPELINE_WINDOW images per request are in flight, which bounds memory
+# regardless of how many files are in the upload. Every image goes through
+# ADMISSION like a single prediction; workers only pick it up once it holds a
+# slot, so a queued batch never ties up pipeline threads.
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', os.cpu_count() or 4))
+PIPELINE_WINDOW = int(os.environ.get('PIPELINE_WINDOW', 2 * max(PIPELINE_WORKERS, BATCH_MAX_SIZE)))
+
+PIPELINE_EXECUTOR = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix='pipeline')
+
+
+def invalid_cancer_type_message():
+    names = MODELS.registered()
+    return f"Invalid cancer_type. Must be: {', '.join(names[:-1])}, or {names[-1]}"
+
+
+class BatchItem:
+    """One file of a batch upload on its way through admission and the pipeline"""
+
+    def __init__(self, index, file, cancer_type, tier=None):
+        self.record = {'index': index, 'filename': file.filename, 'cancer_type': cancer_type}
+        self.file = file
+        self.cancer_type = cancer_type
+        self.tier = tier
+        self.ticket = None
+        self.future = Future()  # -> the item's NDJSON record
+
+    def finish(self, **fields):
+        self.file.close()
+        self.record.update(fields)
+        self.future.set_result(self.record)
+
+    def shed(self, error, since):
+        """Answer the item with its own 503 line instead of running it"""
+        self.finish(success=False, error=error.message, status=503, retry_after=error.retry_after)
+        record_request(self.cancer_type, 503, time.monotonic() - since, {})
+
+
+def admit_batch_item(item, deadline, abandoned):
+    """
+    Validate an item and queue it for an admission slot; once granted it is
+    classified on the pipeline. item.future completes in every case.
+    """
+    if not allowed_file(item.file.filename):
+        return item.finish(success=False, error='Invalid file type. Allowed: png, jpg, jpeg, bmp, tiff')
+    if item.cancer_type not in MODELS.specs:
+        return item.finish(success=False, error=invalid_cancer_type_message())
+    try:
+        item.tier = MODELS.resolve_tier(item.cancer_type, item.tier)
+    except ValueError as e:
+        return item.finish(success=False, error=str(e))
+
+    def on_grant(ticket):
+        if ticket.state == 'running':
+            PIPELINE_EXECUTOR.submit(classify_batch_item, item, ticket, abandoned)
+        else:
+            item.shed(Overloaded(f'Request deadline passed while queued for the {item.cancer_type} model',
+                                 ADMISSION.estimated_wait(item.cancer_type)), ticket.queued_at)
+
+    if deadline is None and REQUEST_DEADLINE_MS > 0:
+        deadline = time.monotonic() + REQUEST_DEADLINE_MS / 1000
+    try:
+        item.ticket = ADMISSION.admit(item.cancer_type, deadline, on_grant)
+    except Overloaded as e:
+        item.shed(e, time.monotonic())
+
+
+def classify_batch_item(item, ticket, abandoned):
+    """Pipeline job for an admitted item; the slot is released even if the client has gone"""
+    try:
+        if abandoned.is_set():
+            return item.finish(success=False, error='Request closed')
+        try:
+            result, cache_status = run_prediction(item.cancer_type, item.file.stream, item.tier)
+        except Exception as e:
+            result, cache_status = {'error': str(e)}, None
+    finally:
+        ADMISSION.release(ticket)
+
+    status = 500 if 'error' in result else 200
+    record_request(item.cancer_type, status, time.monotonic() - ticket.queued_at, {})
+    if status != 200:
+        item.finish(success=False, error=result['error'])
+    elif item.tier:
+        item.finish(success=True, result=result, cache=cache_status, preprocessing_tier=item.tier)
+    else:
+        item.finish(success=True, result=result, cache=cache_status)
+
+
+def stream_batch(items, deadline=None):
+    """
+    Yield one JSON line per item as soon as it is classified. Each item takes
+    its own admission slot: `deadline` (monotonic) bounds the whole batch when
+    the client gave one; otherwise REQUEST_DEADLINE_MS applies to each item
+    from when it is queued. Items that cannot be served in time get a 503 line.
+    """
+    abandoned = threading.Event()
+    pending = {}
+    items = iter(items)
+    try:
+        while True:
+            for index, file, cancer_type, tier in items:
+                item = BatchItem(index, file, cancer_type, tier)
+                admit_batch_item(item, deadline, abandoned)
+                pending[item.future] = item
+                if len(pending) >= PIPELINE_WINDOW:
+                    break
+            if not pending:
+                return
+
+            queued = [item for item in pending.values() if item.ticket is not None and item.ticket.state == 'waiting']
+            remaining = [item.ticket.remaining() for item in queued if item.ticket.deadline is not None]
+            done, _ = wait(pending, timeout=max(0.0, min(remaining)) if remaining else None,
+                           return_when=FIRST_COMPLETED)
+            # Slots only free up when a prediction ends, so expired items are withdrawn here
+            for item in queued:
+                remaining = item.ticket.remaining()
+                if remaining is not None and remaining <= 0 and ADMISSION.cancel(item.ticket, 'expired'):
+                    item.shed(Overloaded(f'Request deadline passed while queued for the {item.cancer_type} model',
+                                         ADMISSION.estimated_wait(item.cancer_type)), item.ticket.queued_at)
+            for future in done:
+                yield json.dumps(pending.pop(future).record) + '\n'
+    finally:
+        # Client went away or the generator was closed: drop queued work
+        abandoned.set()
+        for item in pending.values():
+            if item.ticket is not None and ADMISSION.cancel(item.ticket, 'cancelled'):
+                item.file.close()
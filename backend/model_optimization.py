@@ -0,0 +1,85 @@
+"""
+Inference Graph Optimization
+Load-time rewrite of eval-mode models: BatchNorm layers are folded into the
+Conv2d/Linear layer before them and Dropout layers are removed, so each block
+runs one fused kernel instead of a convolution plus a separate normalization pass.
+
+Works on any model built from nn.Sequential stacks (all four architectures),
+however it was loaded: from a state dict, a converted checkpoint or a whole
+pickled module.
+"""
+
+import copy
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
+
+# Largest accepted |fused - original| logit difference, relative to the logit scale
+FUSION_TOLERANCE = 1e-4
+
+FUSABLE = ((nn.Conv2d, nn.BatchNorm2d, fuse_conv_bn_eval), (nn.Linear, nn.BatchNorm1d, fuse_linear_bn_eval))
+
+
+def _fold_pair(layer, norm):
+    for layer_type, norm_type, fuse in FUSABLE:
+        if (type(layer) is layer_type and type(norm) is norm_type and norm.track_running_stats
+                and norm.num_features == layer.weight.shape[0]):
+            return fuse(layer, norm)
+    return None
+
+
+def fold_batch_norm(module, counts=None):
+    """
+    Copy of an eval-mode module with BatchNorm folded and Dropout removed ->
+    (module, {'batch_norm': n folded, 'dropout': n removed}).
+
+    The original is left untouched; unchanged layers are shared with it rather
+    than copied, so only the fused layers allocate new weights.
+    """
+    counts = {'batch_norm': 0, 'dropout': 0} if counts is None else counts
+    children = [(name, fold_batch_norm(child, counts)[0]) for name, child in module.named_children()]
+
+    if isinstance(module, nn.Sequential):
+        layers = []
+        for _, child in children:
+            if isinstance(child, (nn.Dropout, nn.Identity)):
+                counts['dropout'] += isinstance(child, nn.Dropout)
+                continue
+            fused = _fold_pair(layers[-1], child) if layers else None
+            if fused is not None:
+                layers[-1] = fused
+                counts['batch_norm'] += 1
+            else:
+                layers.append(child)
+        return nn.Sequential(*layers), counts
+
+    if not children:
+        return module, counts
+    clone = copy.copy(module)
+    clone._modules = OrderedDict(children)
+    return clone, counts
+
+
+def optimize_for_inference(model, input_size, device):
+    """
+    Fold an eval-mode model and check it against the original on a fixed random
+    batch -> (model to serve, report). If the outputs differ by more than
+    FUSION_TOLERANCE the original model is kept.
+    """
+    model.eval()
+    fused, counts = fold_batch_norm(model)
+    fused.eval()
+
+    sample = torch.randn(2, 3, input_size, input_size, generator=torch.Generator().manual_seed(0)).to(device)
+    with torch.inference_mode():
+        reference = model(sample)
+        max_diff = (fused(sample) - reference).abs().max().item()
+    scale = max(1.0, reference.abs().max().item())
+
+    report = dict(counts, max_logit_diff=max_diff, applied=max_diff <= FUSION_TOLERANCE * scale)
+    if not report['applied']:
+        print(f"⚠️  {type(model).__name__}: fused model differs by {max_diff:.2e}; serving it unfused")
+        return model, report
+    return fused, report
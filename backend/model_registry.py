@@ -0,0 +1,419 @@
+"""
+Model Registry
+Each cancer type is registered once with its loader and image preparation step;
+loading it builds an InferencePlan that is reused by every request.
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+
+import torch
+import torch.nn.functional as F
+
+from decoding import open_image
+from metrics import stage
+from model_optimization import optimize_for_inference
+from quantization import load_quantized
+from reduced_precision import check_bf16
+from preprocess_pool import prepare_array
+
+
+def open_rgb(image_file, plan, tier=None):
+    """Default image preparation: decode to RGB, at reduced size where the format allows"""
+    with stage('decode'):
+        return open_image(
+            image_file, 'RGB',
+            target_size=plan.input_size,
+            max_pixels=plan.max_pixels,
+            downsample=plan.downsample
+        )
+
+
+def resolve_input_size(input_size, default=224):
+    """Handle input_size - could be int or tuple"""
+    if isinstance(input_size, (list, tuple)):
+        return input_size[0] if len(input_size) > 0 else default
+    return input_size
+
+
+def resolve_tier(tiers, default_tier, tier=None):
+    """Effective preprocessing tier for a request, or None if the model has no tiers"""
+    if not tiers:
+        return None
+    tier = tier or default_tier
+    if tier not in tiers:
+        raise ValueError(f"Invalid preprocessing_tier. Must be one of: {', '.join(tiers)}")
+    return tier
+
+
+def model_bytes(model):
+    """Memory held by a model's parameters and buffers"""
+    return sum(t.numel() * t.element_size() for t in itertools.chain(model.parameters(), model.buffers()))
+
+
+class BufferPool:
+    """
+    Reusable float32 (N, C, H, W) input buffers for one model.
+
+    Buffers grow to the largest batch seen, so the pool settles at the
+    scheduler's max batch size and steady-state requests allocate nothing.
+    """
+
+    def __init__(self, image_shape, capacity=2):
+        self.image_shape = tuple(image_shape)
+        self.capacity = capacity
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self, batch_size):
+        with self._lock:
+            for i, buffer in enumerate(self._free):
+                if buffer.shape[0] >= batch_size:
+                    return self._free.pop(i)
+        return torch.empty((batch_size,) + self.image_shape, dtype=torch.float32)
+
+    def release(self, buffer):
+        with self._lock:
+            if len(self._free) < self.capacity:
+                self._free.append(buffer)
+
+
+class InferencePlan:
+    """
+    Preprocessing, forward and postprocessing for one loaded model, prepared at
+    load time so requests do no per-call setup.
+    """
+
+    def __init__(self, model_info, label, prepare, device, default_size=224, max_pixels=None, downsample=True,
+                 tiers=None, default_tier=None):
+        self.model = model_info['model']
+        self.classes = list(model_info['classes'])
+        self.label = label
+        self.prepare = prepare
+        self.device = device
+        self.input_size = resolve_input_size(model_info['input_size'], default_size)
+        self.max_pixels = max_pixels
+        self.downsample = downsample
+        self.tiers = tuple(tiers or ())
+        self.default_tier = default_tier if self.tiers else None
+        self.autocast_dtype = None  # e.g. torch.bfloat16 once the registry has verified it
+
+        # ToTensor + Normalize folded into one in-place multiply-add: x * scale + shift
+        mean = torch.tensor(model_info['mean'], dtype=torch.float32).view(3, 1, 1)
+        std = torch.tensor(model_info['std'], dtype=torch.float32).view(3, 1, 1)
+        self.scale = 1.0 / (255.0 * std)
+        self.shift = -mean / std
+        self.buffers = BufferPool((3, self.input_size, self.input_size))
+
+    def resolve_tier(self, tier=None):
+        return resolve_tier(self.tiers, self.default_tier, tier)
+
+    def preprocess(self, image_file, tier=None):
+        """Image file -> resized uint8 (H, W, 3) array; normalization happens in collate()"""
+        return prepare_array(self, image_file, self.resolve_tier(tier))
+
+    def collate(self, images, out=None):
+        """Normalize uint8 images straight into an (N, 3, H, W) float32 batch"""
+        batch = out if out is not None else torch.empty((len(images), 3, self.input_size, self.input_size))
+        for i, image in enumerate(images):
+            # copy_ converts uint8 -> float32 in place, so no temporaries are allocated
+            batch[i].copy_(torch.from_numpy(image).permute(2, 0, 1))
+            batch[i].mul_(self.scale).add_(self.shift)
+        return batch
+
+    def forward(self, images):
+        """List of preprocess() outputs -> (N, num_classes) softmax probabilities on the CPU"""
+        buffer = self.buffers.acquire(len(images))
+        try:
+            with stage('collate'):
+                batch = self.collate(images, out=buffer[:len(images)])
+            with stage('forward'), torch.no_grad():
+                with torch.autocast(self.device.type, dtype=self.autocast_dtype or torch.bfloat16,
+                                    enabled=self.autocast_dtype is not None):
+                    outputs = self.model(batch.to(self.device))
+                return F.softmax(outputs.float(), dim=-1).cpu()
+        finally:
+            self.buffers.release(buffer)
+
+    def postprocess(self, probabilities):
+        """
+        Softmax probabilities for one image (num_classes,) or a batch
+        (N, num_classes) -> API result dict(s). One .tolist() per call replaces
+        a synchronizing .item() per class.
+        """
+        rows = (probabilities * 100).tolist()
+        results = [self._format(row) for row in ([rows] if probabilities.dim() == 1 else rows)]
+        return results[0] if probabilities.dim() == 1 else results
+
+    def _format(self, percentages):
+        best = max(range(len(percentages)), key=percentages.__getitem__)
+        return {
+            'predicted_class': self.classes[best],
+            'confidence': percentages[best],
+            'all_probabilities': dict(zip(self.classes, percentages)),
+            'cancer_type': self.label
+        }
+
+
+class ModelRegistry(dict):
+    """
+    Resident models keyed by cancer_type.
+
+    Behaves like the plain MODELS dict it replaces (cancer_type -> model info
+    dict); each entry additionally carries its InferencePlan under 'plan'.
+    acquire() loads a model on first use. With a memory_budget (bytes), the
+    least-recently-used models that are not pinned are evicted to stay within
+    it and load again on their next request. With optimize, each model has its
+    BatchNorm layers folded and Dropout removed at load time (see
+    model_optimization.py), unless its converted checkpoint is stored folded. Models marked with quantize() are served from their
+    calibrated INT8 version in quantized_dir when it passes the min_agreement
+    gate, and in FP32 otherwise. Models marked with use_bf16() run under
+    bfloat16 autocast when the hardware supports it and their predictions agree
+    with FP32 on the calibration set (bf16_min_agreement). Adding a cancer type
+    is one register() call.
+    """
+
+    def __init__(self, device, max_pixels=None, downsample=True, memory_budget=0, optimize=False,
+                 quantized_dir=None, min_agreement=0.99, calibration_dir=None, bf16_min_agreement=0.99):
+        super().__init__()
+        self.device = device
+        self.max_pixels = max_pixels
+        self.downsample = downsample
+        self.memory_budget = memory_budget
+        self.optimize = optimize
+        self.quantized_dir = quantized_dir
+        self.min_agreement = min_agreement
+        self.calibration_dir = calibration_dir
+        self.bf16_min_agreement = bf16_min_agreement
+        self.specs = {}
+        self.pinned = set()
+        self.quantized = set()
+        self.bf16 = set()
+        self.states = {}    # cancer_type -> unloaded / loading / loaded / evicted / failed
+        self.errors = {}
+        self.sizes = {}
+        self.metadata = {}  # model info without model and plan, kept across evictions
+        self.evictions = 0
+
+        self._recent = OrderedDict()  # resident cancer types, least recently used first
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._evict_listeners = []
+
+    def register(self, cancer_type, loader, label, prepare=open_rgb, default_size=224, tiers=None, default_tier=None):
+        """
+        loader() -> model info dict with 'model', 'classes', 'input_size',
+        'mean' and 'std'; prepare(image_file, plan, tier) -> PIL RGB image
+        ready to resize, decoded within plan.max_pixels. `tiers` names the
+        preprocessing quality tiers prepare() understands, if any.
+        """
+        if tiers and default_tier not in tiers:
+            raise ValueError(f"Unknown default tier {default_tier!r} for {cancer_type}; expected one of: {', '.join(tiers)}")
+        self.specs[cancer_type] = {
+            'loader': loader,
+            'label': label,
+            'prepare': prepare,
+            'default_size': default_size,
+            'tiers': tuple(tiers or ()),
+            'default_tier': default_tier
+        }
+        self.states.setdefault(cancer_type, 'unloaded')
+        self._load_locks.setdefault(cancer_type, threading.Lock())
+
+    def _require_registered(self, action, cancer_types):
+        unknown = [name for name in cancer_types if name not in self.specs]
+        if unknown:
+            raise ValueError(f"Cannot {action} unknown model(s): {', '.join(unknown)}")
+
+    def pin(self, *cancer_types):
+        """Never evict these models"""
+        self._require_registered('pin', cancer_types)
+        self.pinned.update(cancer_types)
+
+    def quantize(self, *cancer_types):
+        """Serve these models at INT8 when a calibrated version passes the agreement gate"""
+        self._require_registered('quantize', cancer_types)
+        self.quantized.update(cancer_types)
+
+    def use_bf16(self, *cancer_types):
+        """Run these models under bfloat16 autocast when it is supported and agrees with FP32"""
+        self._require_registered('use bf16 for', cancer_types)
+        self.bf16.update(cancer_types)
+
+    def on_evict(self, callback):
+        """callback(cancer_type) runs after a model is evicted, outside the registry lock"""
+        self._evict_listeners.append(callback)
+        return callback
+
+    def registered(self):
+        return list(self.specs)
+
+    def label(self, cancer_type):
+        return self.specs[cancer_type]['label']
+
+    def resolve_tier(self, cancer_type, tier=None):
+        spec = self.specs[cancer_type]
+        return resolve_tier(spec['tiers'], spec['default_tier'], tier)
+
+    def acquire(self, cancer_type):
+        """Model info for a registered cancer type, loading it on first use; None if it failed to load"""
+        with self._lock:
+            model_info = self.get(cancer_type)
+            if model_info is not None:
+                self._recent.move_to_end(cancer_type)
+                return model_info
+
+        # One loader per model; concurrent first requests wait for it
+        with self._load_locks[cancer_type]:
+            model_info = self.get(cancer_type)
+            if model_info is None:
+                if self.states[cancer_type] == 'failed':
+                    return None  # Retried only through an explicit load()/reload
+                try:
+                    model_info = self.load(cancer_type)
+                except Exception as e:
+                    print(f"✗ Error loading {cancer_type} model: {e}")
+                    return None
+        with self._lock:
+            if cancer_type in self._recent:
+                self._recent.move_to_end(cancer_type)
+        return model_info
+
+    def info(self, cancer_type):
+        """Model info without the model: resident, kept from before an eviction, or loaded now"""
+        return self.get(cancer_type) or self.metadata.get(cancer_type) or self.acquire(cancer_type)
+
+    def load(self, cancer_type):
+        """Load (or reload) one model and build its inference plan"""
+        spec = self.specs[cancer_type]
+        with self._lock:
+            self.states[cancer_type] = 'loading'
+            # Make room first when the size is known from an earlier load
+            expected = 0 if cancer_type in self else self.sizes.get(cancer_type, 0)
+            evicted = self._evict_over_budget(expected, keep=cancer_type)
+        self._notify_evicted(evicted)
+
+        try:
+            model_info = spec['loader']()
+            model_info.setdefault('backend', 'torch')
+            model_info['precision'] = 'fp32'
+            # INT8, BatchNorm folding and bf16 autocast apply to PyTorch models only
+            eager = model_info['backend'] == 'torch'
+            if eager and cancer_type in self.quantized:
+                self._activate_int8(cancer_type, model_info)
+            # Converted checkpoints may already be stored folded (see checkpoints.py)
+            if eager and self.optimize and model_info['precision'] == 'fp32' and 'optimization' not in model_info:
+                if model_info.get('memory_mapped'):
+                    print(f"⚠️  {self.label(cancer_type)} checkpoint is stored unfused; folding copies its weights "
+                          f"out of the shared mapping. Re-run convert_checkpoints.py to store it folded")
+                size = resolve_input_size(model_info['input_size'], spec['default_size'])
+                model_info['model'], model_info['optimization'] = optimize_for_inference(
+                    model_info['model'], size, self.device
+                )
+            model_info['plan'] = InferencePlan(
+                model_info, spec['label'], spec['prepare'], self.device, spec['default_size'],
+                max_pixels=self.max_pixels, downsample=self.downsample,
+                tiers=spec['tiers'], default_tier=spec['default_tier']
+            )
+            if eager and cancer_type in self.bf16 and model_info['precision'] == 'fp32':
+                self._activate_bf16(cancer_type, model_info)
+        except Exception as e:
+            with self._lock:
+                # A failed reload keeps serving the previous model
+                self.states[cancer_type] = 'loaded' if cancer_type in self else 'failed'
+                self.errors[cancer_type] = str(e)
+            raise
+
+        with self._lock:
+            self[cancer_type] = model_info
+            # Backends whose weights are not nn.Module parameters report their own size
+            self.sizes[cancer_type] = model_info.get('model_bytes') or model_bytes(model_info['model'])
+            self.metadata[cancer_type] = {k: v for k, v in model_info.items() if k not in ('model', 'plan')}
+            self.states[cancer_type] = 'loaded'
+            self.errors.pop(cancer_type, None)
+            self._recent[cancer_type] = True
+            self._recent.move_to_end(cancer_type)
+            evicted = self._evict_over_budget(0, keep=cancer_type)
+        self._notify_evicted(evicted)
+        return model_info
+
+    def _activate_int8(self, cancer_type, model_info):
+        model, report = load_quantized(self.quantized_dir, cancer_type, model_info, self.min_agreement, self.device)
+        model_info['quantization'] = report
+        if model is None:
+            print(f"⚠️  {self.label(cancer_type)} model served at FP32: {report['status']}")
+            return
+        model_info['model'] = model
+        model_info['model_bytes'] = report['model_bytes']
+        model_info['precision'] = 'int8'
+        print(f"✓ {self.label(cancer_type)} model served at INT8 (top-1 agreement {report['agreement']:.2%})")
+
+    def _activate_bf16(self, cancer_type, model_info):
+        report = check_bf16(model_info['plan'], self.calibration_dir, self.bf16_min_agreement)
+        model_info['bf16'] = report
+        if report['status'] != 'active':
+            print(f"⚠️  {self.label(cancer_type)} model served at FP32: {report['status']}")
+            return
+        model_info['plan'].autocast_dtype = torch.bfloat16
+        model_info['precision'] = 'bf16'
+        print(f"✓ {self.label(cancer_type)} model served at BF16 (top-1 agreement {report['agreement']:.2%}"
+              f" on {report['calibration']})")
+
+    def preload(self, cancer_types):
+        for cancer_type in cancer_types:
+            self.acquire(cancer_type)
+        return self
+
+    def load_all(self):
+        return self.preload(self.specs)
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(self.sizes[cancer_type] for cancer_type in self)
+
+    def _evict_over_budget(self, incoming, keep):
+        """Evict least-recently-used unpinned models until `incoming` more bytes fit; call with the lock held"""
+        evicted = []
+        if not self.memory_budget:
+            return evicted
+        for cancer_type in list(self._recent):
+            if self.resident_bytes() + incoming <= self.memory_budget:
+                break
+            if cancer_type == keep or cancer_type in self.pinned:
+                continue
+            del self[cancer_type]
+            del self._recent[cancer_type]
+            self.states[cancer_type] = 'evicted'
+            self.evictions += 1
+            evicted.append(cancer_type)
+        if self.resident_bytes() + incoming > self.memory_budget:
+            print(f"⚠️  Resident models exceed the memory budget ({self.memory_budget / 2**20:.0f} MB); "
+                  f"only pinned models and {keep} are left")
+        return evicted
+
+    def _notify_evicted(self, evicted):
+        for cancer_type in evicted:
+            print(f"✓ Evicted {cancer_type} model (least recently used)")
+            for callback in self._evict_listeners:
+                callback(cancer_type)
+
+    def stats(self):
+        with self._lock:
+            models = {}
+            for cancer_type in self.specs:
+                entry = {'state': self.states[cancer_type], 'pinned': cancer_type in self.pinned}
+                if cancer_type in self.metadata:
+                    entry['backend'] = self.metadata[cancer_type]['backend']
+                    entry['precision'] = self.metadata[cancer_type]['precision']
+                if cancer_type in self.sizes:
+                    entry['size_mb'] = round(self.sizes[cancer_type] / 2**20, 1)
+                if cancer_type in self.errors:
+                    entry['error'] = self.errors[cancer_type]
+                models[cancer_type] = entry
+            return {
+                'memory_budget_mb': round(self.memory_budget / 2**20, 1) if self.memory_budget else None,
+                'resident_mb': round(self.resident_bytes() / 2**20, 1),
+                'evictions': self.evictions,
+                'models': models
+            }
@@ -0,0 +1,189 @@
+"""
+ONNX Runtime Backend
+Serves models from ONNX exports through ONNX Runtime on the CPU instead of
+PyTorch (INFERENCE_BACKEND=onnxruntime). ORT applies its own graph
+optimizations (Conv+BN folding, activation fusion, constant folding) when the
+session is created and has a lower per-call overhead than eager PyTorch.
+
+export_onnx.py writes, next to the converted checkpoints:
+  <cancer_type>.onnx        graph with a dynamic batch dimension
+                            (input 'input': N x 3 x H x W float32, output 'logits')
+  <cancer_type>.onnx.json   manifest: architecture, classes, input_size, mean/std,
+                            version, accuracy, opset, fingerprint of the source model
+"""
+
+import copy
+import importlib.util
+import json
+import os
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+from checkpoints import checkpoint_fingerprint
+
+ONNX_FORMAT = 1
+ONNX_OPSET = 17
+
+
+def onnxruntime_available():
+    return importlib.util.find_spec('onnxruntime') is not None
+
+
+def onnx_available():
+    """torch.onnx.export needs the onnx package; serving only needs onnxruntime"""
+    return importlib.util.find_spec('onnx') is not None
+
+
+def onnx_paths(checkpoint_dir, cancer_type):
+    checkpoint_dir = Path(checkpoint_dir)
+    return checkpoint_dir / f'{cancer_type}.onnx', checkpoint_dir / f'{cancer_type}.onnx.json'
+
+
+def _pool_matrix(size_in, size_out):
+    """(size_out, size_in) matrix averaging the same windows as adaptive_avg_pool along one axis"""
+    matrix = torch.zeros(size_out, size_in)
+    for i in range(size_out):
+        start, end = (i * size_in) // size_out, -(-(i + 1) * size_in // size_out)
+        matrix[i, start:end] = 1.0 / (end - start)
+    return matrix
+
+
+class AdaptiveAvgPoolMatrix(nn.Module):
+    """
+    AdaptiveAvgPool2d for one fixed input size, as two matrix products. ONNX has
+    no adaptive pooling when the output size does not divide the input size
+    (LungCNN at 224px pools 14x14 -> 4x4), but the windows are fixed once the
+    input size is.
+    """
+
+    def __init__(self, size_in, size_out):
+        super().__init__()
+        self.register_buffer('rows', _pool_matrix(size_in[0], size_out[0]))
+        self.register_buffer('cols', _pool_matrix(size_in[1], size_out[1]).t().contiguous())
+
+    def forward(self, x):
+        return self.rows @ x @ self.cols
+
+
+def exportable(model, input_size):
+    """The model, or a copy with adaptive pools ONNX cannot express replaced by AdaptiveAvgPoolMatrix"""
+    shapes = {}
+    hooks = [
+        module.register_forward_hook(
+            lambda module, inputs, output, name=name: shapes.__setitem__(name, (inputs[0].shape[-2:], output.shape[-2:]))
+        )
+        for name, module in model.named_modules() if isinstance(module, nn.AdaptiveAvgPool2d)
+    ]
+    try:
+        with torch.no_grad():
+            model(torch.zeros(1, 3, input_size, input_size))
+    finally:
+        for hook in hooks:
+            hook.remove()
+
+    uneven = {name: sizes for name, sizes in shapes.items() if any(i % o for i, o in zip(*sizes))}
+    if not uneven:
+        return model
+    model = copy.deepcopy(model)
+    for name, (size_in, size_out) in uneven.items():
+        parent, _, child = name.rpartition('.')
+        setattr(model.get_submodule(parent), child, AdaptiveAvgPoolMatrix(tuple(size_in), tuple(size_out)))
+    return model
+
+
+def export_onnx(model, path, input_size, opset=ONNX_OPSET):
+    """Export an eval-mode model for a fixed input size with a dynamic batch dimension"""
+    model = exportable(model.eval().cpu(), input_size)
+    sample = torch.zeros(1, 3, input_size, input_size)
+    tmp_path = f'{path}.tmp'
+    torch.onnx.export(
+        model, sample, tmp_path,
+        input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=opset, do_constant_folding=True
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_onnx_manifest(checkpoint_dir, cancer_type, model_info, input_size, opset=ONNX_OPSET):
+    """Export a loaded model info dict to <cancer_type>.onnx + .onnx.json"""
+    model_path, manifest_path = onnx_paths(checkpoint_dir, cancer_type)
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    export_onnx(model_info['model'], model_path, input_size, opset)
+
+    manifest = {
+        'format': ONNX_FORMAT,
+        'architecture': type(model_info['model']).__name__,
+        'classes': [str(name) for name in model_info['classes']],
+        'input_size': model_info['input_size'],
+        'mean': [float(v) for v in model_info['mean']],
+        'std': [float(v) for v in model_info['std']],
+        'version': model_info.get('version', 'unknown'),
+        'test_accuracy': model_info.get('test_accuracy'),
+        'opset': opset,
+        'source_fingerprint': model_info.get('fingerprint')
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return model_path
+
+
+class OnnxModel:
+    """
+    An ONNX Runtime session that is called like an eval-mode model:
+    float32 (N, 3, H, W) tensor -> (N, num_classes) logits tensor.
+    session.run is thread-safe, so one instance serves every request thread.
+    """
+
+    def __init__(self, path, threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = Path(path)
+        self.session = ort.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, batch):
+        logits, = self.session.run(None, {'input': batch.detach().cpu().numpy()})
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+
+class StaleExport(Exception):
+    """The ONNX export was made from a different checkpoint than the one now on disk"""
+
+
+def load_onnx(checkpoint_dir, cancer_type, threads=0, source_fingerprint=None):
+    """
+    Model info dict served by ONNX Runtime, or None if the model has not been
+    exported. source_fingerprint identifies the PyTorch checkpoint the export
+    must come from; StaleExport is raised if it came from another one.
+    """
+    model_path, manifest_path = onnx_paths(checkpoint_dir, cancer_type)
+    if not (model_path.exists() and manifest_path.exists()):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != ONNX_FORMAT:
+        raise ValueError(f"{manifest_path}: unsupported ONNX manifest format {manifest.get('format')!r}")
+    if source_fingerprint is not None and manifest.get('source_fingerprint') != source_fingerprint:
+        raise StaleExport(f'{model_path} was exported from a different {cancer_type} checkpoint; re-run export_onnx.py')
+
+    model_info = {
+        key: value for key, value in manifest.items()
+        if key not in ('format', 'opset', 'source_fingerprint') and value is not None
+    }
+    model_info['model'] = OnnxModel(model_path, threads)
+    model_info['backend'] = 'onnxruntime'
+    model_info['model_bytes'] = model_path.stat().st_size
+    model_info['fingerprint'] = checkpoint_fingerprint(model_path, manifest_path)
+    return model_info
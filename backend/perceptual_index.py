@@ -0,0 +1,154 @@
+"""
+Perceptual-Hash Near-Duplicate Index
+Recognizes re-encoded or rescaled copies of a scan that was already classified
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from decoding import open_image
+
+HASH_SIZE = 16  # 16x16 gradient bits -> 256-bit hash
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Difference hash of a PIL image.
+
+    The image is reduced to (hash_size + 1) x hash_size grayscale and each bit
+    records whether a pixel is brighter than its right-hand neighbour, which is
+    stable under re-encoding, mild rescaling and brightness shifts.
+    """
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(''.join('1' if b else '0' for b in bits), 2)
+
+
+def dhash_stream(stream, hash_size=HASH_SIZE, max_pixels=None):
+    """dHash of an uploaded image, leaving the stream rewound"""
+    stream.seek(0)
+    try:
+        # JPEG can decode straight to a small grayscale image via DCT scaling
+        image = open_image(stream, 'L', target_size=hash_size * 4, max_pixels=max_pixels)
+        return dhash(image, hash_size)
+    finally:
+        stream.seek(0)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance"""
+
+    def __init__(self):
+        self.root = None  # node: (hash, {distance: child})
+
+    def add(self, value):
+        if self.root is None:
+            self.root = (value, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (value, {})
+                return
+            node = child
+
+    def nearest(self, value, max_distance):
+        """Closest stored hash within max_distance as (distance, hash), or None"""
+        best = None
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, node[0])
+                if distance == 0:
+                    break
+            # Triangle inequality: only children within the search radius can match
+            radius = best[0] if best is not None else max_distance
+            for child_distance, child in node[1].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return best
+
+
+class NearDuplicateIndex:
+    """
+    Per-model perceptual-hash index mapping image hashes to stored predictions.
+
+    Each (cancer_type, model_tag) gets its own bounded index; the oldest
+    entries are dropped first and the BK-tree is rebuilt lazily afterwards.
+    """
+
+    def __init__(self, thresholds, max_entries=4096):
+        self.thresholds = dict(thresholds)
+        self.max_entries = max(1, int(max_entries))
+
+        self._indexes = {}  # (cancer_type, model_tag) -> [OrderedDict, BKTree or None]
+        self._lock = threading.Lock()
+        self._counters = {'lookups': 0, 'matches': 0}
+
+    def enabled(self, cancer_type):
+        threshold = self.thresholds.get(cancer_type)
+        return threshold is not None and threshold >= 0
+
+    def lookup(self, cancer_type, model_tag, image_hash):
+        """Return (result, distance) for the closest stored image within the threshold, or None"""
+        with self._lock:
+            self._counters['lookups'] += 1
+            index = self._indexes.get((cancer_type, model_tag))
+            if index is None:
+                return None
+            entries, tree = index
+            if tree is None:
+                tree = BKTree()
+                for stored_hash in entries:
+                    tree.add(stored_hash)
+                index[1] = tree
+
+            match = tree.nearest(image_hash, self.thresholds[cancer_type])
+            if match is None:
+                return None
+            distance, stored_hash = match
+            entries.move_to_end(stored_hash)
+            self._counters['matches'] += 1
+            return dict(entries[stored_hash]), distance
+
+    def add(self, cancer_type, model_tag, image_hash, result):
+        with self._lock:
+            index = self._indexes.setdefault((cancer_type, model_tag), [OrderedDict(), BKTree()])
+            entries, tree = index
+            if image_hash not in entries and tree is not None:
+                tree.add(image_hash)
+            entries[image_hash] = dict(result)
+            entries.move_to_end(image_hash)
+
+            if len(entries) > self.max_entries:
+                # Drop the oldest tenth at once so rebuilds stay rare
+                for _ in range(max(1, self.max_entries // 10)):
+                    entries.popitem(last=False)
+                index[1] = None
+
+    def invalidate(self, cancer_type=None):
+        with self._lock:
+            for key in list(self._indexes):
+                if cancer_type is None or key[0] == cancer_type:
+                    del self._indexes[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = {key[0]: len(index[0]) for key, index in self._indexes.items()}
+        stats['thresholds'] = dict(self.thresholds)
+        return stats
@@ -0,0 +1,148 @@
+"""
+Content-Addressed Prediction Cache
+In-memory LRU tier with TTL, plus an optional on-disk tier that survives restarts
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Caches prediction results keyed on image hash, cancer_type and model tag.
+
+    Keys look like '<cancer_type>/<model_tag>/<sha256>', so results for other
+    weights are never hit and everything cached for one cancer_type can be
+    dropped at once with invalidate().
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, disk_dir=None):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.disk_dir = disk_dir
+
+        self._entries = OrderedDict()  # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_hash, cancer_type, model_tag):
+        return f'{cancer_type}/{model_tag}/{image_hash}'
+
+    def get(self, key):
+        """Return a cached result or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return dict(result)
+                del self._entries[key]
+                self._counters['expirations'] += 1
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['disk_hits'] += 1
+            self._store(key, entry)
+        return dict(entry[1])
+
+    def put(self, key, result):
+        entry = (time.time(), dict(result))
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def invalidate(self, cancer_type=None):
+        """Drop cached results for one cancer_type, or everything"""
+        prefix = f'{cancer_type}/' if cancer_type else ''
+        with self._lock:
+            stale = [key for key in self._entries if key.startswith(prefix)]
+            for key in stale:
+                del self._entries[key]
+            self._counters['invalidations'] += 1
+
+        if self.disk_dir:
+            target = os.path.join(self.disk_dir, cancer_type) if cancer_type else self.disk_dir
+            shutil.rmtree(target, ignore_errors=True)
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats.update(
+            max_entries=self.max_entries,
+            ttl_seconds=self.ttl,
+            disk_tier=bool(self.disk_dir),
+            hit_ratio=hits / lookups if lookups else 0.0
+        )
+        return stats
+
+    def _store(self, key, entry):
+        """Insert into the memory tier; caller holds the lock"""
+        if self.max_entries == 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    # ---- disk tier ----
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, *key.split('/')) + '.json'
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - data['stored_at'] > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return data['stored_at'], data['result']
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write atomically so a concurrent reader never sees a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'stored_at': entry[0], 'result': entry[1]}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  Could not write prediction cache entry: {e}")
@@ -0,0 +1,216 @@
+"""
+Preprocessing Process Pool
+Runs decoding and image preparation in worker processes so CPU-heavy brain
+preprocessing does not compete with request threads and torch for the GIL.
+Results are written into shared-memory slots owned by the parent, so only the
+upload bytes are pickled on the way in and nothing is pickled on the way out.
+"""
+
+import io
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from metrics import add_stages, collect_stages, stage
+
+
+def prepare_array(plan, image_file, tier=None):
+    """prepare() + resize to the model input size -> uint8 (H, W, 3) array"""
+    image = plan.prepare(image_file, plan, tier)
+    with stage('resize'):
+        if image.size != (plan.input_size, plan.input_size):
+            # Same resampling as transforms.Resize on a PIL image, but on uint8
+            image = image.resize((plan.input_size, plan.input_size), Image.BILINEAR)
+        return np.array(image)
+
+
+class PreprocessSpec:
+    """The picklable part of an InferencePlan that prepare() reads"""
+
+    __slots__ = ('prepare', 'input_size', 'max_pixels', 'downsample')
+
+    def __init__(self, prepare, input_size, max_pixels=None, downsample=True):
+        self.prepare = prepare
+        self.input_size = input_size
+        self.max_pixels = max_pixels
+        self.downsample = downsample
+
+    @classmethod
+    def from_plan(cls, plan):
+        return cls(plan.prepare, plan.input_size, plan.max_pixels, plan.downsample)
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class SharedSlots:
+    """
+    Reusable shared-memory blocks keyed by size.
+
+    Blocks are created by the parent and handed back after each use, so in
+    steady state no segments are created or unlinked per request.
+    """
+
+    def __init__(self):
+        self._free = {}
+        self._all = []
+        self._lock = threading.Lock()
+
+    def acquire(self, nbytes):
+        with self._lock:
+            free = self._free.get(nbytes)
+            if free:
+                return free.pop()
+            block = SharedMemory(create=True, size=nbytes)
+            self._all.append(block)
+            return block
+
+    def release(self, block):
+        with self._lock:
+            self._free.setdefault(block.size, []).append(block)
+
+    def close(self):
+        with self._lock:
+            for block in self._all:
+                try:
+                    block.close()
+                except BufferError:
+                    pass  # An array still views it; the mapping goes with the array
+                block.unlink()
+            self._all.clear()
+            self._free.clear()
+
+
+# Worker-side state: shared-memory blocks this worker has attached to
+_attached = {}
+
+
+def _init_worker(cv2_threads):
+    # The pool provides the parallelism; keep OpenCV from oversubscribing cores
+    cv2.setNumThreads(cv2_threads)
+
+
+def _preprocess_into(spec, data, tier, block_name):
+    """-> (array shape, stage timings); the array itself goes into the shared block"""
+    with collect_stages() as timings:
+        array = prepare_array(spec, io.BytesIO(data), tier)
+    block = _attached.get(block_name)
+    if block is None:
+        block = _attached[block_name] = SharedMemory(name=block_name)
+    np.ndarray(array.shape, dtype=np.uint8, buffer=block.buf)[...] = array
+    return array.shape, timings
+
+
+def _ping():
+    return True
+
+
+class PreprocessPool:
+    """
+    Worker processes running InferencePlan preprocessing, with a separate
+    lane of `workers` processes per cancer type so a queue of slow brain scans
+    never delays lung/skin uploads.
+
+    Workers are forked by start(), which must run before the server starts
+    any threads or runs a torch forward pass (its OpenMP pool does not survive
+    a fork): spawned workers would re-import the app (and its models), and
+    forking a threaded process is unsafe. With workers=0, for unknown
+    lanes, if a lane breaks, or where fork is unavailable (Windows),
+    preprocessing runs inline on the calling thread.
+    """
+
+    def __init__(self, workers, cv2_threads=1):
+        self.workers = max(0, int(workers))
+        self.cv2_threads = cv2_threads
+        self.slots = SharedSlots()
+        self._executors = {}
+
+    @property
+    def enabled(self):
+        return bool(self._executors)
+
+    def start(self, lanes):
+        if self.workers == 0:
+            return self
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            # Windows: spawned workers would re-import the app, so preprocess inline instead
+            print("⚠️  Preprocessing pool needs the 'fork' start method, which this platform lacks; "
+                  "preprocessing inline")
+            self.workers = 0
+            return self
+        # Children must share the parent's tracker, or it would unlink live slots when they exit
+        resource_tracker.ensure_running()
+        context = multiprocessing.get_context('fork')
+        for lane in lanes:
+            if lane in self._executors:
+                continue
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.cv2_threads,)
+            )
+            # Fork every worker now rather than lazily from a request thread
+            for future in [executor.submit(_ping) for _ in range(self.workers)]:
+                future.result()
+            self._executors[lane] = executor
+        return self
+
+    @contextmanager
+    def preprocess(self, lane, plan, image_file, tier=None):
+        """
+        Yield the uint8 (H, W, 3) model input for image_file. In pool mode the
+        array views a shared-memory slot that is reused once the block exits,
+        so it must not be kept beyond it.
+        """
+        executor = self._executors.get(lane)
+        if executor is None:
+            yield plan.preprocess(image_file, tier)
+            return
+
+        tier = plan.resolve_tier(tier)
+        image_file.seek(0)
+        data = image_file.read()
+        block = self.slots.acquire(plan.input_size * plan.input_size * 3)
+        try:
+            try:
+                started = time.perf_counter()
+                shape, timings = executor.submit(
+                    _preprocess_into, PreprocessSpec.from_plan(plan), data, tier, block.name
+                ).result()
+                # Time in the worker goes to its stages; the rest is hand-off and lane queueing
+                add_stages(dict(timings, pool_wait=time.perf_counter() - started - sum(timings.values())))
+            except BrokenProcessPool:
+                print(f"⚠️  {lane} preprocessing pool broke; falling back to inline preprocessing")
+                self._executors.pop(lane, None)
+                yield plan.preprocess(io.BytesIO(data), tier)
+                return
+            yield np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+        finally:
+            self.slots.release(block)
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._executors.clear()
+        self.slots.close()
+
+    def stats(self):
+        return {
+            'mode': 'process' if self.enabled else 'inline',
+            'workers_per_lane': self.workers if self.enabled else 0,
+            'lanes': sorted(self._executors)
+        }
@@ -0,0 +1,313 @@
+"""
+Per-Request Profiling
+Profiles single predictions end to end into Chrome-trace JSON files, which
+open in Perfetto (ui.perfetto.dev) or chrome://tracing:
+
+  - torch operator timings (torch.profiler) for the model forward
+  - Python-level call timings (sys.setprofile), including the OpenCV and
+    scikit-image calls made during preprocessing
+
+A request is traced when it carries the admin token in the X-Profile-Token
+header, or when it is picked by the sampling rate. torch has one profiler per
+process, so only one request is traced at a time; requests picked while a
+trace is in progress run untraced. A traced request runs its preprocessing and
+forward pass on its own thread, outside the worker pool and the batcher. The
+Python calls in a trace are that thread's only; torch operators run by other
+requests in the meantime are recorded too, under their own thread ids.
+
+A profiler error is printed and the request completes without its trace.
+
+Nothing is set up while no request is being traced: the check on the predict
+path is one comparison when profiling is not configured.
+"""
+
+import hmac
+import inspect
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+TRACE_NAME = re.compile(r'^trace-(\d+)-([a-z0-9_]+)-([0-9a-f]{8})\.json$')
+
+_local = threading.local()
+_active = 0  # traces in progress in this process (0 or 1); read without the lock on the hot path
+_profiler_lock = threading.Lock()  # held by the one trace the torch profiler can record at a time
+
+
+def tracing():
+    """True on a thread that is inside RequestTracer.trace()"""
+    return _active > 0 and getattr(_local, 'trace', None) is not None
+
+
+_c_modules = {}  # module-level C function -> name of the module it was found in
+
+
+def c_function_name(function):
+    """
+    'module.name' for a C function. Methods already carry their type in
+    __qualname__ (list.append). Extension functions such as cv2's may have
+    neither __module__ nor a __self__, so their module is looked up once.
+    """
+    name = getattr(function, '__qualname__', None) or repr(function)
+    module = getattr(function, '__module__', None)
+    if module:
+        return f'{module}.{name}'
+    owner = getattr(function, '__self__', None)
+    if owner is not None and not inspect.ismodule(owner):
+        return name
+    if owner is not None:
+        return f'{owner.__name__}.{name}'
+    if function not in _c_modules:
+        module = inspect.getmodule(function)
+        if module is None:
+            module = next((m for m in list(sys.modules.values())
+                           if getattr(m, getattr(function, '__name__', ''), None) is function), None)
+        _c_modules[function] = getattr(module, '__name__', 'builtins')
+    return f'{_c_modules[function]}.{name}'
+
+
+@contextmanager
+def _tracing(trace):
+    """Mark this thread as tracing, so predict_image() keeps its work on it; call with _profiler_lock held"""
+    global _active
+    _active += 1
+    _local.trace = trace
+    try:
+        yield
+    finally:
+        _local.trace = None
+        _active -= 1
+
+
+class PythonTracer:
+    """
+    Records Python and C function calls on the current thread as Chrome-trace
+    complete events. Calls shorter than min_duration_us are dropped, and at
+    most max_events are kept, so traces of heavy preprocessing stay readable.
+    """
+
+    def __init__(self, min_duration_us=20, max_events=20000):
+        self.min_duration = min_duration_us * 1000
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self._stack = []
+
+    def start(self):
+        sys.setprofile(self._callback)
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def _callback(self, frame, event, arg):
+        if event == 'call':
+            code = frame.f_code
+            self._stack.append((time.perf_counter_ns(), code.co_qualname,
+                                f'{os.path.basename(code.co_filename)}:{code.co_firstlineno}'))
+        elif event == 'c_call':
+            self._stack.append((time.perf_counter_ns(), c_function_name(arg), None))
+        elif self._stack:
+            # return / c_return / c_exception; frames entered before start() have no entry
+            start, name, location = self._stack.pop()
+            duration = time.perf_counter_ns() - start
+            if duration < self.min_duration:
+                return
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            self.events.append((start, duration, name, location))
+
+    def chrome_events(self, pid, tid, epoch_offset_ns):
+        """Events as Chrome-trace dicts, with perf_counter times moved onto the epoch clock torch uses"""
+        return [
+            {
+                'ph': 'X', 'cat': 'python', 'name': name, 'pid': pid, 'tid': tid,
+                'ts': (start + epoch_offset_ns) / 1000, 'dur': duration / 1000,
+                **({'args': {'location': location}} if location else {})
+            }
+            for start, duration, name, location in self.events
+        ]
+
+
+class Trace:
+    """A trace in progress; `id` names its file once `written`"""
+
+    def __init__(self, trace_id, cancer_type, reason):
+        self.id = trace_id
+        self.cancer_type = cancer_type
+        self.reason = reason
+        self.metadata = {}
+        self.record = None  # the torch record_function spanning the request
+        self.written = False
+
+
+class RequestTracer:
+    """
+    trace_dir: where traces are written; sample_rate: fraction of predictions
+    traced (0 = none); admin_token: value of X-Profile-Token that forces a
+    trace (None = header ignored); keep: newest traces kept on disk.
+    """
+
+    def __init__(self, trace_dir, sample_rate=0.0, admin_token=None, keep=100):
+        self.trace_dir = Path(trace_dir)
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        self.admin_token = admin_token or None
+        self.keep = max(1, int(keep))
+        self.enabled = self.sample_rate > 0 or self.admin_token is not None
+        self.recent = {}  # trace id -> details of traces written by this process
+        self._lock = threading.Lock()
+
+    def is_admin(self, token):
+        return bool(self.admin_token and token) and hmac.compare_digest(token, self.admin_token)
+
+    def wanted(self, token=None):
+        """-> reason to trace this request ('admin' / 'sampled'), or None"""
+        if not self.enabled:
+            return None
+        if token is not None and self.is_admin(token):
+            return 'admin'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    @contextmanager
+    def trace(self, cancer_type, reason):
+        """
+        Profile the block on this thread and write it to the trace directory.
+        Yields the Trace, or None when the block runs untraced because another
+        trace is in progress or the profiler failed to start.
+        """
+        if not _profiler_lock.acquire(blocking=False):
+            yield None
+            return
+        try:
+            trace = Trace(f'trace-{int(time.time() * 1000)}-{cancer_type}-{uuid.uuid4().hex[:8]}.json',
+                          cancer_type, reason)
+            profiler = self._start_profiler(trace)
+            if profiler is None:
+                yield None
+                return
+            python = PythonTracer()
+            epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+            started = time.perf_counter()
+            try:
+                with _tracing(trace):
+                    python.start()
+                    try:
+                        yield trace
+                    finally:
+                        python.stop()
+            finally:
+                stopped = self._stop_profiler(trace, profiler)
+            if stopped:
+                try:
+                    self._write(trace, profiler, python, epoch_offset_ns, (time.perf_counter() - started) * 1000)
+                except Exception as e:
+                    print(f"⚠️  Could not write profiler trace {trace.id}: {e}")
+        finally:
+            _profiler_lock.release()
+
+    @staticmethod
+    def _start_profiler(trace):
+        """-> running torch profiler, or None after printing why it could not start"""
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+
+        profiler = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+        try:
+            profiler.start()
+        except Exception as e:
+            print(f"⚠️  Profiler failed to start; {trace.cancer_type} request runs untraced: {e}")
+            return None
+        trace.record = torch.profiler.record_function(f'predict {trace.cancer_type}')
+        trace.record.__enter__()
+        return profiler
+
+    @staticmethod
+    def _stop_profiler(trace, profiler):
+        """-> True if the profiler stopped cleanly and its events can be exported"""
+        try:
+            trace.record.__exit__(None, None, None)
+            profiler.stop()
+            return True
+        except Exception as e:
+            print(f"⚠️  Profiler failed to stop; dropping trace {trace.id}: {e}")
+            return False
+
+    def _write(self, trace, profiler, python, epoch_offset_ns, duration_ms):
+        self.trace_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=self.trace_dir) as scratch:
+            torch_path = os.path.join(scratch, 'torch.json')
+            profiler.export_chrome_trace(torch_path)
+            with open(torch_path, 'rb') as f:
+                document = json.loads(f.read().decode('utf-8', 'replace'))
+
+        pid = os.getpid()
+        document['traceEvents'].extend(python.chrome_events(pid, 'python', epoch_offset_ns))
+        document['traceEvents'].append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': 'python',
+                                        'args': {'name': 'python calls'}})
+        details = {
+            'id': trace.id,
+            'cancer_type': trace.cancer_type,
+            'reason': trace.reason,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime()),
+            'duration_ms': round(duration_ms, 1),
+            'python_events': len(python.events),
+            'python_events_dropped': python.dropped,
+            **trace.metadata
+        }
+        document['otherData'] = details
+
+        path = self.trace_dir / trace.id
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(document, f)
+        os.replace(f'{path}.tmp', path)
+        trace.written = True
+        with self._lock:
+            self.recent[trace.id] = details
+            self._prune()
+
+    def _prune(self):
+        traces = sorted(self.trace_dir.glob('trace-*.json'))
+        for path in traces[:max(0, len(traces) - self.keep)]:
+            path.unlink(missing_ok=True)
+            self.recent.pop(path.name, None)
+
+    def list(self, limit=50):
+        """Newest traces first, including ones written before a restart"""
+        entries = []
+        for path in sorted(self.trace_dir.glob('trace-*.json'), reverse=True)[:limit]:
+            match = TRACE_NAME.match(path.name)
+            if match is None:
+                continue
+            created_ms, cancer_type, _ = match.groups()
+            entry = self.recent.get(path.name) or {
+                'id': path.name,
+                'cancer_type': cancer_type,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(int(created_ms) / 1000))
+            }
+            entries.append(dict(entry, size_bytes=path.stat().st_size))
+        return entries
+
+    def path(self, trace_id):
+        """File of a listed trace, or None (ids are validated, so no path escapes the directory)"""
+        if TRACE_NAME.match(trace_id or '') is None:
+            return None
+        path = self.trace_dir / trace_id
+        return path if path.exists() else None
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'admin_header': self.admin_token is not None,
+            'trace_dir': str(self.trace_dir)
+        }
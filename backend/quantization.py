@@ -0,0 +1,117 @@
+"""
+INT8 Quantization
+Post-training quantization of a loaded FP32 model for CPU serving: the conv
+stacks are statically quantized with activation ranges observed on calibration
+images, and Linear layers (with the ReLU after them) use dynamic INT8.
+
+calibrate_quantization.py writes, next to the converted checkpoints:
+  <cancer_type>.int8.pt     TorchScript INT8 model (loads without unpickling classes)
+  <cancer_type>.int8.json   report: top-1 agreement with FP32, image counts,
+                            quantization engine, fingerprint of the FP32 source
+
+The server only activates a quantized model that was built from the FP32
+checkpoint it loaded and whose agreement meets its configured minimum.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+from model_optimization import fold_batch_norm
+
+QUANTIZED_FORMAT = 1
+
+
+def quantized_paths(checkpoint_dir, cancer_type):
+    checkpoint_dir = Path(checkpoint_dir)
+    return checkpoint_dir / f'{cancer_type}.int8.pt', checkpoint_dir / f'{cancer_type}.int8.json'
+
+
+def qconfig_mapping(model, engine):
+    """Static INT8 everywhere, except dynamic INT8 for each Linear and the ReLU fused into it"""
+    from torch.ao.quantization import default_dynamic_qconfig, get_default_qconfig_mapping
+
+    mapping = get_default_qconfig_mapping(engine)
+    for prefix, module in model.named_modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        children = list(module.named_children())
+        for (name, child), (next_name, next_child) in zip(children, children[1:] + [(None, None)]):
+            if isinstance(child, nn.Linear):
+                mapping.set_module_name(f'{prefix}.{name}', default_dynamic_qconfig)
+                if isinstance(next_child, nn.ReLU):
+                    mapping.set_module_name(f'{prefix}.{next_name}', default_dynamic_qconfig)
+    return mapping
+
+
+def quantize_model(model, calibration_batches, engine=None):
+    """
+    FP32 eval-mode model + iterable of (N, 3, H, W) float batches -> INT8
+    TorchScript module. BatchNorm is folded first so Conv/Linear+ReLU fuse.
+    """
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = engine or torch.backends.quantized.engine
+    torch.backends.quantized.engine = engine
+    folded, _ = fold_batch_norm(model.eval().cpu())
+    batches = list(calibration_batches)
+
+    prepared = prepare_fx(folded, qconfig_mapping(folded, engine), example_inputs=(batches[0],))
+    with torch.inference_mode():
+        for batch in batches:
+            prepared(batch)
+    quantized = convert_fx(prepared)
+    with torch.inference_mode():
+        return torch.jit.freeze(torch.jit.trace(quantized, batches[0]).eval())
+
+
+def top1_agreement(reference, candidate, batches):
+    """Fraction of images on which both models predict the same class"""
+    agree = total = 0
+    with torch.inference_mode():
+        for batch in batches:
+            agree += (reference(batch).argmax(dim=1) == candidate(batch).argmax(dim=1)).sum().item()
+            total += len(batch)
+    return agree / total if total else 0.0
+
+
+def save_quantized(checkpoint_dir, cancer_type, scripted, report):
+    model_path, report_path = quantized_paths(checkpoint_dir, cancer_type)
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.jit.save(scripted, f'{model_path}.tmp')
+    os.replace(f'{model_path}.tmp', model_path)
+    with open(report_path, 'w') as f:
+        json.dump(dict(report, format=QUANTIZED_FORMAT), f, indent=2)
+    return model_path
+
+
+def load_quantized(checkpoint_dir, cancer_type, model_info, min_agreement, device):
+    """
+    -> (INT8 model, report) if the quantized model may replace model_info['model'],
+    else (None, report) with the reason under 'status'.
+    """
+    model_path, report_path = quantized_paths(checkpoint_dir, cancer_type)
+    if not (model_path.exists() and report_path.exists()):
+        return None, {'status': f'no quantized model in {model_path.parent}; run calibrate_quantization.py'}
+    with open(report_path) as f:
+        report = json.load(f)
+
+    if report.get('format') != QUANTIZED_FORMAT:
+        status = f"unsupported quantized model format {report.get('format')!r}"
+    elif device.type != 'cpu':
+        status = f'INT8 models run on the CPU; serving on {device}'
+    elif report.get('source_fingerprint') != model_info.get('fingerprint'):
+        status = 'calibrated against a different FP32 checkpoint; recalibrate'
+    elif report.get('engine') not in torch.backends.quantized.supported_engines:
+        status = f"quantization engine {report.get('engine')!r} is not available"
+    elif report.get('agreement', 0) < min_agreement:
+        status = f"top-1 agreement {report.get('agreement', 0):.2%} is below the required {min_agreement:.2%}"
+    else:
+        torch.backends.quantized.engine = report['engine']
+        model = torch.jit.load(str(model_path), map_location='cpu').eval()
+        # Weights are packed into the TorchScript graph, so the file size stands in for their memory
+        return model, dict(report, status='active', model_bytes=model_path.stat().st_size)
+    return None, dict(report, status=status)
@@ -0,0 +1,62 @@
+"""
+Reduced-Precision Inference
+bfloat16 autocast for models that tolerate it. Conv and Linear layers run in
+bfloat16, which halves the weight and activation traffic per forward pass;
+logits are returned in float32.
+
+Before a model is switched over, its top-1 predictions under autocast are
+compared with FP32 on a calibration set: sample images from a directory when
+one is configured, otherwise a fixed random batch. The model stays at FP32 when
+the hardware has no native bfloat16 support or the agreement is too low.
+"""
+
+import io
+from pathlib import Path
+
+import torch
+
+from decoding import allowed_file
+from quantization import top1_agreement
+
+
+def bf16_supported(device):
+    """Native bfloat16 compute (AVX512-BF16/AMX on CPUs); emulated bfloat16 is slower than FP32"""
+    if device.type == 'cuda':
+        return torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def calibration_batches(plan, calibration_dir=None, limit=32, batch_size=8):
+    """-> (list of normalized (N, 3, H, W) batches on plan.device, description of the source)"""
+    paths = []
+    if calibration_dir and Path(calibration_dir).is_dir():
+        paths = sorted(p for p in Path(calibration_dir).iterdir() if allowed_file(p.name))[:limit]
+    if not paths:
+        generator = torch.Generator().manual_seed(0)
+        batch = torch.randn(batch_size, 3, plan.input_size, plan.input_size, generator=generator)
+        return [batch.to(plan.device)], f'{batch_size} random inputs'
+
+    images = [plan.preprocess(io.BytesIO(path.read_bytes())) for path in paths]
+    batches = [plan.collate(images[i:i + batch_size]).to(plan.device) for i in range(0, len(images), batch_size)]
+    return batches, f'{len(images)} images from {calibration_dir}'
+
+
+def check_bf16(plan, calibration_dir, min_agreement):
+    """Decide whether plan.model may run under bfloat16 autocast -> report with 'status'"""
+    if not bf16_supported(plan.device):
+        return {'status': f'no native bfloat16 support on {plan.device}'}
+
+    batches, source = calibration_batches(plan, calibration_dir)
+
+    def autocast_model(batch):
+        with torch.autocast(plan.device.type, dtype=torch.bfloat16):
+            return plan.model(batch).float()
+
+    agreement = top1_agreement(plan.model, autocast_model, batches)
+    report = {'agreement': agreement, 'calibration': source}
+    if agreement < min_agreement:
+        return dict(report, status=f'top-1 agreement {agreement:.2%} is below the required {min_agreement:.2%}')
+    return dict(report, status='active')
@@ -0,0 +1,332 @@
+"""
+API Routes
+Blueprint with the prediction, batch, model and health endpoints. Importing it
+pulls in the inference runtime, so create_app() only does so when building an app.
+"""
+
+import time
+
+import torch
+from flask import Blueprint, Response, jsonify, request, send_file, stream_with_context
+
+from admission import Overloaded
+from brain_preprocessing import BRAIN_TIERS
+from decoding import ImageTooLarge
+from inference import (
+    ADMISSION, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, INFERENCE_BACKEND, METRICS, MODELS, NEAR_DUPLICATE_INDEX,
+    PREDICTION_CACHE, PREPROCESS_POOL, REQUEST_DEADLINE_MS, TRACER, allowed_file, device,
+    invalid_cancer_type_message, record_request, run_prediction, stream_batch
+)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from reduced_precision import bf16_supported
+
+api = Blueprint('api', __name__)
+
+# A client may bound how long it waits for a prediction, in milliseconds from
+# the start of the request, with this header or a 'deadline_ms' form field
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Carrying PROFILE_ADMIN_TOKEN here traces the prediction (see profiling.py)
+# and unlocks /api/traces
+PROFILE_HEADER = 'X-Profile-Token'
+
+
+class ApiError(Exception):
+    """A client-facing error: {'error': message} with an HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# ============================================
+# RESPONSE PAYLOADS
+# Shared by the Flask routes below and the ASGI app (asgi.py)
+# ============================================
+
+def health_payload():
+    models = MODELS.stats()
+    return {
+        'status': 'healthy',
+        'models_loaded': list(MODELS.keys()),
+        'models': models,
+        'device': str(device),
+        'backend': INFERENCE_BACKEND,
+        'batching': {
+            'max_batch_size': BATCH_MAX_SIZE,
+            'max_wait_ms': BATCH_MAX_WAIT_MS
+        },
+        'preprocessing': dict(PREPROCESS_POOL.stats(), torch_threads=torch.get_num_threads()),
+        'precision': {
+            'bf16_supported': bf16_supported(device),
+            'requested': {'bf16': sorted(MODELS.bf16), 'int8': sorted(MODELS.quantized)},
+            'serving': {key: entry['precision'] for key, entry in models['models'].items() if 'precision' in entry}
+        },
+        'admission': ADMISSION.stats(),
+        'profiling': TRACER.stats(),
+        'cache': PREDICTION_CACHE.stats(),
+        'near_duplicates': NEAR_DUPLICATE_INDEX.stats()
+    }
+
+
+def validate_prediction(filename, cancer_type, tier=None):
+    """Check the predict form fields -> (cancer_type, resolved tier); raises ApiError"""
+    if not filename:
+        raise ApiError('No file selected')
+    if not allowed_file(filename):
+        raise ApiError('Invalid file type. Allowed: png, jpg, jpeg, bmp, tiff')
+    cancer_type = (cancer_type or '').lower()
+    if cancer_type not in MODELS.specs:
+        raise ApiError(invalid_cancer_type_message())
+    try:
+        return cancer_type, MODELS.resolve_tier(cancer_type, tier or None)
+    except ValueError as e:
+        raise ApiError(str(e))
+
+
+def request_deadline(value, started):
+    """Monotonic deadline from a deadline_ms value (None: server default), or None for no deadline"""
+    if value in (None, ''):
+        deadline_ms = REQUEST_DEADLINE_MS
+    else:
+        try:
+            deadline_ms = float(value)
+        except ValueError:
+            deadline_ms = -1
+        if not deadline_ms > 0:
+            raise ApiError('Invalid deadline_ms. Must be a positive number of milliseconds')
+    return started + deadline_ms / 1000 if deadline_ms > 0 else None
+
+
+def overloaded_payload(e):
+    """-> (response, 503, Retry-After value)"""
+    return {'error': e.message, 'retry_after': e.retry_after}, 503, str(e.retry_after)
+
+
+def prediction_payload(cancer_type, stream, tier=None, profile_token=None):
+    """Run one validated prediction -> (response, HTTP status)"""
+    reason = TRACER.wanted(profile_token)
+    trace = None
+    try:
+        if reason is None:
+            result, cache_status = run_prediction(cancer_type, stream, tier)
+        else:
+            with TRACER.trace(cancer_type, reason) as trace:
+                result, cache_status = run_prediction(cancer_type, stream, tier)
+    except ImageTooLarge as e:
+        return {'error': str(e)}, 413
+    
+    if 'error' in result:
+        return result, 500
+    
+    response = {
+        'success': True,
+        'result': result,
+        'cache': cache_status
+    }
+    if tier:
+        response['preprocessing_tier'] = tier
+    if reason == 'admin' and trace is not None and trace.written:
+        response['trace'] = trace.id
+    return response, 200
+
+
+def require_profile_admin(token):
+    """Traces describe the server's internals, so listing them takes the admin token"""
+    if TRACER.admin_token is None:
+        raise ApiError('Trace access is disabled. Set PROFILE_ADMIN_TOKEN to enable it', 403)
+    if not TRACER.is_admin(token):
+        raise ApiError(f'Missing or invalid {PROFILE_HEADER} header', 403)
+
+
+def traces_payload(token, limit=None):
+    require_profile_admin(token)
+    try:
+        limit = int(limit) if limit not in (None, '') else 50
+    except ValueError:
+        raise ApiError('Invalid limit. Must be an integer')
+    return {'profiling': TRACER.stats(), 'traces': TRACER.list(max(1, limit))}
+
+
+def trace_path(token, trace_id):
+    """File behind a trace id from traces_payload(); raises ApiError"""
+    require_profile_admin(token)
+    path = TRACER.path(trace_id)
+    if path is None:
+        raise ApiError(f'Trace {trace_id} not found', 404)
+    return path
+
+
+def models_payload():
+    models_info = {}
+    for key in MODELS.registered():
+        # Resident or previously loaded models; never-loaded ones are not loaded just to describe them
+        value = MODELS.get(key) or MODELS.metadata.get(key)
+        if value is None:
+            models_info[key] = {'state': MODELS.states[key]}
+            continue
+        models_info[key] = {
+            'classes': value['classes'],
+            'num_classes': len(value['classes']),
+            'input_size': value['input_size'],
+            'version': value.get('version', 'unknown'),
+            'test_accuracy': value.get('test_accuracy', 'N/A'),
+            'backend': value.get('backend', 'torch'),
+            'precision': value.get('precision', 'fp32'),
+            'state': MODELS.states[key]
+        }
+        for detail in ('optimization', 'quantization', 'bf16'):
+            if detail in value:
+                models_info[key][detail] = value[detail]
+    return models_info
+
+
+def brain_info_payload():
+    brain_info = MODELS.info('brain')
+    if brain_info is None:
+        raise ApiError('Brain model not loaded', 404)
+    
+    return {
+        'version': brain_info.get('version', 'unknown'),
+        'classes': brain_info['classes'],
+        'num_classes': len(brain_info['classes']),
+        'input_size': brain_info['input_size'],
+        'test_accuracy': brain_info.get('test_accuracy', 'N/A'),
+        'normalization': {
+            'mean': brain_info['mean'],
+            'std': brain_info['std']
+        },
+        'architecture': 'ImprovedBrainTumorCNN' if brain_info.get('version') == 'v2_improved' else 'BrainTumorCNN (Legacy)',
+        'preprocessing': ['Bias correction', 'CLAHE', 'Gamma adjustment', 'Denoising', 'Brain masking'],
+        'preprocessing_tier': MODELS.specs['brain']['default_tier'],
+        'preprocessing_tiers': BRAIN_TIERS
+    }
+
+
+# ============================================
+# FLASK ROUTES
+# ============================================
+
+@api.errorhandler(ApiError)
+def api_error(e):
+    return jsonify({'error': e.message}), e.status
+
+
+@api.errorhandler(Overloaded)
+def overloaded(e):
+    response, status, retry_after = overloaded_payload(e)
+    return jsonify(response), status, {'Retry-After': retry_after}
+
+
+@api.route('/api/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify(health_payload())
+
+
+@api.route('/api/predict', methods=['POST'])
+def predict():
+    """
+    Unified prediction endpoint
+    Expects: file (image) and cancer_type (brain/lung/skin)
+    Optional: preprocessing_tier (brain only: reference/fast/fastest/roi),
+              deadline_ms (or the X-Request-Deadline-Ms header),
+              X-Profile-Token header to record a profiler trace
+    """
+    started = time.monotonic()
+    try:
+        # Check if file is present (this reads and parses the upload)
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+        uploaded = time.monotonic()
+        
+        file = request.files['file']
+        cancer_type, tier = validate_prediction(
+            file.filename, request.form.get('cancer_type'), request.form.get('preprocessing_tier')
+        )
+        deadline = request_deadline(request.headers.get(DEADLINE_HEADER) or request.form.get('deadline_ms'), started)
+        
+        # Decode straight from the buffered upload, releasing it on every path
+        try:
+            with ADMISSION.slot(cancer_type, deadline):
+                response, status = prediction_payload(
+                    cancer_type, file.stream, tier, request.headers.get(PROFILE_HEADER)
+                )
+        finally:
+            file.close()
+        serialize_start = time.monotonic()
+        body = jsonify(response)
+        finished = time.monotonic()
+        record_request(cancer_type, status, finished - started, {
+            'upload': uploaded - started, 'serialize': finished - serialize_start
+        })
+        return body, status
+    
+    except (ApiError, Overloaded):
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: stage latencies, batch sizes, queue depths, cache hit ratio, RSS"""
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@api.route('/api/traces', methods=['GET'])
+def list_traces():
+    """Recent per-request profiler traces, newest first (needs the X-Profile-Token header)"""
+    return jsonify(traces_payload(request.headers.get(PROFILE_HEADER), request.args.get('limit')))
+
+
+@api.route('/api/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """Download one trace as Chrome-trace JSON, to open in ui.perfetto.dev"""
+    path = trace_path(request.headers.get(PROFILE_HEADER), trace_id)
+    return send_file(path, mimetype='application/json', as_attachment=True, download_name=trace_id)
+
+
+@api.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Streaming batch prediction endpoint
+    Expects: files (images) and cancer_type, given once for all files or once per file
+    Optional: preprocessing_tier, applied to every brain image;
+              deadline_ms (or the X-Request-Deadline-Ms header) for the whole batch
+    Returns: NDJSON, one line per image in completion order (see 'index');
+             images shed by admission control get status 503 and retry_after
+    """
+    started = time.monotonic()
+    files = request.files.getlist('files') or request.files.getlist('file')
+    files = [f for f in files if f.filename]
+    
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    cancer_types = [t.lower() for t in request.form.getlist('cancer_type')]
+    
+    if len(cancer_types) == 1:
+        cancer_types = cancer_types * len(files)
+    elif len(cancer_types) != len(files):
+        return jsonify({'error': 'Provide one cancer_type for all files or one per file'}), 400
+    
+    # Without a client deadline, the server default applies to each image rather than the whole batch
+    deadline_value = request.headers.get(DEADLINE_HEADER) or request.form.get('deadline_ms')
+    deadline = request_deadline(deadline_value, started) if deadline_value else None
+    tier = request.form.get('preprocessing_tier') or None
+    items = [(i, f, t, tier) for i, (f, t) in enumerate(zip(files, cancer_types))]
+    return Response(stream_with_context(stream_batch(items, deadline)), mimetype='application/x-ndjson')
+
+
+@api.route('/api/models', methods=['GET'])
+def get_models():
+    """Get information about available models"""
+    return jsonify(models_payload())
+
+
+@api.route('/api/models/brain/info', methods=['GET'])
+def get_brain_model_info():
+    """Get detailed information about the brain tumor model"""
+    return jsonify(brain_info_payload())
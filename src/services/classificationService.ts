@@ -118,6 +118,72 @@ export const classifyImage = async (
   }
 };
 
+export interface BatchClassificationResult {
+  index: number;
+  filename: string;
+  cancer_type: string;
+  success: boolean;
+  result?: ClassificationResult;
+  error?: string;
+  status?: number; // 503 when the item was shed by admission control
+  retry_after?: number; // seconds to wait before retrying a shed item
+  cache?: string;
+  preprocessing_tier?: string;
+}
+
+/**
+ * Classify many images in a single upload
+ * Results are streamed back as NDJSON, one line per image, in completion order
+ * @param files - Image files to classify
+ * @param cancerType - One cancer type for all files, or one per file
+ * @param onResult - Called as soon as each image is classified
+ * @returns All results, ordered by their index in `files`
+ */
+export const classifyImagesBatch = async (
+  files: File[],
+  cancerType: CancerType | CancerType[],
+  onResult?: (result: BatchClassificationResult) => void
+): Promise<BatchClassificationResult[]> => {
+  const formData = new FormData();
+  files.forEach(file => formData.append('files', file));
+  const cancerTypes = Array.isArray(cancerType) ? cancerType : [cancerType];
+  cancerTypes.forEach(type => formData.append('cancer_type', type));
+
+  const response = await fetch(`${API_BASE_URL}/predict/batch`, {
+    method: 'POST',
+    body: formData,
+  });
+
+  if (!response.ok || !response.body) {
+    const data = await response.json().catch(() => ({}));
+    throw new Error(data.error || 'Batch classification failed');
+  }
+
+  const results: BatchClassificationResult[] = [];
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  const handleLine = (line: string) => {
+    if (!line.trim()) return;
+    const result: BatchClassificationResult = JSON.parse(line);
+    results.push(result);
+    onResult?.(result);
+  };
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() ?? '';
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer + decoder.decode());
+
+  return results.sort((a, b) => a.index - b.index);
+};
+
 /**
  * Save classification result to Firestore
  * This can be called after getting a classification result